@@ -14,6 +14,7 @@ import os
 from datetime import timedelta
 from pathlib import Path
 
+from django.core.exceptions import ImproperlyConfigured
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -41,6 +42,7 @@ INSTALLED_APPS = [
     "django.contrib.sessions",
     "django.contrib.messages",
     "django.contrib.staticfiles",
+    "django.contrib.postgres",
     "rest_framework",
     "django_filters",
     "rest_framework_simplejwt",
@@ -51,6 +53,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "lms.instrumentation.RequestMetricsMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
@@ -58,6 +61,8 @@ MIDDLEWARE = [
     "django.contrib.auth.middleware.AuthenticationMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
+    "lms.profiling.ProfilingMiddleware",
+    "lms.db_router.PrimaryPinMiddleware",
 ]
 
 ROOT_URLCONF = "config.urls"
@@ -91,6 +96,79 @@ DATABASES = {
     }
 }
 
+# Реплики для чтения: хосты через запятую, остальные параметры как у default.
+# В тестах реплика совпадает с основной БД
+DATABASE_REPLICAS = []
+for index, host in enumerate(
+    filter(None, os.getenv("POSTGRES_REPLICA_HOSTS", "").split(","))
+):
+    alias = f"replica_{index}"
+    DATABASES[alias] = {
+        **DATABASES["default"],
+        "HOST": host.strip(),
+        "TEST": {"MIRROR": "default"},
+    }
+    DATABASE_REPLICAS.append(alias)
+
+DATABASE_ROUTERS = ["lms.db_router.ReplicaRouter"]
+
+# Сколько секунд после изменения данных пользователь читает из основной БД
+REPLICA_PIN_TIMEOUT = 5
+
+CACHE_LOCATION = os.getenv("CACHE_LOCATION")
+
+if CACHE_LOCATION:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": CACHE_LOCATION,
+        }
+    }
+else:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        }
+    }
+
+# Кэш в памяти процесса не виден веб-воркерам, Celery и командам друг у друга,
+# поэтому данные, которые сбрасываются при изменениях, кэшируются только в Redis
+SHARED_CACHE = bool(CACHE_LOCATION)
+
+# Кэш ответов lms: "lru" - в памяти процесса, "shared" - в кэше CACHES["default"].
+# Ключи ответов зависят от версий данных в CACHES["default"], поэтому без Redis
+# ответы не кэшируются, а "shared" недопустим
+RESPONSE_CACHE_BACKEND = os.getenv("RESPONSE_CACHE_BACKEND") or "lru"
+if RESPONSE_CACHE_BACKEND == "shared" and not SHARED_CACHE:
+    raise ImproperlyConfigured(
+        'RESPONSE_CACHE_BACKEND="shared" требует Redis в CACHE_LOCATION'
+    )
+RESPONSE_CACHE_MAX_ENTRIES = 1000
+RESPONSE_CACHE_TIMEOUT = 5 * 60
+
+# Доля запросов, для которых пишутся метрики времени (0 - выключено, 1 - все)
+REQUEST_METRICS_SAMPLE_RATE = float(os.getenv("REQUEST_METRICS_SAMPLE_RATE") or 0)
+
+# Профилирование запросов: доля случайных запросов, каталог и размер кольца
+PROFILING_SAMPLE_RATE = float(os.getenv("PROFILING_SAMPLE_RATE") or 0)
+PROFILING_DIR = os.getenv("PROFILING_DIR") or str(BASE_DIR / "profiles")
+PROFILING_MAX_FILES = 200
+
+LOGGING = {
+    "version": 1,
+    "disable_existing_loggers": False,
+    "handlers": {
+        "console": {"class": "logging.StreamHandler"},
+    },
+    "loggers": {
+        "lms.instrumentation": {
+            "handlers": ["console"],
+            "level": "INFO",
+            "propagate": False,
+        },
+    },
+}
+
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
 
@@ -139,9 +217,7 @@ AUTH_USER_MODEL = "users.User"
 
 REST_FRAMEWORK = {
     "DEFAULT_FILTER_BACKENDS": ["django_filters.rest_framework.DjangoFilterBackend"],
-    "DEFAULT_AUTHENTICATION_CLASSES": (
-        "rest_framework_simplejwt.authentication.JWTAuthentication",
-    ),
+    "DEFAULT_AUTHENTICATION_CLASSES": ("users.authentication.CachedJWTAuthentication",),
     "DEFAULT_PERMISSION_CLASSES": [
         "rest_framework.permissions.IsAuthenticated",
     ],
@@ -161,6 +237,7 @@ SPECTACULAR_SETTINGS = {
 }
 
 STRIPE_API_KEY = os.getenv("STRIPE_API_KEY")
+STRIPE_WEBHOOK_SECRET = os.getenv("STRIPE_WEBHOOK_SECRET")
 
 CURRENCY_API_URL = os.getenv("CURRENCY_API_URL")
 CURRENCY_API_KEY = os.getenv("CURRENCY_API_KEY")
@@ -179,6 +256,14 @@ CELERY_BEAT_SCHEDULE = {
         "task": "lms.tasks.deactivate_inactive_users",  # Путь к задаче
         "schedule": timedelta(days=1),  # Расписание выполнения задачи
     },
+    "refresh_currency_rates": {
+        "task": "users.tasks.refresh_currency_rates",
+        "schedule": timedelta(hours=1),
+    },
+    "reconcile_daily_revenue": {
+        "task": "users.tasks.reconcile_daily_revenue",
+        "schedule": timedelta(hours=1),
+    },
 }
 
 EMAIL_BACKEND = "django_smtp_ssl.SSLEmailBackend"
@@ -0,0 +1,27 @@
+"""Настройки для запуска тестов: python3 manage.py test использует их по умолчанию."""
+
+from config.settings import *  # noqa: F401, F403
+from config.settings import DATABASES
+
+# Тесты очищают кэш, поэтому Redis из CACHE_LOCATION им не передается
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+    }
+}
+
+# Отдельная БД, на которой тесты проверяют маршрутизацию чтения на реплики
+DATABASES["replica_test"] = {
+    **DATABASES["default"],
+    "TEST": {"NAME": "test_replica"},
+}
+
+# SQLite для проверки запасных вариантов запросов без возможностей PostgreSQL.
+# Таблицы создаются по моделям: миграции используют PostgreSQL
+DATABASES["sqlite_test"] = {
+    "ENGINE": "django.db.backends.sqlite3",
+    "TEST": {"MIGRATE": False},
+}
+
+# Уникальность DailyRevenue с NULL проверяется только в PostgreSQL
+SILENCED_SYSTEM_CHECKS = ["models.W047"]
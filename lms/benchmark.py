@@ -0,0 +1,361 @@
+import json
+import math
+import time
+import tracemalloc
+from collections import namedtuple
+from contextlib import contextmanager
+from decimal import Decimal
+
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import URLPattern, URLResolver, reverse
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from lms import urls as lms_urls
+from lms.models import Course, Lesson
+from lms.response_cache import get_response_cache
+from lms.seeding import DatasetGenerator
+from users import urls as users_urls
+from users.models import Payment, User
+
+DATASET_SIZES = {
+    "small": {
+        "users": 1_000,
+        "courses": 100,
+        "lessons": 1_000,
+        "subscriptions": 1_000,
+        "payments": 1_000,
+    },
+    "medium": {
+        "users": 100_000,
+        "courses": 10_000,
+        "lessons": 100_000,
+        "subscriptions": 100_000,
+        "payments": 100_000,
+    },
+    "large": {
+        "users": 1_000_000,
+        "courses": 100_000,
+        "lessons": 1_000_000,
+        "subscriptions": 1_000_000,
+        "payments": 1_000_000,
+    },
+}
+
+BENCHMARK_EMAIL = "benchmark@example.com"
+BENCHMARK_PASSWORD = "benchmark-password"
+BENCHMARK_SESSION_ID = "cs_benchmark"
+
+# Маршруты, которые нельзя вызвать без внешних сервисов
+SKIPPED_ROUTES = {
+    "lms:courses-update-notify": "ставит задачу в очередь Celery",
+    "lms:courses-update-notify-status": "читает результат задачи из бэкенда Celery",
+    "users:stripe_webhook": "требует подписи события секретом stripe",
+}
+
+# Кэш замеров: рабочий кэш нельзя очищать, а ключи пользователей тестовой
+# БД совпали бы с ключами рабочих пользователей
+BENCHMARK_CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        "LOCATION": "benchmark",
+    }
+}
+
+TRANSACTION_STATEMENTS = ("BEGIN", "COMMIT", "ROLLBACK", "SAVEPOINT", "RELEASE")
+
+BenchmarkRequest = namedtuple(
+    "BenchmarkRequest", ("name", "route", "method", "url", "data", "authenticated")
+)
+
+
+def seed_dataset(sizes, seed=0):
+    """Заполняет БД данными заданного объема и возвращает данные для запросов.
+
+    Пользователь бенчмарка владеет самым популярным курсом, поэтому замеры
+    эндпоинтов курса приходятся на его горячую точку.
+    """
+    generator = DatasetGenerator(seed=seed, password=BENCHMARK_PASSWORD)
+    generator.generate(**sizes)
+
+    # Сотрудник, чтобы замерять и выгрузку платежей, доступную только персоналу
+    user = User(email=BENCHMARK_EMAIL, is_active=True, is_staff=True)
+    user.set_password(BENCHMARK_PASSWORD)
+    user.save()
+    course = Course.objects.get(pk=generator.course_ids[0])
+    course.owner = user
+    course.save(update_fields=["owner"])
+    lesson = Lesson.objects.create(
+        name="Урок бенчмарка",
+        description="Урок пользователя бенчмарка",
+        course=course,
+        owner=user,
+        link="https://youtube.com/watch?v=benchmark",
+    )
+    payment = Payment.objects.create(
+        user=user,
+        course=course,
+        amount=Decimal(1000),
+        payment_type="stripe",
+        session_id=BENCHMARK_SESSION_ID,
+        # Незавершенные платежи сверяются со stripe, а бенчмарк к нему не ходит
+        status=Payment.STATUS_EXPIRED,
+    )
+
+    return {
+        "user": user,
+        "other_user_id": generator.user_ids[-1],
+        "course_id": course.id,
+        "lesson_id": lesson.id,
+        "payment_id": payment.id,
+    }
+
+
+def get_benchmark_requests(context):
+    """Описывает по одному запросу на каждый маршрут lms и users."""
+    user = context["user"]
+    course = {"pk": context["course_id"]}
+    lesson = {"pk": context["lesson_id"]}
+    lesson_data = {
+        "name": "Новый урок",
+        "description": "Урок из бенчмарка",
+        "course": context["course_id"],
+        "link": "https://youtube.com/watch?v=benchmark",
+    }
+    course_data = {"name": "Новый курс", "description": "Курс из бенчмарка"}
+
+    def request(name, route, method="GET", kwargs=None, data=None, query=""):
+        url = reverse(route, kwargs=kwargs) + query
+        return BenchmarkRequest(name, route, method, url, data, True)
+
+    return [
+        request("api_root", "lms:api-root"),
+        request("course_list", "lms:courses-list"),
+        request("course_list_cursor", "lms:courses-list", query="?pagination=cursor"),
+        request("course_create", "lms:courses-list", "POST", data=course_data),
+        request("course_detail", "lms:courses-detail", kwargs=course),
+        request(
+            "course_update",
+            "lms:courses-detail",
+            "PATCH",
+            kwargs=course,
+            data={"name": "Курс изменен"},
+        ),
+        request("course_delete", "lms:courses-detail", "DELETE", kwargs=course),
+        request("lesson_list", "lms:lesson-list"),
+        request("lesson_list_cursor", "lms:lesson-list", query="?pagination=cursor"),
+        request("lesson_detail", "lms:lesson-get", kwargs=lesson),
+        request("lesson_create", "lms:lesson-create", "POST", data=lesson_data),
+        request(
+            "lesson_bulk_create",
+            "lms:lesson-bulk-create",
+            "POST",
+            data=[lesson_data] * 100,
+        ),
+        request(
+            "lesson_update",
+            "lms:lesson-update",
+            "PATCH",
+            kwargs=lesson,
+            data={"name": "Урок изменен"},
+        ),
+        request("lesson_delete", "lms:lesson-delete", "DELETE", kwargs=lesson),
+        request("search", "lms:search", query="?q=урок"),
+        request(
+            "subscription_toggle",
+            "lms:subscriptions",
+            "POST",
+            data={"course_id": context["course_id"]},
+        ),
+        request(
+            "subscription_bulk",
+            "lms:subscriptions-bulk",
+            "POST",
+            data={"action": "subscribe", "course_ids": [context["course_id"]]},
+        ),
+        BenchmarkRequest(
+            "register",
+            "users:register",
+            "POST",
+            reverse("users:register"),
+            {"email": "new-user@example.com", "password": BENCHMARK_PASSWORD},
+            False,
+        ),
+        BenchmarkRequest(
+            "login",
+            "users:login",
+            "POST",
+            reverse("users:login"),
+            {"email": BENCHMARK_EMAIL, "password": BENCHMARK_PASSWORD},
+            False,
+        ),
+        BenchmarkRequest(
+            "token_refresh",
+            "users:token_refresh",
+            "POST",
+            reverse("users:token_refresh"),
+            {"refresh": str(RefreshToken.for_user(user))},
+            False,
+        ),
+        request("user_list", "users:user-list"),
+        request("user_detail", "users:user-get", kwargs={"pk": user.pk}),
+        request(
+            "user_detail_other",
+            "users:user-get",
+            kwargs={"pk": context["other_user_id"]},
+        ),
+        request(
+            "user_update",
+            "users:user-update",
+            "PATCH",
+            kwargs={"pk": user.pk},
+            data={"city": "Москва"},
+        ),
+        request("user_delete", "users:user-delete", "DELETE", kwargs={"pk": user.pk}),
+        request("payment_list", "users:payments-list"),
+        request(
+            "payment_list_cursor", "users:payments-list", query="?pagination=cursor"
+        ),
+        request("payment_export", "users:payments-export"),
+        request("payment_revenue", "users:payments-revenue"),
+        request(
+            "payment_create",
+            "users:payments-create",
+            "POST",
+            data={"user": user.pk, "amount": "1000", "payment_type": "stripe"},
+        ),
+        request(
+            "payment_status",
+            "users:payments-status",
+            kwargs={"pk": context["payment_id"]},
+        ),
+        request(
+            "stripe_session",
+            "users:retrieve_stripe_session",
+            kwargs={"session_id": BENCHMARK_SESSION_ID},
+        ),
+    ]
+
+
+def get_route_names():
+    """Возвращает имена всех маршрутов lms и users."""
+    names = set()
+    for namespace, module in (("lms", lms_urls), ("users", users_urls)):
+        for pattern in module.urlpatterns:
+            if isinstance(pattern, URLPattern) and pattern.name:
+                names.add(f"{namespace}:{pattern.name}")
+            elif isinstance(pattern, URLResolver):
+                raise ValueError(f"Вложенные маршруты не поддерживаются: {pattern}")
+    return names
+
+
+def get_uncovered_routes(requests):
+    covered = {request.route for request in requests}
+    return get_route_names() - covered - SKIPPED_ROUTES.keys()
+
+
+def send(client, request, headers):
+    """Отправляет запрос и откатывает сделанные им изменения в БД."""
+    with transaction.atomic():
+        response = client.generic(
+            request.method,
+            request.url,
+            data=json.dumps(request.data) if request.data is not None else "",
+            content_type="application/json",
+            headers=headers if request.authenticated else {},
+        )
+        if response.streaming:
+            b"".join(response.streaming_content)
+        transaction.set_rollback(True)
+    return response
+
+
+def count_queries(queries):
+    """Считает запросы без управления транзакциями, включая откат из send()."""
+    return sum(
+        1
+        for query in queries.captured_queries
+        if not query["sql"].startswith(TRANSACTION_STATEMENTS)
+    )
+
+
+def percentile(values, percent):
+    """Процентиль методом ближайшего ранга."""
+    ordered = sorted(values)
+    return ordered[max(math.ceil(percent / 100 * len(ordered)) - 1, 0)]
+
+
+@contextmanager
+def isolated_caches():
+    """Подменяет CACHES["default"] на кэш в памяти процесса на время замеров."""
+    with override_settings(CACHES=BENCHMARK_CACHES):
+        # Общий кэш ответов держит ссылку на кэш, созданный до подмены
+        get_response_cache.cache_clear()
+        try:
+            yield
+        finally:
+            get_response_cache.cache_clear()
+
+
+def run_benchmarks(requests, user, repeat=20, cold=False):
+    """Замеряет задержку, число запросов к БД и пик памяти для каждого запроса.
+
+    Задержка замеряется отдельно от запросов к БД и памяти, потому что
+    tracemalloc и запись SQL сами замедляют обработку запроса.
+    """
+    client = Client()
+    headers = {"Authorization": f"Bearer {RefreshToken.for_user(user).access_token}"}
+    results = {}
+    for request in requests:
+        # Первый запрос прогревает кэши и не учитывается
+        send(client, request, headers)
+
+        timings = []
+        for _ in range(repeat):
+            if cold:
+                cache.clear()
+                get_response_cache().clear()
+            started_at = time.perf_counter()
+            response = send(client, request, headers)
+            timings.append((time.perf_counter() - started_at) * 1000)
+
+        tracemalloc.start()
+        try:
+            with CaptureQueriesContext(connection) as queries:
+                send(client, request, headers)
+            peak_memory = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+
+        results[request.name] = {
+            "route": request.route,
+            "method": request.method,
+            "url": request.url,
+            "status": response.status_code,
+            "p50_ms": round(percentile(timings, 50), 3),
+            "p95_ms": round(percentile(timings, 95), 3),
+            "queries": count_queries(queries),
+            "peak_memory_kb": round(peak_memory / 1024, 1),
+        }
+    return results
+
+
+def compare_with_baseline(results, baseline, max_regression):
+    """Возвращает описания эндпоинтов, которые стали заметно медленнее базовых.
+
+    Рост числа запросов к БД считается регрессией при любой величине.
+    """
+    regressions = []
+    for name, result in results.items():
+        base = baseline.get(name)
+        if base is None:
+            continue
+        if result["p95_ms"] > base["p95_ms"] * (1 + max_regression):
+            regressions.append(f"{name}: p95 {base['p95_ms']} -> {result['p95_ms']} мс")
+        if result["queries"] > base["queries"]:
+            regressions.append(
+                f"{name}: запросов к БД {base['queries']} -> {result['queries']}"
+            )
+    return regressions
@@ -0,0 +1,118 @@
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+from rest_framework.permissions import SAFE_METHODS
+
+from config.settings import DATABASE_REPLICAS, REPLICA_PIN_TIMEOUT
+
+# Признак того, что текущий запрос может читать с реплик
+_read_from_replicas = ContextVar("read_from_replicas", default=False)
+# Признак того, что реплики отключены, например на время бенчмарка
+_replicas_disabled = ContextVar("replicas_disabled", default=False)
+
+
+def reading_from_replicas():
+    """Проверяет, что чтение текущего запроса может идти с реплики."""
+    return (
+        bool(DATABASE_REPLICAS)
+        and _read_from_replicas.get()
+        and not _replicas_disabled.get()
+    )
+
+
+@contextmanager
+def primary_only():
+    """Выполняет все чтение внутри блока в основной БД."""
+    token = _replicas_disabled.set(True)
+    try:
+        yield
+    finally:
+        _replicas_disabled.reset(token)
+
+
+def get_primary_pin_cache_key(user_id):
+    return f"lms:primary_pin:{user_id}"
+
+
+def pin_to_primary(user):
+    """Направляет чтение пользователя на основную БД на REPLICA_PIN_TIMEOUT.
+
+    Реплики отстают от основной БД, и без этого пользователь мог бы
+    не увидеть только что сделанные изменения.
+    """
+    cache.set(get_primary_pin_cache_key(user.pk), True, REPLICA_PIN_TIMEOUT)
+
+
+def is_pinned_to_primary(user):
+    return user.is_authenticated and bool(cache.get(get_primary_pin_cache_key(user.pk)))
+
+
+class ReplicaRouter:
+    """Отправляет чтение на случайную реплику, если его разрешил обработчик.
+
+    Запись и остальное чтение выполняются в основной БД.
+    """
+
+    def db_for_read(self, model, **hints):
+        if reading_from_replicas():
+            return random.choice(DATABASE_REPLICAS)
+        return None
+
+    def db_for_write(self, model, **hints):
+        # Иначе объект, прочитанный с реплики, сохранялся бы в реплику
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # На репликах те же данные, что и в основной БД
+        return True
+
+
+class ReplicaReadMixin:
+    """Разрешает обработчику читать с реплик при безопасных запросах.
+
+    Чтение выполняется с реплик только после аутентификации и проверки
+    прав, и только если пользователь недавно ничего не изменял.
+    """
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        if (
+            DATABASE_REPLICAS
+            and request.method in SAFE_METHODS
+            and not is_pinned_to_primary(request.user)
+        ):
+            self._replica_token = _read_from_replicas.set(True)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        token = getattr(self, "_replica_token", None)
+        if token is not None:
+            _read_from_replicas.reset(token)
+            self._replica_token = None
+        return super().finalize_response(request, response, *args, **kwargs)
+
+
+class PrimaryPinMiddleware:
+    """Закрепляет пользователя за основной БД после успешного изменения данных.
+
+    Отметка хранится в кэше Django, поэтому действует во всех процессах,
+    если CACHES["default"] общий для них.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        if (
+            DATABASE_REPLICAS
+            and request.method not in SAFE_METHODS
+            and response.status_code < 400
+        ):
+            # Пользователя DRF определяет во view и сохраняет в request.user
+            user = getattr(request, "user", None)
+            if user is not None and user.is_authenticated:
+                pin_to_primary(user)
+        return response
@@ -0,0 +1,193 @@
+import json
+import logging
+import random
+import threading
+import time
+from collections import Counter, defaultdict
+from contextlib import ExitStack, contextmanager
+from contextvars import ContextVar
+
+from django.db import connections
+from rest_framework.serializers import BaseSerializer
+
+from config.settings import REQUEST_METRICS_SAMPLE_RATE
+
+logger = logging.getLogger(__name__)
+
+# Метрики запроса, который сейчас обрабатывается, или None вне выборки
+_current_metrics = ContextVar("request_metrics", default=None)
+# Исходное свойство BaseSerializer.data и число замеряемых запросов,
+# на время которых оно подменено
+_serializer_data = BaseSerializer.data
+_instrumented_requests = 0
+_instrumented_lock = threading.Lock()
+
+
+class RequestMetrics:
+    """Время обработки одного запроса по видам работы.
+
+    Время сериализации не включает запросы к БД и внешним сервисам,
+    сделанные во время сериализации, поэтому слагаемые не пересекаются.
+    """
+
+    def __init__(self):
+        self.started_at = time.perf_counter()
+        self.total_time = 0.0
+        self.db_queries = 0
+        self.db_time = 0.0
+        self.serialize_time = 0.0
+        self.serialize_depth = 0
+        self.external_time = defaultdict(float)
+        self.external_calls = Counter()
+
+    def record_query(self, execute, sql, params, many, context):
+        """Обертка выполнения SQL для connection.execute_wrapper()."""
+        started_at = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_time += time.perf_counter() - started_at
+            self.db_queries += 1
+
+    def io_time(self):
+        return self.db_time + sum(self.external_time.values())
+
+    @contextmanager
+    def serializing(self):
+        # Вложенные сериализаторы уже учтены во внешнем
+        self.serialize_depth += 1
+        started_at = time.perf_counter()
+        io_before = self.io_time()
+        try:
+            yield
+        finally:
+            self.serialize_depth -= 1
+            if not self.serialize_depth:
+                elapsed = time.perf_counter() - started_at
+                self.serialize_time += elapsed - (self.io_time() - io_before)
+
+    def finish(self):
+        self.total_time = time.perf_counter() - self.started_at
+
+    def server_timing(self):
+        """Значение заголовка Server-Timing, длительности в миллисекундах."""
+        entries = [
+            f"total;dur={self.total_time * 1000:.1f}",
+            f'db;dur={self.db_time * 1000:.1f};desc="{self.db_queries} queries"',
+            f"serialize;dur={self.serialize_time * 1000:.1f}",
+        ]
+        for service, elapsed in self.external_time.items():
+            entries.append(
+                f"{service};dur={elapsed * 1000:.1f};"
+                f'desc="{self.external_calls[service]} calls"'
+            )
+        return ", ".join(entries)
+
+    def as_dict(self):
+        return {
+            "total_ms": round(self.total_time * 1000, 3),
+            "db_queries": self.db_queries,
+            "db_ms": round(self.db_time * 1000, 3),
+            "serialize_ms": round(self.serialize_time * 1000, 3),
+            "external": {
+                service: {
+                    "calls": self.external_calls[service],
+                    "ms": round(elapsed * 1000, 3),
+                }
+                for service, elapsed in self.external_time.items()
+            },
+        }
+
+
+@contextmanager
+def external_call(service):
+    """Учитывает время обращения к внешнему сервису в метриках запроса."""
+    metrics = _current_metrics.get()
+    if metrics is None:
+        yield
+        return
+    started_at = time.perf_counter()
+    try:
+        yield
+    finally:
+        metrics.external_time[service] += time.perf_counter() - started_at
+        metrics.external_calls[service] += 1
+
+
+def _timed_serializer_data(self):
+    metrics = _current_metrics.get()
+    if metrics is None:
+        return _serializer_data.fget(self)
+    with metrics.serializing():
+        return _serializer_data.fget(self)
+
+
+@contextmanager
+def instrumented_serializers():
+    """Добавляет учет времени в BaseSerializer.data на время блока.
+
+    Serializer.data и ListSerializer.data вызывают BaseSerializer.data,
+    поэтому учитывается сериализация любых сериализаторов DRF. Свойство
+    подменяется, пока идет хотя бы один замеряемый запрос, и восстанавливается
+    после последнего из них, в том числе при исключении.
+    """
+    global _instrumented_requests
+    with _instrumented_lock:
+        if not _instrumented_requests:
+            BaseSerializer.data = property(_timed_serializer_data)
+        _instrumented_requests += 1
+    try:
+        yield
+    finally:
+        with _instrumented_lock:
+            _instrumented_requests -= 1
+            if not _instrumented_requests:
+                BaseSerializer.data = _serializer_data
+
+
+class RequestMetricsMiddleware:
+    """Замеряет запросы к БД, сериализацию и внешние вызовы.
+
+    Замеряется доля REQUEST_METRICS_SAMPLE_RATE запросов: результаты
+    добавляются в заголовки Server-Timing и X-DB-Queries и пишутся в лог
+    одной JSON-строкой. Запросы вне выборки обрабатываются без накладных
+    расходов. Для потоковых ответов учитывается время до первого байта.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if random.random() >= REQUEST_METRICS_SAMPLE_RATE:
+            return self.get_response(request)
+
+        metrics = RequestMetrics()
+        token = _current_metrics.set(metrics)
+        try:
+            with ExitStack() as stack:
+                stack.enter_context(instrumented_serializers())
+                for connection in connections.all():
+                    stack.enter_context(
+                        connection.execute_wrapper(metrics.record_query)
+                    )
+                response = self.get_response(request)
+        finally:
+            _current_metrics.reset(token)
+        metrics.finish()
+
+        response.headers["Server-Timing"] = metrics.server_timing()
+        response.headers["X-DB-Queries"] = str(metrics.db_queries)
+        match = request.resolver_match
+        logger.info(
+            json.dumps(
+                {
+                    "method": request.method,
+                    "path": request.path,
+                    "route": match.view_name if match else None,
+                    "status": response.status_code,
+                    **metrics.as_dict(),
+                },
+                ensure_ascii=False,
+            )
+        )
+        return response
@@ -0,0 +1,118 @@
+import json
+
+from django.core.management import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+from lms.benchmark import (DATASET_SIZES, SKIPPED_ROUTES,
+                           compare_with_baseline, get_benchmark_requests,
+                           get_uncovered_routes, isolated_caches,
+                           run_benchmarks, seed_dataset)
+from lms.db_router import primary_only
+
+
+class Command(BaseCommand):
+    help = (
+        "Заполняет тестовую БД данными заданного объема, вызывает все маршруты "
+        "lms и users и сохраняет p50/p95 задержки, число запросов к БД и пик "
+        "памяти по каждому эндпоинту в JSON."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--size", choices=DATASET_SIZES, default="small")
+        for name in DATASET_SIZES["small"]:
+            parser.add_argument(
+                f"--{name}", type=int, help=f"количество записей {name}"
+            )
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--repeat", type=int, default=20)
+        parser.add_argument(
+            "--cold", action="store_true", help="очищать кэши перед каждым запросом"
+        )
+        parser.add_argument("--only", nargs="+", help="имена эндпоинтов для замера")
+        parser.add_argument("--output", default="benchmark.json")
+        parser.add_argument("--baseline", help="JSON предыдущего запуска")
+        parser.add_argument(
+            "--max-regression",
+            type=float,
+            default=0.2,
+            help="допустимый рост p95 относительно базового запуска (0.2 = 20%%)",
+        )
+        parser.add_argument(
+            "--keepdb",
+            action="store_true",
+            help="не удалять тестовую БД после запуска",
+        )
+
+    def handle(self, *args, **options):
+        if options["repeat"] < 1:
+            raise CommandError("--repeat должен быть положительным")
+        sizes = {
+            name: options[name] if options[name] is not None else size
+            for name, size in DATASET_SIZES[options["size"]].items()
+        }
+
+        # Замеры идут в отдельной тестовой БД и отдельном кэше, рабочие данные
+        # не затрагиваются. Тестовая БД создается только для default, поэтому
+        # реплики отключены
+        old_name = connection.settings_dict["NAME"]
+        setup_test_environment()
+        try:
+            with isolated_caches():
+                connection.creation.create_test_db(verbosity=0, autoclobber=True)
+                try:
+                    with primary_only():
+                        results = self.run(sizes, options)
+                finally:
+                    if not options["keepdb"]:
+                        connection.creation.destroy_test_db(old_name, verbosity=0)
+        finally:
+            teardown_test_environment()
+
+        report = {
+            "dataset": sizes,
+            "seed": options["seed"],
+            "repeat": options["repeat"],
+            "cold": options["cold"],
+            "results": results,
+            "skipped": SKIPPED_ROUTES,
+        }
+        with open(options["output"], "w", encoding="utf-8") as file:
+            json.dump(report, file, ensure_ascii=False, indent=2, sort_keys=True)
+        self.stdout.write(
+            self.style.SUCCESS(f"Результаты сохранены в {options['output']}")
+        )
+
+        if options["baseline"]:
+            with open(options["baseline"], encoding="utf-8") as file:
+                baseline = json.load(file)["results"]
+            regressions = compare_with_baseline(
+                results, baseline, options["max_regression"]
+            )
+            if regressions:
+                raise CommandError("Регрессии:\n" + "\n".join(regressions))
+            self.stdout.write(self.style.SUCCESS("Регрессий нет"))
+
+    def run(self, sizes, options):
+        self.stdout.write(f"Заполнение БД: {sizes}")
+        context = seed_dataset(sizes, options["seed"])
+
+        requests = get_benchmark_requests(context)
+        uncovered = get_uncovered_routes(requests)
+        if uncovered:
+            self.stderr.write(f"Маршруты без замеров: {', '.join(sorted(uncovered))}")
+        if options["only"]:
+            requests = [
+                request for request in requests if request.name in options["only"]
+            ]
+
+        results = run_benchmarks(
+            requests, context["user"], options["repeat"], options["cold"]
+        )
+        for name, result in results.items():
+            self.stdout.write(
+                f"{name:<24} {result['status']} p50={result['p50_ms']:.1f} мс "
+                f"p95={result['p95_ms']:.1f} мс запросов={result['queries']} "
+                f"память={result['peak_memory_kb']:.0f} КБ"
+            )
+        return results
@@ -0,0 +1,248 @@
+import csv
+import json
+import os
+import time
+
+from django.core.management import BaseCommand, CommandError
+from django.db import transaction
+from rest_framework.serializers import ValidationError
+
+from lms.models import Course, Lesson
+from lms.response_cache import bump_version
+from lms.validators import validate_url
+from users.models import User
+
+COURSE = "course"
+LESSON = "lesson"
+
+FORMATS = {".csv": "csv", ".jsonl": "jsonl", ".ndjson": "jsonl"}
+
+
+class RowError(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        "Импортирует курсы и уроки из файла CSV или JSONL. Каждая строка "
+        "содержит поле type (course или lesson), name и description. У урока "
+        "также указываются название курса (course) и ссылка на видео (link), "
+        "у любой строки может быть указан email владельца (owner_email). "
+        "Курс должен встречаться в файле раньше своих уроков или уже быть в базе."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="путь к файлу каталога")
+        parser.add_argument(
+            "--format",
+            choices=sorted(set(FORMATS.values())),
+            help="формат файла, по умолчанию определяется по расширению",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=1000,
+            help="количество строк в одном INSERT (по умолчанию 1000)",
+        )
+
+    def handle(self, *args, **options):
+        path = options["path"]
+        file_format = options["format"] or FORMATS.get(
+            os.path.splitext(path)[1].lower()
+        )
+        if file_format is None:
+            raise CommandError("Не удалось определить формат файла, укажите --format")
+        if options["batch_size"] < 1:
+            raise CommandError("--batch-size должен быть положительным")
+
+        self.batch_size = options["batch_size"]
+        self.verbosity = options["verbosity"]
+        self.name_max_length = Course._meta.get_field("name").max_length
+        self.link_max_length = Lesson._meta.get_field("link").max_length
+        # Кэши поиска: {email: id владельца} и {название: id курса}
+        self.owner_ids = {}
+        self.course_ids = {}
+        self.courses = []
+        self.lessons = []
+        self.imported = {COURSE: 0, LESSON: 0}
+        self.errors = 0
+
+        started_at = time.perf_counter()
+        try:
+            with open(path, encoding="utf-8", newline="") as file:
+                for line_number, row in self.read_rows(file, file_format):
+                    self.add_row(line_number, row)
+                self.flush_lessons()
+        finally:
+            # bulk_create не отправляет post_save, поэтому кэш сбрасывается явно
+            bump_version("course")
+            bump_version("lesson")
+        elapsed = time.perf_counter() - started_at
+
+        total = self.imported[COURSE] + self.imported[LESSON]
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Импортировано курсов: {self.imported[COURSE]}, "
+                f"уроков: {self.imported[LESSON]}, пропущено строк: {self.errors} "
+                f"за {elapsed:.1f} с ({total / max(elapsed, 1e-9):.0f} строк/с)"
+            )
+        )
+
+    def read_rows(self, file, file_format):
+        """Читает файл построчно, не загружая его в память целиком."""
+        if file_format == "csv":
+            # Первая строка CSV - заголовок
+            for line_number, row in enumerate(csv.DictReader(file), start=2):
+                yield line_number, row
+            return
+
+        for line_number, line in enumerate(file, start=1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except json.JSONDecodeError as error:
+                self.report_error(line_number, f"некорректный JSON: {error}")
+                continue
+            if not isinstance(row, dict):
+                self.report_error(line_number, "ожидается JSON-объект")
+                continue
+            yield line_number, row
+
+    def add_row(self, line_number, row):
+        try:
+            row_type = row.get("type")
+            if row_type == COURSE:
+                self.courses.append((line_number, self.clean_course(row)))
+                if len(self.courses) >= self.batch_size:
+                    self.flush_courses()
+            elif row_type == LESSON:
+                self.lessons.append((line_number, self.clean_lesson(row)))
+                if len(self.lessons) >= self.batch_size:
+                    self.flush_lessons()
+            else:
+                raise RowError(f"неизвестный тип строки: {row_type!r}")
+        except RowError as error:
+            self.report_error(line_number, error)
+
+    @staticmethod
+    def get_text(row, field):
+        """Значение текстового поля без пробелов по краям или пустая строка."""
+        value = row.get(field)
+        if value is None:
+            return ""
+        # В JSONL поле может оказаться числом, списком или объектом
+        if not isinstance(value, str):
+            raise RowError(f"{field} должно быть строкой")
+        return value.strip()
+
+    def clean_common(self, row):
+        name = self.get_text(row, "name")
+        description = self.get_text(row, "description")
+        if not name or not description:
+            raise RowError("не заполнены name или description")
+        if len(name) > self.name_max_length:
+            raise RowError(f"name длиннее {self.name_max_length} символов")
+        return {
+            "name": name,
+            "description": description,
+            "owner_email": self.get_text(row, "owner_email") or None,
+        }
+
+    def clean_course(self, row):
+        return self.clean_common(row)
+
+    def clean_lesson(self, row):
+        data = self.clean_common(row)
+        data["course"] = self.get_text(row, "course")
+        if not data["course"]:
+            raise RowError("не указан курс урока")
+        data["link"] = self.get_text(row, "link") or None
+        if data["link"]:
+            if len(data["link"]) > self.link_max_length:
+                raise RowError(f"link длиннее {self.link_max_length} символов")
+            try:
+                validate_url(data["link"])
+            except ValidationError as error:
+                raise RowError(error.detail[0])
+        return data
+
+    def resolve_owners(self, rows):
+        """Находит владельцев пачки строк одним запросом к БД."""
+        emails = {
+            data["owner_email"]
+            for _, data in rows
+            if data["owner_email"] and data["owner_email"] not in self.owner_ids
+        }
+        if emails:
+            found = dict(
+                User.objects.filter(email__in=emails).values_list("email", "id")
+            )
+            for email in emails:
+                self.owner_ids[email] = found.get(email)
+
+        resolved = []
+        for line_number, data in rows:
+            email = data.pop("owner_email")
+            data["owner_id"] = self.owner_ids[email] if email else None
+            if email and data["owner_id"] is None:
+                self.report_error(line_number, f"пользователь {email} не найден")
+                continue
+            resolved.append((line_number, data))
+        return resolved
+
+    def resolve_courses(self, rows):
+        """Находит курсы уроков по названию одним запросом к БД."""
+        names = {data["course"] for _, data in rows} - self.course_ids.keys()
+        if names:
+            # При совпадении названий берется последний созданный курс
+            for name, course_id in (
+                Course.objects.filter(name__in=names)
+                .order_by("id")
+                .values_list("name", "id")
+            ):
+                self.course_ids[name] = course_id
+
+        resolved = []
+        for line_number, data in rows:
+            data["course_id"] = self.course_ids.get(data.pop("course"))
+            if data["course_id"] is None:
+                self.report_error(line_number, "курс не найден")
+                continue
+            resolved.append((line_number, data))
+        return resolved
+
+    def flush_courses(self):
+        rows = self.resolve_owners(self.courses)
+        self.courses = []
+        if not rows:
+            return
+        with transaction.atomic():
+            courses = Course.objects.bulk_create(Course(**data) for _, data in rows)
+        for course in courses:
+            self.course_ids[course.name] = course.id
+        self.imported[COURSE] += len(courses)
+        self.report_progress()
+
+    def flush_lessons(self):
+        # Уроки могут ссылаться на курсы, которые еще не записаны в БД
+        self.flush_courses()
+        rows = self.resolve_courses(self.resolve_owners(self.lessons))
+        self.lessons = []
+        if not rows:
+            return
+        with transaction.atomic():
+            lessons = Lesson.objects.bulk_create(Lesson(**data) for _, data in rows)
+        self.imported[LESSON] += len(lessons)
+        self.report_progress()
+
+    def report_progress(self):
+        if self.verbosity > 1:
+            self.stdout.write(
+                f"Курсов: {self.imported[COURSE]}, уроков: {self.imported[LESSON]}"
+            )
+
+    def report_error(self, line_number, message):
+        self.errors += 1
+        if self.verbosity > 0:
+            self.stderr.write(f"Строка {line_number}: {message}")
@@ -0,0 +1,87 @@
+import io
+import pstats
+from collections import defaultdict
+
+from django.core.management import BaseCommand, CommandError
+
+from lms.profiling import ProfileStore
+
+LIST = "list"
+STATS = "stats"
+CLEAR = "clear"
+
+SORT_KEYS = ("cumulative", "tottime", "ncalls")
+
+
+class Command(BaseCommand):
+    help = (
+        "Работает с профилями запросов, сохраненными ProfilingMiddleware: "
+        "list - число и длительность профилей по обработчикам, stats - "
+        "суммарная статистика pstats по выбранным профилям, clear - удаление."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("action", choices=(LIST, STATS, CLEAR))
+        parser.add_argument(
+            "--view", help="обработчик, например CourseViewSet.retrieve"
+        )
+        parser.add_argument("--sort", choices=SORT_KEYS, default="cumulative")
+        parser.add_argument(
+            "--limit", type=int, default=30, help="количество строк статистики"
+        )
+
+    def handle(self, *args, **options):
+        self.verbosity = options["verbosity"]
+        store = ProfileStore()
+        profiles = store.load()
+        if options["view"]:
+            profiles = [
+                profile for profile in profiles if profile["view"] == options["view"]
+            ]
+
+        if options["action"] == LIST:
+            self.list_profiles(profiles)
+        elif options["action"] == STATS:
+            self.print_stats(store, profiles, options["sort"], options["limit"])
+        else:
+            for profile in profiles:
+                store.delete(profile["id"])
+            self.stdout.write(f"Удалено профилей: {len(profiles)}")
+
+    def list_profiles(self, profiles):
+        durations = defaultdict(list)
+        for profile in profiles:
+            durations[profile["view"]].append(profile["duration_ms"])
+        if not durations:
+            self.stdout.write("Профилей нет")
+            return
+
+        self.stdout.write(
+            f"{'обработчик':<40} {'профилей':>8} {'ср, мс':>10} {'макс, мс':>10}"
+        )
+        for view, values in sorted(durations.items(), key=lambda item: -sum(item[1])):
+            self.stdout.write(
+                f"{view:<40} {len(values):>8} {sum(values) / len(values):>10.1f} "
+                f"{max(values):>10.1f}"
+            )
+        if self.verbosity > 1:
+            for profile in profiles:
+                self.stdout.write(
+                    f"{profile['id']} {profile['method']} {profile['path']} "
+                    f"{profile['status']} {profile['duration_ms']:.1f} мс"
+                )
+
+    def print_stats(self, store, profiles, sort, limit):
+        if not profiles:
+            raise CommandError("Нет профилей для выбранного обработчика")
+        buffer = io.StringIO()
+        stats = pstats.Stats(stream=buffer)
+        for profile in profiles:
+            try:
+                stats.add(store.profile_path(profile["id"]))
+            except FileNotFoundError:
+                # Профиль вытеснен из кольца после чтения списка
+                continue
+        stats.strip_dirs().sort_stats(sort).print_stats(limit)
+        self.stdout.write(f"Профилей: {len(profiles)}")
+        self.stdout.write(buffer.getvalue())
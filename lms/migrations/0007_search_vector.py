@@ -0,0 +1,72 @@
+# Generated by Django 5.0.7 on 2026-10-18 10:59
+
+import django.contrib.postgres.search
+from django.db import migrations
+
+SEARCH_TABLES = ("lms_course", "lms_lesson")
+
+CREATE_FUNCTION_SQL = """
+    CREATE FUNCTION lms_search_vector_update() RETURNS trigger AS $$
+    BEGIN
+        NEW.search_vector :=
+            setweight(to_tsvector('russian', coalesce(NEW.name, '')), 'A') ||
+            setweight(to_tsvector('russian', coalesce(NEW.description, '')), 'B');
+        RETURN NEW;
+    END
+    $$ LANGUAGE plpgsql
+"""
+
+CREATE_TRIGGER_SQL = """
+    CREATE TRIGGER {table}_search_vector
+    BEFORE INSERT OR UPDATE OF name, description ON {table}
+    FOR EACH ROW EXECUTE FUNCTION lms_search_vector_update()
+"""
+
+
+def create_search_triggers(apps, schema_editor):
+    # Полнотекстовый поиск есть только в PostgreSQL, на других СУБД
+    # используется поиск по LIKE без вектора и индекса
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    schema_editor.execute(CREATE_FUNCTION_SQL)
+    for table in SEARCH_TABLES:
+        schema_editor.execute(CREATE_TRIGGER_SQL.format(table=table))
+        # Пустое обновление запускает триггер для уже существующих строк
+        schema_editor.execute(f"UPDATE {table} SET name = name")
+        schema_editor.execute(
+            f"CREATE INDEX {table}_search_idx ON {table} USING gin (search_vector)"
+        )
+
+
+def drop_search_triggers(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    for table in SEARCH_TABLES:
+        schema_editor.execute(f"DROP INDEX {table}_search_idx")
+        schema_editor.execute(f"DROP TRIGGER {table}_search_vector ON {table}")
+    schema_editor.execute("DROP FUNCTION lms_search_vector_update()")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("lms", "0006_course_updated_at_lesson_updated_at"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="course",
+            name="search_vector",
+            field=django.contrib.postgres.search.SearchVectorField(
+                blank=True, editable=False, null=True
+            ),
+        ),
+        migrations.AddField(
+            model_name="lesson",
+            name="search_vector",
+            field=django.contrib.postgres.search.SearchVectorField(
+                blank=True, editable=False, null=True
+            ),
+        ),
+        migrations.RunPython(create_search_triggers, drop_search_triggers),
+    ]
@@ -1,8 +1,16 @@
+from django.contrib.postgres.search import SearchVectorField
 from django.db import models
 
 NULLABLE = {"blank": True, "null": True}
 
 
+class SearchableManager(models.Manager):
+    """Не загружает поисковый вектор, который нужен только в запросах поиска."""
+
+    def get_queryset(self):
+        return super().get_queryset().defer("search_vector")
+
+
 class Course(models.Model):
     name = models.CharField(max_length=150, verbose_name="название курса")
     image = models.ImageField(
@@ -13,6 +21,11 @@ class Course(models.Model):
     owner = models.ForeignKey(
         "users.User", on_delete=models.SET_NULL, **NULLABLE, verbose_name="владелец"
     )
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="дата изменения")
+    # Заполняется триггером БД из названия и описания
+    search_vector = SearchVectorField(editable=False, **NULLABLE)
+
+    objects = SearchableManager()
 
     class Meta:
         verbose_name = "курс"
@@ -33,6 +46,11 @@ class Lesson(models.Model):
     owner = models.ForeignKey(
         "users.User", on_delete=models.SET_NULL, **NULLABLE, verbose_name="владелец"
     )
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="дата изменения")
+    # Заполняется триггером БД из названия и описания
+    search_vector = SearchVectorField(editable=False, **NULLABLE)
+
+    objects = SearchableManager()
 
     class Meta:
         verbose_name = "урок"
@@ -41,11 +59,23 @@ class Lesson(models.Model):
 
 class Subscription(models.Model):
     user = models.ForeignKey(
-        "users.User", on_delete=models.CASCADE, verbose_name="пользователь"
+        "users.User",
+        on_delete=models.CASCADE,
+        db_index=False,
+        verbose_name="пользователь",
+    )
+    course = models.ForeignKey(
+        Course, on_delete=models.CASCADE, db_index=False, verbose_name="курс"
     )
-    course = models.ForeignKey(Course, on_delete=models.CASCADE, verbose_name="курс")
 
     class Meta:
+        # Индекс unique_together обслуживает поиск по пользователю,
+        # а индекс (course, user) - выборку подписчиков курса
         unique_together = ("user", "course")
+        indexes = [
+            models.Index(
+                fields=["course", "user"], name="subscription_course_user_idx"
+            ),
+        ]
         verbose_name = "подписка"
         verbose_name_plural = "подписки"
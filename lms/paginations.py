@@ -1,7 +1,76 @@
-from rest_framework.pagination import PageNumberPagination
+from rest_framework.pagination import (BasePagination, CursorPagination,
+                                       PageNumberPagination)
 
 
 class CustomPagination(PageNumberPagination):
     page_size = 5
     page_size_query_param = "page_size"
     max_page_size = 10
+
+
+class CustomCursorPagination(CursorPagination):
+    """Курсорная (keyset) пагинация без COUNT(*) и OFFSET.
+
+    Поле сортировки берется из атрибута ``cursor_ordering`` представления,
+    если сортировка не задана через OrderingFilter.
+    """
+
+    page_size = 5
+    page_size_query_param = "page_size"
+    max_page_size = 10
+    ordering = "id"
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.ordering = getattr(view, "cursor_ordering", self.ordering)
+        return super().paginate_queryset(queryset, request, view)
+
+
+class SwitchablePagination(BasePagination):
+    """Выбирает вид пагинации по параметру запроса.
+
+    По умолчанию используется постраничная пагинация, а с ``pagination=cursor``
+    (или при наличии курсора в запросе) - курсорная, у которой стоимость
+    глубоких страниц не отличается от первой.
+    """
+
+    mode_query_param = "pagination"
+    page_number_class = CustomPagination
+    cursor_class = CustomCursorPagination
+
+    def __init__(self):
+        self.paginator = self.page_number_class()
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if self.is_cursor_mode(request):
+            self.paginator = self.cursor_class()
+        return self.paginator.paginate_queryset(queryset, request, view)
+
+    def is_cursor_mode(self, request):
+        return (
+            request.query_params.get(self.mode_query_param) == "cursor"
+            or self.cursor_class.cursor_query_param in request.query_params
+        )
+
+    def get_paginated_response(self, data):
+        return self.paginator.get_paginated_response(data)
+
+    def get_paginated_response_schema(self, schema):
+        return self.page_number_class().get_paginated_response_schema(schema)
+
+    def get_schema_operation_parameters(self, view):
+        cursor_parameters = [
+            parameter
+            for parameter in self.cursor_class().get_schema_operation_parameters(view)
+            if parameter["name"] == self.cursor_class.cursor_query_param
+        ]
+        return [
+            {
+                "name": self.mode_query_param,
+                "required": False,
+                "in": "query",
+                "description": "Вид пагинации: page (по умолчанию) или cursor.",
+                "schema": {"type": "string", "enum": ["page", "cursor"]},
+            },
+            *self.page_number_class().get_schema_operation_parameters(view),
+            *cursor_parameters,
+        ]
@@ -0,0 +1,158 @@
+import cProfile
+import json
+import os
+import random
+import time
+
+from rest_framework.exceptions import APIException
+
+from config.settings import (PROFILING_DIR, PROFILING_MAX_FILES,
+                             PROFILING_SAMPLE_RATE)
+from users.authentication import CachedJWTAuthentication
+
+# Заголовок, которым сотрудник запрашивает профиль своего запроса
+PROFILING_HEADER = "X-Profile"
+PROFILE_SUFFIX = ".prof"
+META_SUFFIX = ".json"
+
+
+def get_view_label(request):
+    """Имя обработчика запроса, например CourseViewSet.retrieve."""
+    match = request.resolver_match
+    if match is None:
+        return "unresolved"
+    func = match.func
+    view_class = getattr(func, "cls", None) or getattr(func, "view_class", None)
+    if view_class is None:
+        return match.view_name or func.__name__
+    # У ViewSet метод HTTP сопоставлен с действием, например get -> retrieve
+    actions = getattr(func, "actions", None) or {}
+    action = actions.get(request.method.lower(), request.method.lower())
+    return f"{view_class.__name__}.{action}"
+
+
+def is_staff_request(request):
+    """Проверяет, что запрос отправлен сотрудником.
+
+    Аутентификация DRF выполняется уже во view, поэтому JWT проверяется
+    здесь отдельно. Пользователь берется из кэша аутентификации.
+    """
+    user = getattr(request, "user", None)
+    if user is None or not user.is_authenticated:
+        try:
+            result = CachedJWTAuthentication().authenticate(request)
+        except APIException:
+            return False
+        user = result[0] if result else None
+    return bool(user and user.is_active and user.is_staff)
+
+
+class ProfileStore:
+    """Кольцевое хранилище профилей на диске.
+
+    Каждый профиль - файл pstats и JSON с описанием запроса. После записи
+    удаляются самые старые профили сверх max_files.
+    """
+
+    def __init__(self, directory=None, max_files=None):
+        self.directory = directory or PROFILING_DIR
+        self.max_files = max_files or PROFILING_MAX_FILES
+
+    def save(self, profiler, meta):
+        os.makedirs(self.directory, exist_ok=True)
+        # Имя начинается со времени, поэтому сортировка имен - хронологическая
+        profile_id = f"{time.time_ns()}-{os.getpid()}"
+        path = os.path.join(self.directory, profile_id)
+        profiler.dump_stats(path + PROFILE_SUFFIX)
+        # Описание пишется последним: профиль без описания не виден в списке
+        with open(path + META_SUFFIX + ".tmp", "w", encoding="utf-8") as file:
+            json.dump({"id": profile_id, **meta}, file, ensure_ascii=False)
+        os.replace(path + META_SUFFIX + ".tmp", path + META_SUFFIX)
+        self.trim()
+        return profile_id
+
+    def ids(self):
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            return []
+        return sorted(
+            name.removesuffix(META_SUFFIX)
+            for name in names
+            if name.endswith(META_SUFFIX)
+        )
+
+    def trim(self):
+        for profile_id in self.ids()[: -self.max_files or None]:
+            self.delete(profile_id)
+
+    def delete(self, profile_id):
+        for suffix in (META_SUFFIX, PROFILE_SUFFIX):
+            try:
+                os.remove(os.path.join(self.directory, profile_id + suffix))
+            except FileNotFoundError:
+                # Профиль уже удален другим процессом
+                pass
+
+    def profile_path(self, profile_id):
+        return os.path.join(self.directory, profile_id + PROFILE_SUFFIX)
+
+    def load(self):
+        """Возвращает описания сохраненных профилей от старых к новым."""
+        profiles = []
+        for profile_id in self.ids():
+            try:
+                with open(
+                    os.path.join(self.directory, profile_id + META_SUFFIX),
+                    encoding="utf-8",
+                ) as file:
+                    profiles.append(json.load(file))
+            except FileNotFoundError:
+                continue
+        return profiles
+
+
+class ProfilingMiddleware:
+    """Профилирует запросы cProfile и сохраняет результаты в ProfileStore.
+
+    Профилируется доля PROFILING_SAMPLE_RATE запросов и запросы сотрудников
+    с заголовком X-Profile. Идентификатор сохраненного профиля возвращается
+    в заголовке X-Profile-Id.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.store = ProfileStore()
+
+    def __call__(self, request):
+        requested = PROFILING_HEADER in request.headers and is_staff_request(request)
+        if not requested and random.random() >= PROFILING_SAMPLE_RATE:
+            return self.get_response(request)
+
+        profiler = cProfile.Profile()
+        started_at = time.perf_counter()
+        try:
+            profiler.enable()
+        except ValueError:
+            # С Python 3.12 в процессе может работать только один профилировщик
+            return self.get_response(request)
+        try:
+            response = self.get_response(request)
+        finally:
+            profiler.disable()
+        elapsed = time.perf_counter() - started_at
+
+        profile_id = self.store.save(
+            profiler,
+            {
+                "view": get_view_label(request),
+                "method": request.method,
+                "path": request.path,
+                "status": response.status_code,
+                "duration_ms": round(elapsed * 1000, 3),
+                "requested": requested,
+                "created_at": time.time(),
+            },
+        )
+        response.headers["X-Profile-Id"] = profile_id
+        return response
@@ -0,0 +1,192 @@
+import threading
+import time
+from collections import OrderedDict
+from functools import lru_cache
+from hashlib import md5
+from urllib.parse import urlencode
+
+from django.core.cache import cache, caches
+from django.utils.cache import patch_cache_control
+from django.utils.http import parse_etags
+from rest_framework import status
+from rest_framework.response import Response
+
+from config.settings import (RESPONSE_CACHE_BACKEND,
+                             RESPONSE_CACHE_MAX_ENTRIES,
+                             RESPONSE_CACHE_TIMEOUT, SHARED_CACHE)
+from lms.db_router import reading_from_replicas
+from lms.models import Subscription
+
+
+class LRUResponseCache:
+    """Кэш ответов в памяти процесса с вытеснением давно не использованных записей."""
+
+    def __init__(self, max_entries=RESPONSE_CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, timeout):
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + timeout)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class SharedResponseCache:
+    """Кэш ответов в общем для всех процессов кэше Django."""
+
+    def __init__(self, alias="default"):
+        self._cache = caches[alias]
+
+    def get(self, key):
+        return self._cache.get(key)
+
+    def set(self, key, value, timeout):
+        self._cache.set(key, value, timeout)
+
+    def clear(self):
+        self._cache.clear()
+
+
+@lru_cache(maxsize=None)
+def get_response_cache():
+    if RESPONSE_CACHE_BACKEND == "shared":
+        return SharedResponseCache()
+    return LRUResponseCache()
+
+
+def get_version_key(name):
+    return f"lms:version:{name}"
+
+
+def get_versions(*names):
+    """Возвращает текущие версии данных, от которых зависит ответ.
+
+    Версии хранятся в CACHES["default"]. Изменения, сделанные в одном
+    процессе, делают недействительными ответы в остальных, только если
+    этот кэш общий (SHARED_CACHE). Иначе ответы по версиям не кэшируются.
+    """
+    keys = [get_version_key(name) for name in names]
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            # Начальная версия уникальна, чтобы после вытеснения счетчика
+            # не совпасть с ключами, под которыми лежат старые ответы
+            cache.add(key, time.time_ns(), None)
+            versions[key] = cache.get(key)
+    return tuple(versions[key] for key in keys)
+
+
+def bump_version(name):
+    """Делает недействительными все ответы, зависящие от данных name."""
+    key = get_version_key(name)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.add(key, time.time_ns(), None)
+
+
+def get_response_cache_key(request, versions):
+    params = urlencode(sorted(request.query_params.lists()), doseq=True)
+    url = request.build_absolute_uri(request.path)
+    raw_key = f"{url}?{params}:{versions}"
+    return f"lms:response:{md5(raw_key.encode()).hexdigest()}"
+
+
+def get_or_render(request, version_names, render):
+    """Возвращает данные ответа из кэша или строит их вызовом render().
+
+    Данные, прочитанные с реплики, могут отставать от текущих версий,
+    поэтому в кэш сохраняются только ответы, построенные по основной БД.
+    Без общего кэша версии не видят изменений из других процессов, и
+    ответ всегда строится заново.
+    """
+    if not SHARED_CACHE:
+        return render()
+    key = get_response_cache_key(request, get_versions(*version_names))
+    response_cache = get_response_cache()
+    data = response_cache.get(key)
+    if data is None:
+        data = render()
+        if not reading_from_replicas():
+            response_cache.set(key, data, RESPONSE_CACHE_TIMEOUT)
+    return data
+
+
+def get_versions_etag(request, versions):
+    """ETag ответа, который зависит только от версий данных.
+
+    Ответу, построенному по данным реплики, такой ETag не выдается: иначе
+    клиент получал бы 304 на устаревшие данные до следующего изменения.
+    То же верно и для версий, которые не общие для всех процессов.
+    """
+    if not SHARED_CACHE or reading_from_replicas():
+        return None
+    return make_etag(get_response_cache_key(request, versions))
+
+
+def get_subscribed_course_ids(user):
+    """Возвращает идентификаторы курсов, на которые подписан пользователь."""
+    if not SHARED_CACHE:
+        return set(
+            Subscription.objects.filter(user=user).values_list("course_id", flat=True)
+        )
+    (version,) = get_versions(f"subscription:{user.pk}")
+    key = f"lms:subscribed_courses:{user.pk}:{version}"
+    course_ids = cache.get(key)
+    if course_ids is None:
+        course_ids = set(
+            Subscription.objects.filter(user=user).values_list("course_id", flat=True)
+        )
+        if not reading_from_replicas():
+            cache.set(key, course_ids, RESPONSE_CACHE_TIMEOUT)
+    return course_ids
+
+
+def make_etag(*parts):
+    """Строит слабый ETag из версий данных, не сериализуя сам ответ."""
+    raw_etag = ":".join(str(part) for part in parts)
+    return f'W/"{md5(raw_etag.encode()).hexdigest()}"'
+
+
+def etag_matches(request, etag):
+    if_none_match = request.headers.get("If-None-Match")
+    if not if_none_match:
+        return False
+    # Слабое сравнение: префикс W/ не учитывается
+    client_etags = {tag.removeprefix("W/") for tag in parse_etags(if_none_match)}
+    return "*" in client_etags or etag.removeprefix("W/") in client_etags
+
+
+def conditional_response(request, etag, render):
+    """Отвечает 304 Not Modified, если у клиента актуальная версия ответа.
+
+    Иначе строит данные вызовом render(). В обоих случаях добавляет ETag,
+    если он передан.
+    """
+    if etag is not None and etag_matches(request, etag):
+        response = Response(status=status.HTTP_304_NOT_MODIFIED)
+    else:
+        response = Response(render())
+    if etag is not None:
+        response["ETag"] = etag
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
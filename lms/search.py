@@ -0,0 +1,112 @@
+import base64
+import binascii
+import json
+
+from django.contrib.postgres.search import SearchQuery, SearchRank
+from django.db import connections
+from django.db.models import (Case, CharField, F, FloatField, IntegerField, Q,
+                              Value, When)
+from django.db.models.functions import Cast
+
+from lms.models import Course, Lesson
+
+# Должна совпадать с конфигурацией в триггере из миграции lms 0007
+SEARCH_CONFIG = "russian"
+
+COURSE = "course"
+LESSON = "lesson"
+SEARCH_KINDS = (COURSE, LESSON)
+SEARCH_FIELDS = ("kind", "rank", "item_id", "title", "text", "parent_id")
+
+
+def encode_cursor(row):
+    """Кодирует позицию последнего результата страницы."""
+    position = [row["rank"], row["kind"], row["item_id"]]
+    return base64.urlsafe_b64encode(json.dumps(position).encode()).decode()
+
+
+def decode_cursor(cursor):
+    """Возвращает позицию (rank, kind, id) или вызывает ValueError."""
+    try:
+        rank, kind, item_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (binascii.Error, TypeError, ValueError):
+        raise ValueError("Некорректный курсор")
+    if (
+        not isinstance(rank, (int, float))
+        or kind not in SEARCH_KINDS
+        or not isinstance(item_id, int)
+    ):
+        raise ValueError("Некорректный курсор")
+    return rank, kind, item_id
+
+
+def filter_matches(queryset, text):
+    """Оставляет совпадения с запросом и добавляет их релевантность rank."""
+    if connections[queryset.db].vendor == "postgresql":
+        query = SearchQuery(text, config=SEARCH_CONFIG, search_type="websearch")
+        # Условие @@ по сохраненному вектору обслуживается GIN-индексом
+        # ts_rank возвращает real, который теряет точность при передаче
+        # текстом, а курсору нужно точное сравнение релевантности
+        return queryset.filter(search_vector=query).annotate(
+            rank=Cast(SearchRank(F("search_vector"), query), FloatField())
+        )
+    # Запасной вариант для СУБД без полнотекстового поиска
+    return queryset.filter(
+        Q(name__icontains=text) | Q(description__icontains=text)
+    ).annotate(
+        rank=Case(
+            When(name__icontains=text, then=Value(1.0)),
+            default=Value(0.5),
+            output_field=FloatField(),
+        )
+    )
+
+
+def search_catalog(text, kinds=SEARCH_KINDS, after=None, limit=10, using=None):
+    """Ищет курсы и уроки, упорядочивая их по убыванию релевантности.
+
+    Страницы выбираются по ключу (rank, kind, id) последнего результата
+    предыдущей страницы, поэтому глубокие страницы не требуют OFFSET.
+    """
+    sources = (
+        (
+            COURSE,
+            Course.objects.using(using),
+            Value(None, output_field=IntegerField()),
+        ),
+        (LESSON, Lesson.objects.using(using), F("course_id")),
+    )
+    branches = []
+    for kind, queryset, parent_id in sources:
+        if kind not in kinds:
+            continue
+        queryset = filter_matches(queryset, text).annotate(
+            kind=Value(kind, output_field=CharField()),
+            item_id=F("id"),
+            title=F("name"),
+            text=F("description"),
+            parent_id=parent_id,
+        )
+        if after is not None:
+            rank, after_kind, after_id = after
+            queryset = queryset.filter(
+                Q(rank__lt=rank)
+                | Q(rank=rank, kind__gt=after_kind)
+                | Q(rank=rank, kind=after_kind, id__gt=after_id)
+            )
+        branches.append(queryset.values(*SEARCH_FIELDS).order_by("-rank", "id"))
+
+    if len(branches) == 1:
+        results = branches[0]
+    elif connections[branches[0].db].vendor != "postgresql":
+        # SQLite не допускает LIMIT в ветках UNION, поэтому ветки
+        # выбираются отдельно и объединяются здесь
+        rows = [row for branch in branches for row in branch[:limit]]
+        rows.sort(key=lambda row: (-row["rank"], row["kind"], row["item_id"]))
+        return rows[:limit]
+    else:
+        # Каждая ветка ограничивается заранее, чтобы не объединять все совпадения
+        results = branches[0][:limit].union(
+            *(branch[:limit] for branch in branches[1:]), all=True
+        )
+    return list(results.order_by("-rank", "kind", "item_id")[:limit])
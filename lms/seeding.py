@@ -0,0 +1,294 @@
+import csv
+import io
+import random
+import time
+from datetime import timedelta
+from decimal import Decimal
+from itertools import accumulate, islice
+
+from django.contrib.auth.hashers import make_password
+from django.db import connection
+from django.utils import timezone
+
+from lms.models import Course, Lesson, Subscription
+from lms.response_cache import bump_version
+from users.models import Payment, User
+from users.revenue import rebuild_daily_revenue
+
+SEED_BATCH_SIZE = 5000
+SEED_PASSWORD = "load-test-password"
+SEED_EMAIL_DOMAIN = "load.test"
+# Показатель распределения Ципфа: чем больше, тем сильнее выделяются
+# самые популярные курсы
+DEFAULT_SKEW = 1.1
+# Доля пользователей, которые являются авторами курсов
+AUTHOR_SHARE = 0.01
+HISTORY_DAYS = 365
+
+BULK_CREATE = "bulk_create"
+COPY = "copy"
+NULL = "\\N"
+
+
+def batched(iterable, size):
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+def zipf_weights(count, skew):
+    """Веса популярности: элемент с рангом r получает вес 1 / (r + 1) ** skew."""
+    return [1 / (rank + 1) ** skew for rank in range(count)]
+
+
+class DatasetGenerator:
+    """Заполняет БД синтетическими данными для нагрузочного тестирования.
+
+    Популярность курсов распределена по Ципфу: несколько первых курсов
+    собирают большую часть подписок, уроков и платежей. Все случайные
+    значения берутся из генератора с заданным seed, поэтому одинаковые
+    параметры дают одинаковую структуру данных.
+    """
+
+    def __init__(
+        self,
+        seed=0,
+        skew=DEFAULT_SKEW,
+        batch_size=SEED_BATCH_SIZE,
+        password=SEED_PASSWORD,
+        method=None,
+        log=None,
+    ):
+        if method is None:
+            method = COPY if connection.vendor == "postgresql" else BULK_CREATE
+        self.method = method
+        self.random = random.Random(seed)
+        self.seed = seed
+        self.skew = skew
+        self.batch_size = batch_size
+        # Хэш считается один раз: PBKDF2 для каждого пользователя занял бы часы
+        self.password_hash = make_password(password)
+        self.log = log or (lambda message: None)
+        self.now = timezone.now()
+        self.created = {}
+
+    def email(self, number):
+        return f"user{number}-{self.seed}@{SEED_EMAIL_DOMAIN}"
+
+    def generate(self, users, courses, lessons, subscriptions, payments):
+        """Создает записи и возвращает их количество по таблицам."""
+        self.user_ids = self.create_users(users)
+        self.course_ids, self.course_owner_ids = self.create_courses(courses)
+        self.course_weights = list(
+            accumulate(zipf_weights(len(self.course_ids), self.skew))
+        )
+        self.create_lessons(lessons)
+        self.create_subscriptions(subscriptions)
+        self.create_payments(payments)
+
+        # bulk_create не отправляет сигналы, поэтому производные данные
+        # и версии кэша ответов обновляются явно
+        rebuild_daily_revenue()
+        bump_version("course")
+        bump_version("lesson")
+        return self.created
+
+    def insert(self, model, objects, explicit_fields=()):
+        """Вставляет объекты пачками и записывает скорость вставки.
+
+        explicit_fields - поля с auto_now_add, значения которых заданы
+        в объектах и не должны заменяться текущим временем.
+        """
+        name = model._meta.model_name
+        started_at = time.perf_counter()
+        count = 0
+        for batch in batched(objects, self.batch_size):
+            if self.method == COPY:
+                self.copy(model, batch, explicit_fields)
+            else:
+                self.bulk_create(model, batch, explicit_fields)
+            count += len(batch)
+        elapsed = time.perf_counter() - started_at
+        self.created[name] = self.created.get(name, 0) + count
+        self.log(
+            f"{name}: {count} за {elapsed:.1f} с ({count / max(elapsed, 1e-9):.0f} строк/с)"
+        )
+
+    def bulk_create(self, model, objects, explicit_fields):
+        # bulk_create заменяет значения auto_now_add в pre_save, поэтому
+        # заданные значения восстанавливаются одним UPDATE на пачку
+        values = [[getattr(obj, name) for name in explicit_fields] for obj in objects]
+        model.objects.bulk_create(objects)
+        if explicit_fields:
+            for obj, row in zip(objects, values):
+                for name, value in zip(explicit_fields, row):
+                    setattr(obj, name, value)
+            model.objects.bulk_update(objects, explicit_fields)
+
+    def copy(self, model, objects, explicit_fields=()):
+        """Загружает объекты командой COPY PostgreSQL.
+
+        bulk_create тратит большую часть времени на сборку INSERT в ORM,
+        а COPY принимает те же объекты построчно в формате CSV.
+        """
+        fields = [
+            field for field in model._meta.concrete_fields if not field.primary_key
+        ]
+        # auto_now и auto_now_add заполняются в pre_save, как при bulk_create
+        auto_fields = {
+            field
+            for field in fields
+            if field.name not in explicit_fields
+            and (
+                getattr(field, "auto_now", False)
+                or getattr(field, "auto_now_add", False)
+            )
+        }
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        for obj in objects:
+            row = []
+            for field in fields:
+                if field in auto_fields:
+                    value = field.pre_save(obj, True)
+                else:
+                    value = getattr(obj, field.attname)
+                row.append(NULL if value is None else value)
+            writer.writerow(row)
+        buffer.seek(0)
+
+        quote_name = connection.ops.quote_name
+        columns = ", ".join(quote_name(field.column) for field in fields)
+        with connection.cursor() as cursor:
+            cursor.copy_expert(
+                f"COPY {quote_name(model._meta.db_table)} ({columns}) "
+                f"FROM STDIN WITH (FORMAT csv, NULL '{NULL}')",
+                buffer,
+            )
+
+    def random_moment(self):
+        return self.now - timedelta(
+            seconds=self.random.uniform(0, HISTORY_DAYS * 86400)
+        )
+
+    def pick_courses(self, count):
+        """Выбирает индексы курсов с учетом их популярности."""
+        return self.random.choices(
+            range(len(self.course_ids)), cum_weights=self.course_weights, k=count
+        )
+
+    def create_users(self, count):
+        start_id = User.objects.order_by("-id").values_list("id", flat=True).first()
+        self.insert(
+            User,
+            (
+                User(
+                    email=self.email(number),
+                    password=self.password_hash,
+                    is_active=self.random.random() > 0.05,
+                    date_joined=self.random_moment(),
+                    # Часть пользователей давно не заходила
+                    last_login=self.now
+                    - timedelta(days=self.random.expovariate(1 / 20)),
+                    city=self.random.choice(("Москва", "Санкт-Петербург", "Казань")),
+                )
+                for number in range(count)
+            ),
+        )
+        return list(
+            User.objects.filter(id__gt=start_id or 0)
+            .order_by("id")
+            .values_list("id", flat=True)
+        )
+
+    def create_courses(self, count):
+        authors = self.user_ids[: max(int(len(self.user_ids) * AUTHOR_SHARE), 1)]
+        owner_ids = [self.random.choice(authors) for _ in range(count)]
+        start_id = Course.objects.order_by("-id").values_list("id", flat=True).first()
+        self.insert(
+            Course,
+            (
+                Course(
+                    name=f"Курс {number}",
+                    description=f"Описание курса {number} для нагрузочного теста",
+                    owner_id=owner_ids[number],
+                )
+                for number in range(count)
+            ),
+        )
+        course_ids = list(
+            Course.objects.filter(id__gt=start_id or 0)
+            .order_by("id")
+            .values_list("id", flat=True)
+        )
+        return course_ids, owner_ids
+
+    def create_lessons(self, count):
+        def lessons():
+            for offset in range(0, count, self.batch_size):
+                size = min(self.batch_size, count - offset)
+                for number, index in enumerate(self.pick_courses(size), start=offset):
+                    yield Lesson(
+                        name=f"Урок {number}",
+                        description=f"Описание урока {number} для нагрузочного теста",
+                        course_id=self.course_ids[index],
+                        owner_id=self.course_owner_ids[index],
+                        link=f"https://youtube.com/watch?v=load{number}",
+                    )
+
+        self.insert(Lesson, lessons())
+
+    def create_subscriptions(self, count):
+        """Подписывает пользователей так, чтобы число подписчиков курса
+        убывало по Ципфу, но не превышало числа пользователей."""
+        weights = zipf_weights(len(self.course_ids), self.skew)
+        total_weight = sum(weights)
+
+        def subscriptions():
+            remaining = count
+            for index, weight in enumerate(weights):
+                if remaining <= 0:
+                    break
+                subscribers = min(
+                    round(count * weight / total_weight) or 1,
+                    len(self.user_ids),
+                    remaining,
+                )
+                remaining -= subscribers
+                course_id = self.course_ids[index]
+                for user_index in self.random.sample(
+                    range(len(self.user_ids)), subscribers
+                ):
+                    yield Subscription(
+                        user_id=self.user_ids[user_index], course_id=course_id
+                    )
+
+        self.insert(Subscription, subscriptions())
+
+    def create_payments(self, count):
+        def payments():
+            for offset in range(0, count, self.batch_size):
+                size = min(self.batch_size, count - offset)
+                # Случайные значения выбираются сразу для всей пачки
+                course_indexes = self.pick_courses(size)
+                user_ids = self.random.choices(self.user_ids, k=size)
+                payment_types = self.random.choices(
+                    ("stripe", "transfer", "cash"), weights=(70, 20, 10), k=size
+                )
+                for course_index, user_id, payment_type in zip(
+                    course_indexes, user_ids, payment_types
+                ):
+                    if payment_type == "stripe" and self.random.random() < 0.1:
+                        status = Payment.STATUS_EXPIRED
+                    else:
+                        status = Payment.STATUS_PAID
+                    yield Payment(
+                        user_id=user_id,
+                        course_id=self.course_ids[course_index],
+                        amount=Decimal(self.random.randrange(500, 50000, 100)),
+                        payment_type=payment_type,
+                        status=status,
+                        payment_date=self.random_moment(),
+                    )
+
+        self.insert(Payment, payments(), explicit_fields=("payment_date",))
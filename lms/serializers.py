@@ -1,45 +1,150 @@
+from django.db import transaction
 from rest_framework import serializers
 
 from lms.models import Course, Lesson, Subscription
+from lms.response_cache import bump_version
+from lms.search import SEARCH_KINDS, decode_cursor
 from lms.validators import validate_url
 
 
+class LessonCourseField(serializers.PrimaryKeyRelatedField):
+    """Курс урока, который при пакетном создании берется из уже загруженных."""
+
+    def to_internal_value(self, data):
+        courses = self.context.get("courses")
+        if courses is None or isinstance(data, bool):
+            return super().to_internal_value(data)
+        try:
+            course = courses.get(int(data))
+        except (TypeError, ValueError):
+            self.fail("incorrect_type", data_type=type(data).__name__)
+        if course is None:
+            self.fail("does_not_exist", pk_value=data)
+        return course
+
+
+class LessonListSerializer(serializers.ListSerializer):
+    """Сохраняет список уроков одним запросом INSERT."""
+
+    def to_internal_value(self, data):
+        if isinstance(data, list):
+            # Курсы всех уроков загружаются одним запросом, а не по одному
+            course_ids = set()
+            for item in data:
+                if isinstance(item, dict):
+                    try:
+                        course_ids.add(int(item.get("course")))
+                    except (TypeError, ValueError):
+                        pass
+            self.context["courses"] = Course.objects.in_bulk(course_ids)
+        return super().to_internal_value(data)
+
+    def create(self, validated_data):
+        with transaction.atomic():
+            lessons = Lesson.objects.bulk_create(
+                Lesson(**attrs) for attrs in validated_data
+            )
+        # bulk_create не отправляет post_save, поэтому кэш сбрасывается явно
+        bump_version("lesson")
+        return lessons
+
+
 class LessonSerializer(serializers.ModelSerializer):
+    course = LessonCourseField(queryset=Course.objects.all())
     link = serializers.CharField(validators=[validate_url])
 
     class Meta:
         model = Lesson
-        fields = "__all__"
+        exclude = ("updated_at", "search_vector")
+        list_serializer_class = LessonListSerializer
 
 
-class CourseSerializer(serializers.ModelSerializer):
-    is_subscribed = serializers.SerializerMethodField()
-
-    class Meta:
-        model = Course
-        fields = ["id", "name", "image", "description", "owner", "is_subscribed"]
+class SubscriptionStatusMixin:
+    """Определяет признак подписки текущего пользователя на курс."""
 
     def get_is_subscribed(self, obj):
+        # Курсы из CourseViewSet уже содержат аннотацию is_subscribed
+        if hasattr(obj, "is_subscribed"):
+            return obj.is_subscribed
         request = self.context.get("request")
         if not request or not request.user.is_authenticated:
             return False
         return Subscription.objects.filter(user=request.user, course=obj).exists()
 
 
-class CourseDetailSerializer(serializers.ModelSerializer):
+class CourseSerializer(SubscriptionStatusMixin, serializers.ModelSerializer):
+    is_subscribed = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Course
+        fields = ["id", "name", "image", "description", "owner", "is_subscribed"]
+
+
+class CourseDetailSerializer(SubscriptionStatusMixin, serializers.ModelSerializer):
     lessons = LessonSerializer(many=True, read_only=True)
     lessons_count = serializers.SerializerMethodField()
     is_subscribed = serializers.SerializerMethodField()
 
     def get_lessons_count(self, obj):
+        # CourseViewSet аннотирует количество уроков, а после
+        # prefetch_related("lessons") count() не делает запроса к БД
+        lessons_total = getattr(obj, "lessons_total", None)
+        if lessons_total is not None:
+            return lessons_total
         return obj.lessons.count()
 
-    def get_is_subscribed(self, obj):
-        request = self.context.get("request")
-        if not request or not request.user.is_authenticated:
-            return False
-        return Subscription.objects.filter(user=request.user, course=obj).exists()
-
     class Meta:
         model = Course
         fields = ("name", "description", "lessons_count", "lessons", "is_subscribed")
+
+
+class SubscriptionToggleSerializer(serializers.Serializer):
+    course_id = serializers.IntegerField(min_value=1)
+
+
+class SubscriptionBulkSerializer(serializers.Serializer):
+    SUBSCRIBE = "subscribe"
+    UNSUBSCRIBE = "unsubscribe"
+    MAX_COURSES = 100
+
+    action = serializers.ChoiceField(choices=(SUBSCRIBE, UNSUBSCRIBE))
+    course_ids = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=MAX_COURSES,
+    )
+
+    def validate_course_ids(self, value):
+        course_ids = set(value)
+        # Все курсы проверяются одним запросом
+        existing_ids = set(
+            Course.objects.filter(id__in=course_ids).values_list("id", flat=True)
+        )
+        missing_ids = course_ids - existing_ids
+        if missing_ids:
+            raise serializers.ValidationError(
+                f"Курсы не найдены: {', '.join(map(str, sorted(missing_ids)))}"
+            )
+        return sorted(course_ids)
+
+
+class SearchQuerySerializer(serializers.Serializer):
+    q = serializers.CharField(max_length=200)
+    type = serializers.ChoiceField(choices=SEARCH_KINDS, required=False)
+    cursor = serializers.CharField(required=False)
+    page_size = serializers.IntegerField(min_value=1, max_value=50, default=10)
+
+    def validate_cursor(self, value):
+        try:
+            return decode_cursor(value)
+        except ValueError as error:
+            raise serializers.ValidationError(str(error))
+
+
+class SearchResultSerializer(serializers.Serializer):
+    type = serializers.CharField(source="kind")
+    id = serializers.IntegerField(source="item_id")
+    name = serializers.CharField(source="title")
+    description = serializers.CharField(source="text")
+    course = serializers.IntegerField(source="parent_id", allow_null=True)
+    rank = serializers.FloatField()
@@ -0,0 +1,70 @@
+from django.db import connection
+
+from lms.models import Course, Subscription
+from lms.response_cache import bump_version
+
+# Удаление и вставка выполняются одним запросом: при повторном нажатии
+# параллельные запросы не получат IntegrityError и не оставят дубликатов
+TOGGLE_SUBSCRIPTION_SQL = """
+    WITH deleted AS (
+        DELETE FROM {subscription}
+        WHERE user_id = %(user_id)s AND course_id = %(course_id)s
+        RETURNING id
+    ), inserted AS (
+        INSERT INTO {subscription} (user_id, course_id)
+        SELECT %(user_id)s, id FROM {course}
+        WHERE id = %(course_id)s AND NOT EXISTS (SELECT 1 FROM deleted)
+        ON CONFLICT DO NOTHING
+        RETURNING id
+    )
+    SELECT
+        EXISTS (SELECT 1 FROM deleted),
+        EXISTS (SELECT 1 FROM {course} WHERE id = %(course_id)s)
+"""
+
+UNSUBSCRIBE_SQL = """
+    DELETE FROM {subscription}
+    WHERE user_id = %(user_id)s AND course_id = ANY(%(course_ids)s)
+"""
+
+
+def toggle_subscription(user, course_id):
+    """Подписывает пользователя на курс или отменяет подписку.
+
+    Возвращает None, если курса не существует, иначе True для новой
+    подписки и False для удаленной.
+    """
+    sql = TOGGLE_SUBSCRIPTION_SQL.format(
+        subscription=Subscription._meta.db_table, course=Course._meta.db_table
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, {"user_id": user.pk, "course_id": course_id})
+        deleted, course_exists = cursor.fetchone()
+    if not course_exists:
+        return None
+    bump_version(f"subscription:{user.pk}")
+    return not deleted
+
+
+def subscribe(user, course_ids):
+    """Подписывает пользователя на курсы, пропуская уже существующие подписки."""
+    Subscription.objects.bulk_create(
+        [Subscription(user=user, course_id=course_id) for course_id in course_ids],
+        ignore_conflicts=True,
+    )
+    bump_version(f"subscription:{user.pk}")
+
+
+def unsubscribe(user, course_ids):
+    """Удаляет подписки пользователя на курсы одним запросом DELETE.
+
+    Возвращает количество удаленных подписок.
+    """
+    # QuerySet.delete() из-за обработчиков post_delete сначала выбирает
+    # все подписки, а затем удаляет их по одной пачке идентификаторов
+    sql = UNSUBSCRIBE_SQL.format(subscription=Subscription._meta.db_table)
+    with connection.cursor() as cursor:
+        cursor.execute(sql, {"user_id": user.pk, "course_ids": list(course_ids)})
+        deleted = cursor.rowcount
+    bump_version(f"subscription:{user.pk}")
+    return deleted
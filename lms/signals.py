@@ -0,0 +1,26 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from lms.models import Course, Lesson, Subscription
+from lms.response_cache import bump_version
+
+
+@receiver(post_save, sender=Course)
+@receiver(post_delete, sender=Course)
+def bump_course_version(sender, **kwargs):
+    """Сбрасывает закэшированные ответы с курсами."""
+    bump_version("course")
+
+
+@receiver(post_save, sender=Lesson)
+@receiver(post_delete, sender=Lesson)
+def bump_lesson_version(sender, **kwargs):
+    """Сбрасывает закэшированные ответы с уроками."""
+    bump_version("lesson")
+
+
+@receiver(post_save, sender=Subscription)
+@receiver(post_delete, sender=Subscription)
+def bump_subscription_version(sender, instance, **kwargs):
+    """Сбрасывает закэшированный список подписок пользователя."""
+    bump_version(f"subscription:{instance.user_id}")
@@ -1,26 +1,67 @@
 from datetime import timedelta
+from itertools import islice
+from uuid import uuid4
 
 from celery import shared_task
-from django.core.mail import send_mail
+from django.core.mail import send_mass_mail
 from django.utils import timezone
 
 from config.settings import EMAIL_HOST_USER
+from lms.models import Subscription
+from users.authentication import invalidate_cached_users
 from users.models import User
 
 
+def get_notify_job_prefix(course_id):
+    return f"course-{course_id}-"
+
+
+def get_notify_job_id(course_id):
+    """Идентификатор задачи рассылки, по которому видно, к какому курсу она относится"""
+    return f"{get_notify_job_prefix(course_id)}{uuid4()}"
+
+
 @shared_task
-def send_information_about_course_update(email, course_name):
-    """Отправляет сообщение пользователю об обновлении материалов курса"""
-    send_mail(
-        "Курс обновлен",
-        f"Материалы курса ({course_name}) обновлены",
-        EMAIL_HOST_USER,
-        [email],
+def send_course_update_batch(emails, course_name):
+    """Отправляет сообщения об обновлении курса пачке подписчиков через одно соединение"""
+    send_mass_mail(
+        (
+            (
+                "Курс обновлен",
+                f"Материалы курса ({course_name}) обновлены",
+                EMAIL_HOST_USER,
+                [email],
+            )
+            for email in emails
+        )
     )
 
 
+@shared_task(bind=True)
+def notify_course_subscribers(self, course_id, course_name, batch_size=500):
+    """Рассылает уведомления подписчикам курса пачками по batch_size адресов"""
+    subscriptions = Subscription.objects.filter(course_id=course_id)
+    total = subscriptions.count()
+    emails = subscriptions.values_list("user__email", flat=True).iterator(
+        chunk_size=batch_size
+    )
+    sent = 0
+    while batch := list(islice(emails, batch_size)):
+        send_course_update_batch.delay(batch, course_name)
+        sent += len(batch)
+        self.update_state(state="PROGRESS", meta={"sent": sent, "total": total})
+    return {"sent": sent, "total": total}
+
+
 @shared_task
 def deactivate_inactive_users():
     """Деактивирует неактивных пользователей"""
     month_ago = timezone.now() - timedelta(days=30)
-    User.objects.filter(last_login__lte=month_ago).update(is_active=False)
+    user_ids = list(
+        User.objects.filter(last_login__lte=month_ago, is_active=True)
+        .order_by()
+        .values_list("pk", flat=True)
+    )
+    User.objects.filter(pk__in=user_ids).update(is_active=False)
+    # update() не отправляет post_save, поэтому кэш сбрасывается явно
+    invalidate_cached_users(user_ids)
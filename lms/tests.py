@@ -1,9 +1,37 @@
+import json
+import os
+import tempfile
+from io import StringIO
+from unittest import skipUnless
+from unittest.mock import Mock, patch
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
 from rest_framework import status
 from rest_framework.reverse import reverse
+from rest_framework.serializers import BaseSerializer
 from rest_framework.test import APITestCase
+from rest_framework_simplejwt.tokens import AccessToken
 
-from lms.models import Course, Lesson
-from users.models import User
+from lms.benchmark import (compare_with_baseline, get_benchmark_requests,
+                           get_uncovered_routes, isolated_caches,
+                           run_benchmarks, seed_dataset)
+from lms.db_router import (get_primary_pin_cache_key, pin_to_primary,
+                           primary_only)
+from lms.instrumentation import instrumented_serializers
+from lms.models import Course, Lesson, Subscription
+from lms.profiling import ProfileStore
+from lms.response_cache import LRUResponseCache, SharedResponseCache
+from lms.search import decode_cursor, encode_cursor, search_catalog
+from lms.seeding import BULK_CREATE, COPY, DatasetGenerator
+from lms.serializers import CourseDetailSerializer
+from lms.tasks import (get_notify_job_id, get_notify_job_prefix,
+                       notify_course_subscribers)
+from users.models import Payment, User
 
 
 class LessonTestCase(APITestCase):
@@ -163,3 +191,1108 @@ class CourseTestCase(APITestCase):
             ],
         }
         self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+
+@patch("lms.response_cache.SHARED_CACHE", True)
+class CourseSubscriptionQueryTestCase(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create(email="subscriber@sky.pro")
+        courses = Course.objects.bulk_create(
+            Course(name=f"Course {i}", description="test course", owner=self.user)
+            for i in range(10)
+        )
+        Subscription.objects.bulk_create(
+            Subscription(user=self.user, course=course) for course in courses[::2]
+        )
+        self.subscribed_ids = {course.id for course in courses[::2]}
+        self.client.force_authenticate(user=self.user)
+
+    def get_list(self, page_size):
+        url = reverse("lms:courses-list")
+        cache.clear()
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url, {"page_size": page_size})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.json(), len(context.captured_queries)
+
+    def test_list_query_count_is_constant(self):
+        small_page, small_queries = self.get_list(page_size=1)
+        full_page, full_queries = self.get_list(page_size=10)
+        self.assertEqual(len(small_page["results"]), 1)
+        self.assertEqual(len(full_page["results"]), 10)
+        self.assertEqual(small_queries, full_queries)
+
+    def test_list_num_queries(self):
+        url = reverse("lms:courses-list")
+        cache.clear()
+        # COUNT для пагинации, выборка страницы и подписки пользователя
+        with self.assertNumQueries(3):
+            response = self.client.get(url, {"page_size": 10})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        # Повторный запрос целиком обслуживается кэшем
+        with self.assertNumQueries(0):
+            response = self.client.get(url, {"page_size": 10})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_list_is_subscribed(self):
+        data, _ = self.get_list(page_size=10)
+        for course in data["results"]:
+            self.assertEqual(
+                course["is_subscribed"], course["id"] in self.subscribed_ids
+            )
+
+    def test_retrieve_is_subscribed(self):
+        for course in Course.objects.all():
+            url = reverse("lms:courses-detail", kwargs={"pk": course.id})
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertEqual(
+                response.data["is_subscribed"], course.id in self.subscribed_ids
+            )
+
+
+class CourseDetailQueryTestCase(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create(email="author@sky.pro")
+        self.small_course = Course.objects.create(
+            name="Small course", description="test course", owner=self.user
+        )
+        self.large_course = Course.objects.create(
+            name="Large course", description="test course", owner=self.user
+        )
+        Lesson.objects.create(
+            name="Lesson", course=self.small_course, description="test lesson"
+        )
+        Lesson.objects.bulk_create(
+            Lesson(name=f"Lesson {i}", course=self.large_course, description="test")
+            for i in range(50)
+        )
+        self.client.force_authenticate(user=self.user)
+
+    def retrieve(self, course):
+        url = reverse("lms:courses-detail", kwargs={"pk": course.id})
+        cache.clear()
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.data, len(context.captured_queries)
+
+    def test_retrieve_query_count_is_constant(self):
+        small_data, small_queries = self.retrieve(self.small_course)
+        large_data, large_queries = self.retrieve(self.large_course)
+        self.assertEqual(small_data["lessons_count"], 1)
+        self.assertEqual(large_data["lessons_count"], 50)
+        self.assertEqual(len(large_data["lessons"]), 50)
+        self.assertEqual(small_queries, large_queries)
+
+    def test_lessons_count_without_prefetch_does_not_load_lessons(self):
+        serializer = CourseDetailSerializer()
+        with CaptureQueriesContext(connection) as context:
+            count = serializer.get_lessons_count(self.large_course)
+        self.assertEqual(count, 50)
+        self.assertEqual(len(context.captured_queries), 1)
+        self.assertIn("COUNT(", context.captured_queries[0]["sql"])
+
+
+class LessonCursorPaginationTestCase(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create(email="reader@sky.pro")
+        course = Course.objects.create(name="Course", description="test course")
+        Lesson.objects.bulk_create(
+            Lesson(name=f"Lesson {i}", course=course, description="test")
+            for i in range(12)
+        )
+        self.client.force_authenticate(user=self.user)
+
+    def test_cursor_pagination_walks_all_lessons(self):
+        url = reverse("lms:lesson-list")
+        response = self.client.get(url, {"pagination": "cursor"})
+        ids = []
+        while True:
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            data = response.json()
+            self.assertNotIn("count", data)
+            ids.extend(lesson["id"] for lesson in data["results"])
+            if not data["next"]:
+                break
+            response = self.client.get(data["next"])
+        self.assertEqual(
+            ids, list(Lesson.objects.order_by("id").values_list("id", flat=True))
+        )
+
+    def test_cursor_pagination_skips_count(self):
+        url = reverse("lms:lesson-list")
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url, {"pagination": "cursor"})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertFalse(
+            any("COUNT(" in query["sql"] for query in context.captured_queries)
+        )
+
+    def test_course_cursor_pagination(self):
+        Course.objects.bulk_create(
+            Course(name=f"Course {i}", description="test course") for i in range(7)
+        )
+        url = reverse("lms:courses-list")
+        first_page = self.client.get(url, {"pagination": "cursor"}).json()
+        second_page = self.client.get(first_page["next"]).json()
+        self.assertEqual(len(first_page["results"]), 5)
+        self.assertEqual(len(second_page["results"]), 3)
+        self.assertLess(
+            first_page["results"][-1]["id"], second_page["results"][0]["id"]
+        )
+
+
+class CourseUpdateNotifyTestCase(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create(email="owner@sky.pro")
+        self.course = Course.objects.create(
+            name="Course", description="test course", owner=self.user
+        )
+        subscribers = User.objects.bulk_create(
+            User(email=f"subscriber{i}@sky.pro") for i in range(5)
+        )
+        Subscription.objects.bulk_create(
+            Subscription(user=user, course=self.course) for user in subscribers
+        )
+        self.client.force_authenticate(user=self.user)
+
+    @patch("lms.views.notify_course_subscribers.apply_async")
+    def test_update_notify_returns_job_id(self, apply_async):
+        apply_async.side_effect = lambda args, task_id: Mock(id=task_id)
+        url = reverse("lms:courses-update-notify", kwargs={"pk": self.course.id})
+        response = self.client.post(url)
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        job_id = response.data["job_id"]
+        self.assertTrue(job_id.startswith(get_notify_job_prefix(self.course.id)))
+        apply_async.assert_called_once_with(
+            (self.course.id, self.course.name), task_id=job_id
+        )
+
+    @patch("lms.views.AsyncResult")
+    def test_update_notify_status(self, async_result):
+        async_result.return_value = Mock(state="PROGRESS", info={"sent": 2, "total": 5})
+        job_id = get_notify_job_id(self.course.id)
+        url = reverse(
+            "lms:courses-update-notify-status",
+            kwargs={"pk": self.course.id, "job_id": job_id},
+        )
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["status"], "PROGRESS")
+        self.assertEqual(response.data["sent"], 2)
+        self.assertEqual(response.data["total"], 5)
+        async_result.assert_called_once_with(job_id)
+
+    @patch("lms.views.AsyncResult")
+    def test_update_notify_status_rejects_other_course_job(self, async_result):
+        other_course = Course.objects.create(
+            name="Other", description="other course", owner=self.user
+        )
+        url = reverse(
+            "lms:courses-update-notify-status",
+            kwargs={
+                "pk": self.course.id,
+                "job_id": get_notify_job_id(other_course.id),
+            },
+        )
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        async_result.assert_not_called()
+
+    @patch.object(notify_course_subscribers, "update_state")
+    @patch("lms.tasks.send_course_update_batch.delay")
+    def test_notify_course_subscribers_in_batches(self, delay, update_state):
+        # COUNT подписчиков и одна выборка адресов вне зависимости от их числа
+        with self.assertNumQueries(2):
+            result = notify_course_subscribers.apply(
+                args=(self.course.id, self.course.name), kwargs={"batch_size": 2}
+            ).get()
+        self.assertEqual(result, {"sent": 5, "total": 5})
+        batches = [call.args[0] for call in delay.call_args_list]
+        self.assertEqual([len(batch) for batch in batches], [2, 2, 1])
+        self.assertEqual(
+            sorted(email for batch in batches for email in batch),
+            sorted(f"subscriber{i}@sky.pro" for i in range(5)),
+        )
+        update_state.assert_called_with(state="PROGRESS", meta={"sent": 5, "total": 5})
+
+
+class SubscriptionQueryPlanTestCase(APITestCase):
+    """Проверяет, что выборка подписчиков курса идет по индексу."""
+
+    @classmethod
+    def setUpTestData(cls):
+        users = User.objects.bulk_create(
+            User(email=f"user{i}@sky.pro") for i in range(5000)
+        )
+        courses = Course.objects.bulk_create(
+            Course(name=f"Course {i}", description="test") for i in range(100)
+        )
+        with connection.cursor() as cursor:
+            # Каждый пользователь подписан на три курса из ста
+            cursor.execute(
+                """
+                INSERT INTO lms_subscription (user_id, course_id)
+                SELECT
+                    (%(users)s::bigint[])[1 + i],
+                    (%(courses)s::bigint[])[1 + (i + shift) %% 100]
+                FROM generate_series(0, 4999) AS i, unnest(ARRAY[0, 7, 31]) AS shift
+                """,
+                {
+                    "users": [user.pk for user in users],
+                    "courses": [course.pk for course in courses],
+                },
+            )
+            cursor.execute("ANALYZE lms_subscription")
+            cursor.execute("ANALYZE users_user")
+        cls.course = courses[1]
+
+    def test_course_subscribers(self):
+        # Запрос из lms.tasks.notify_course_subscribers
+        plan = (
+            Subscription.objects.filter(course_id=self.course.id)
+            .values_list("user__email", flat=True)
+            .explain()
+        )
+        self.assertNotIn("Seq Scan on lms_subscription", plan)
+        self.assertIn("subscription_course_user_idx", plan)
+
+
+@patch("lms.response_cache.SHARED_CACHE", True)
+class ResponseCacheTestCase(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create(email="reader@sky.pro")
+        self.other_user = User.objects.create(email="other@sky.pro")
+        self.course = Course.objects.create(
+            name="Course", description="test course", owner=self.user
+        )
+        self.lesson = Lesson.objects.create(
+            name="Lesson", course=self.course, description="test", owner=self.user
+        )
+        self.client.force_authenticate(user=self.user)
+
+    def test_course_list_is_cached(self):
+        url = reverse("lms:courses-list")
+        self.client.get(url)
+        with self.assertNumQueries(0):
+            response = self.client.get(url)
+        self.assertEqual(response.data["results"][0]["name"], "Course")
+
+    def test_lists_are_not_cached_without_shared_cache(self):
+        url = reverse("lms:courses-list")
+        with patch("lms.response_cache.SHARED_CACHE", False):
+            self.client.get(url)
+            with CaptureQueriesContext(connection) as context:
+                response = self.client.get(url)
+        self.assertGreater(len(context.captured_queries), 0)
+        self.assertNotIn("ETag", response)
+
+    def test_course_list_is_invalidated_on_change(self):
+        url = reverse("lms:courses-list")
+        self.client.get(url)
+        self.course.name = "Renamed course"
+        self.course.save()
+        response = self.client.get(url)
+        self.assertEqual(response.data["results"][0]["name"], "Renamed course")
+
+    def test_is_subscribed_is_per_user(self):
+        url = reverse("lms:courses-list")
+        Subscription.objects.create(user=self.other_user, course=self.course)
+        response = self.client.get(url)
+        self.assertFalse(response.data["results"][0]["is_subscribed"])
+        self.client.force_authenticate(user=self.other_user)
+        response = self.client.get(url)
+        self.assertTrue(response.data["results"][0]["is_subscribed"])
+
+    def test_is_subscribed_follows_subscription_toggle(self):
+        url = reverse("lms:courses-list")
+        self.client.get(url)
+        self.client.post(
+            reverse("lms:subscriptions"), {"course_id": self.course.id}, format="json"
+        )
+        response = self.client.get(url)
+        self.assertTrue(response.data["results"][0]["is_subscribed"])
+
+    def test_course_detail_is_invalidated_on_lesson_change(self):
+        url = reverse("lms:courses-detail", kwargs={"pk": self.course.id})
+        self.client.get(url)
+        Lesson.objects.create(name="New lesson", course=self.course, description="test")
+        response = self.client.get(url)
+        self.assertEqual(response.data["lessons_count"], 2)
+
+    def test_lesson_detail_is_invalidated_on_change(self):
+        url = reverse("lms:lesson-get", kwargs={"pk": self.lesson.pk})
+        self.client.get(url)
+        self.lesson.name = "Renamed lesson"
+        self.lesson.save()
+        response = self.client.get(url)
+        self.assertEqual(response.data["name"], "Renamed lesson")
+
+    def test_lesson_detail_checks_permissions_on_hit(self):
+        url = reverse("lms:lesson-get", kwargs={"pk": self.lesson.pk})
+        self.client.get(url)
+        self.client.force_authenticate(user=self.other_user)
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_lru_backend_evicts_least_recently_used(self):
+        response_cache = LRUResponseCache(max_entries=2)
+        response_cache.set("a", 1, 60)
+        response_cache.set("b", 2, 60)
+        response_cache.get("a")
+        response_cache.set("c", 3, 60)
+        self.assertEqual(response_cache.get("a"), 1)
+        self.assertIsNone(response_cache.get("b"))
+        self.assertEqual(response_cache.get("c"), 3)
+
+    def test_shared_backend(self):
+        response_cache = SharedResponseCache()
+        response_cache.set("key", {"results": []}, 60)
+        self.assertEqual(response_cache.get("key"), {"results": []})
+        self.assertEqual(cache.get("key"), {"results": []})
+
+
+@patch("lms.response_cache.SHARED_CACHE", True)
+class ConditionalGetTestCase(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create(email="mobile@sky.pro")
+        self.course = Course.objects.create(
+            name="Course", description="test course", owner=self.user
+        )
+        self.lesson = Lesson.objects.create(
+            name="Lesson", course=self.course, description="test", owner=self.user
+        )
+        self.client.force_authenticate(user=self.user)
+
+    def assertNotModified(self, url, etag, if_none_match=None):
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=if_none_match or etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response["ETag"], etag)
+        self.assertFalse(response.content)
+
+    @patch("lms.views.CourseDetailSerializer.to_representation")
+    def test_course_detail_not_modified(self, to_representation):
+        to_representation.return_value = {"name": "Course"}
+        url = reverse("lms:courses-detail", kwargs={"pk": self.course.id})
+        etag = self.client.get(url)["ETag"]
+        to_representation.reset_mock()
+        self.assertNotModified(url, etag)
+        to_representation.assert_not_called()
+
+    def test_course_detail_etag_changes(self):
+        url = reverse("lms:courses-detail", kwargs={"pk": self.course.id})
+        etag = self.client.get(url)["ETag"]
+        self.lesson.name = "Renamed lesson"
+        self.lesson.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response["ETag"], etag)
+
+        etag = response["ETag"]
+        Subscription.objects.create(user=self.user, course=self.course)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.data["is_subscribed"])
+
+    def test_lesson_detail_not_modified(self):
+        url = reverse("lms:lesson-get", kwargs={"pk": self.lesson.pk})
+        etag = self.client.get(url)["ETag"]
+        self.assertNotModified(url, etag)
+        self.lesson.description = "changed"
+        self.lesson.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_course_list_not_modified(self):
+        url = reverse("lms:courses-list")
+        etag = self.client.get(url)["ETag"]
+        with self.assertNumQueries(0):
+            self.assertNotModified(url, etag)
+        Subscription.objects.create(user=self.user, course=self.course)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_lesson_list_not_modified(self):
+        url = reverse("lms:lesson-list")
+        etag = self.client.get(url)["ETag"]
+        self.assertNotModified(url, etag, if_none_match=f'"other", {etag}')
+        Lesson.objects.create(name="New lesson", course=self.course, description="x")
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+
+class LessonBulkCreateTestCase(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create(email="author@sky.pro")
+        self.course = Course.objects.create(
+            name="Course", description="test course", owner=self.user
+        )
+        self.client.force_authenticate(user=self.user)
+        self.url = reverse("lms:lesson-bulk-create")
+
+    def get_lessons(self, count):
+        return [
+            {
+                "name": f"Lesson {number}",
+                "course": self.course.id,
+                "description": "bulk lesson",
+                "link": f"https://youtube.com/video{number}",
+            }
+            for number in range(count)
+        ]
+
+    def test_bulk_create_in_one_insert(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(self.url, self.get_lessons(50), format="json")
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(len(response.data), 50)
+        self.assertTrue(all(lesson["id"] for lesson in response.data))
+        inserts = [q for q in queries if q["sql"].startswith("INSERT")]
+        self.assertEqual(len(inserts), 1)
+        course_lookups = [q for q in queries if '"lms_course"' in q["sql"]]
+        self.assertEqual(len(course_lookups), 1)
+        self.assertEqual(
+            Lesson.objects.filter(course=self.course, owner=self.user).count(), 50
+        )
+
+    def test_bulk_create_reports_errors_per_item(self):
+        lessons = self.get_lessons(3)
+        lessons[1]["link"] = "https://example.com/video"
+        response = self.client.post(self.url, lessons, format="json")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data[0], {})
+        self.assertIn("link", response.data[1])
+        self.assertEqual(response.data[2], {})
+        self.assertFalse(Lesson.objects.exists())
+
+    def test_bulk_create_unknown_course(self):
+        lessons = self.get_lessons(2)
+        lessons[1]["course"] = 999999
+        response = self.client.post(self.url, lessons, format="json")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data[0], {})
+        self.assertIn("course", response.data[1])
+
+    def test_bulk_create_limits_batch_size(self):
+        response = self.client.post(self.url, self.get_lessons(501), format="json")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(Lesson.objects.exists())
+
+    def test_bulk_create_invalidates_lesson_list(self):
+        list_url = reverse("lms:lesson-list")
+        self.assertEqual(self.client.get(list_url).data["count"], 0)
+        self.client.post(self.url, self.get_lessons(2), format="json")
+        self.assertEqual(self.client.get(list_url).data["count"], 2)
+
+
+class SubscriptionBulkTestCase(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create(email="student@sky.pro")
+        self.courses = Course.objects.bulk_create(
+            Course(name=f"Course {number}", description="test", owner=self.user)
+            for number in range(20)
+        )
+        self.course_ids = [course.id for course in self.courses]
+        self.client.force_authenticate(user=self.user)
+        self.url = reverse("lms:subscriptions-bulk")
+
+    def test_bulk_subscribe(self):
+        Subscription.objects.create(user=self.user, course=self.courses[0])
+        data = {"action": "subscribe", "course_ids": self.course_ids}
+        with self.assertNumQueries(2):
+            response = self.client.post(self.url, data, format="json")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(Subscription.objects.filter(user=self.user).count(), 20)
+
+    def test_bulk_unsubscribe(self):
+        for course in self.courses[:5]:
+            Subscription.objects.create(user=self.user, course=course)
+        data = {"action": "unsubscribe", "course_ids": self.course_ids[:3]}
+        with self.assertNumQueries(2):
+            response = self.client.post(self.url, data, format="json")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(Subscription.objects.filter(user=self.user).count(), 2)
+
+    def test_bulk_subscribe_unknown_course(self):
+        data = {"action": "subscribe", "course_ids": [self.course_ids[0], 999999]}
+        response = self.client.post(self.url, data, format="json")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn("999999", str(response.data["course_ids"]))
+        self.assertFalse(Subscription.objects.exists())
+
+    def test_bulk_subscribe_updates_is_subscribed(self):
+        url = reverse("lms:courses-detail", kwargs={"pk": self.courses[0].pk})
+        self.assertFalse(self.client.get(url).data["is_subscribed"])
+        data = {"action": "subscribe", "course_ids": self.course_ids[:1]}
+        self.client.post(self.url, data, format="json")
+        self.assertTrue(self.client.get(url).data["is_subscribed"])
+
+    def test_toggle_is_single_query(self):
+        url = reverse("lms:subscriptions")
+        data = {"course_id": self.course_ids[0]}
+        with self.assertNumQueries(1):
+            response = self.client.post(url, data, format="json")
+        self.assertEqual(response.data["message"], "Подписка добавлена")
+        with self.assertNumQueries(1):
+            response = self.client.post(url, data, format="json")
+        self.assertEqual(response.data["message"], "Подписка удалена")
+        self.assertFalse(Subscription.objects.exists())
+
+    def test_toggle_unknown_course(self):
+        url = reverse("lms:subscriptions")
+        response = self.client.post(url, {"course_id": 999999}, format="json")
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class ImportCatalogTestCase(APITestCase):
+    def setUp(self):
+        self.owner = User.objects.create(email="author@sky.pro")
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+
+    def write_file(self, name, content):
+        path = os.path.join(self.directory.name, name)
+        with open(path, "w", encoding="utf-8") as file:
+            file.write(content)
+        return path
+
+    def import_catalog(self, path, **options):
+        stdout, stderr = StringIO(), StringIO()
+        call_command("import_catalog", path, stdout=stdout, stderr=stderr, **options)
+        return stdout.getvalue(), stderr.getvalue()
+
+    def test_import_jsonl(self):
+        rows = [
+            {
+                "type": "course",
+                "name": "Python",
+                "description": "course",
+                "owner_email": "author@sky.pro",
+            }
+        ] + [
+            {
+                "type": "lesson",
+                "course": "Python",
+                "name": f"Lesson {number}",
+                "description": "lesson",
+                "link": f"https://youtube.com/watch?v={number}",
+                "owner_email": "author@sky.pro",
+            }
+            for number in range(25)
+        ]
+        path = self.write_file(
+            "catalog.jsonl", "\n".join(json.dumps(row) for row in rows)
+        )
+        with CaptureQueriesContext(connection) as queries:
+            stdout, _ = self.import_catalog(path, batch_size=10)
+
+        course = Course.objects.get(name="Python")
+        self.assertEqual(course.owner, self.owner)
+        self.assertEqual(course.lessons.filter(owner=self.owner).count(), 25)
+        self.assertIn("строк/с", stdout)
+        # Один поиск владельца на весь файл благодаря кэшу
+        user_lookups = [q for q in queries if '"users_user"' in q["sql"]]
+        self.assertEqual(len(user_lookups), 1)
+
+    def test_import_csv_skips_invalid_rows(self):
+        Course.objects.create(name="Existing", description="course")
+        path = self.write_file(
+            "catalog.csv",
+            "type,name,description,course,link,owner_email\n"
+            "lesson,Valid,lesson,Existing,https://youtu.be/abc,\n"
+            "lesson,Bad link,lesson,Existing,https://example.com/abc,\n"
+            "lesson,No course,lesson,Missing,,\n"
+            "lesson,No owner,lesson,Existing,,nobody@sky.pro\n",
+        )
+        stdout, stderr = self.import_catalog(path)
+
+        self.assertEqual(list(Lesson.objects.values_list("name", flat=True)), ["Valid"])
+        self.assertIn("пропущено строк: 3", stdout)
+        self.assertIn("Строка 3", stderr)
+        self.assertIn("Строка 4", stderr)
+        self.assertIn("Строка 5", stderr)
+
+    def test_import_jsonl_skips_non_string_fields(self):
+        rows = [
+            {"type": "course", "name": 5, "description": "course"},
+            {"type": "course", "name": "Python", "description": "course"},
+            {
+                "type": "lesson",
+                "course": "Python",
+                "name": "Lesson",
+                "description": "lesson",
+                "link": ["https://youtu.be/abc"],
+            },
+            {"type": "lesson", "course": "Python", "name": "Valid", "description": "l"},
+        ]
+        path = self.write_file(
+            "catalog.jsonl", "\n".join(json.dumps(row) for row in rows)
+        )
+        stdout, stderr = self.import_catalog(path)
+
+        self.assertEqual(
+            list(Course.objects.values_list("name", flat=True)), ["Python"]
+        )
+        self.assertEqual(list(Lesson.objects.values_list("name", flat=True)), ["Valid"])
+        self.assertIn("пропущено строк: 2", stdout)
+        self.assertIn("Строка 1: name должно быть строкой", stderr)
+        self.assertIn("Строка 3: link должно быть строкой", stderr)
+
+
+class SearchTestCase(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create(email="student@sky.pro")
+        self.course = Course.objects.create(
+            name="Программирование на Python", description="Основы языка"
+        )
+        self.other_course = Course.objects.create(
+            name="Дизайн интерфейсов", description="Курс без программирования"
+        )
+        Lesson.objects.bulk_create(
+            Lesson(
+                name=f"Урок {number}",
+                description="Функции и классы в Python",
+                course=self.course,
+            )
+            for number in range(12)
+        )
+        self.client.force_authenticate(user=self.user)
+        self.url = reverse("lms:search")
+
+    def search(self, **params):
+        response = self.client.get(self.url, params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.data
+
+    def test_search_ranks_name_matches_first(self):
+        data = self.search(q="программирование")
+        self.assertEqual(
+            [(row["type"], row["id"]) for row in data["results"]],
+            [("course", self.course.id), ("course", self.other_course.id)],
+        )
+        self.assertGreater(data["results"][0]["rank"], data["results"][1]["rank"])
+
+    def test_search_keyset_pagination(self):
+        data = self.search(q="python", page_size=5)
+        results = data["results"]
+        while data["next"]:
+            data = self.client.get(data["next"]).data
+            results.extend(data["results"])
+        self.assertEqual(len(results), 13)
+        self.assertEqual(len({(row["type"], row["id"]) for row in results}), 13)
+        self.assertEqual(results[0]["type"], "course")
+        self.assertTrue(all(row["course"] == self.course.id for row in results[1:]))
+
+    def test_search_by_type(self):
+        data = self.search(q="python", type="course")
+        self.assertEqual([row["id"] for row in data["results"]], [self.course.id])
+
+    def test_search_vector_follows_updates(self):
+        Course.objects.filter(pk=self.other_course.pk).update(name="Алгоритмы")
+        data = self.search(q="алгоритмы")
+        self.assertEqual([row["id"] for row in data["results"]], [self.other_course.id])
+
+    def test_search_invalid_cursor(self):
+        response = self.client.get(self.url, {"q": "python", "cursor": "broken"})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_search_uses_gin_index(self):
+        with connection.cursor() as cursor:
+            cursor.execute("SET LOCAL enable_seqscan = off")
+            cursor.execute(
+                "EXPLAIN SELECT id FROM lms_lesson "
+                "WHERE search_vector @@ websearch_to_tsquery('russian', 'python')"
+            )
+            plan = "\n".join(row[0] for row in cursor.fetchall())
+        self.assertIn("lms_lesson_search_idx", plan)
+
+
+@skipUnless(
+    "sqlite_test" in settings.DATABASES,
+    "нужна БД sqlite_test из config.settings_test",
+)
+class SearchFallbackTestCase(APITestCase):
+    databases = {"default", "sqlite_test"} & settings.DATABASES.keys()
+
+    def setUp(self):
+        self.course = Course.objects.using("sqlite_test").create(
+            name="Дизайн интерфейсов", description="Курс без программирования"
+        )
+        self.lessons = [
+            Lesson.objects.using("sqlite_test").create(
+                name=f"Урок {number}",
+                description="Дизайн форм",
+                course=self.course,
+            )
+            for number in range(3)
+        ]
+
+    def search(self, **kwargs):
+        return search_catalog("Дизайн", using="sqlite_test", **kwargs)
+
+    def test_search_like_fallback(self):
+        rows = self.search(limit=3)
+        self.assertEqual(
+            [(row["kind"], row["item_id"]) for row in rows],
+            [("course", self.course.id)]
+            + [("lesson", lesson.id) for lesson in self.lessons[:2]],
+        )
+        self.assertEqual(rows[0]["rank"], 1.0)
+
+    def test_search_like_fallback_pages(self):
+        first = self.search(limit=2)
+        second = self.search(limit=2, after=decode_cursor(encode_cursor(first[-1])))
+        self.assertEqual(
+            [row["item_id"] for row in second],
+            [lesson.id for lesson in self.lessons[1:]],
+        )
+
+
+class RequestMetricsTestCase(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create(email="metrics@sky.pro")
+        for number in range(3):
+            Course.objects.create(
+                name=f"Курс {number}", description="test", owner=self.user
+            )
+        self.client.force_authenticate(user=self.user)
+
+    @patch("lms.instrumentation.REQUEST_METRICS_SAMPLE_RATE", 1)
+    def test_sampled_request_reports_metrics(self):
+        url = reverse("lms:courses-list")
+        with CaptureQueriesContext(connection) as queries:
+            with self.assertLogs("lms.instrumentation") as logs:
+                response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.headers["X-DB-Queries"], str(len(queries)))
+
+        timings = {
+            entry.split(";")[0]: entry
+            for entry in response.headers["Server-Timing"].split(", ")
+        }
+        self.assertEqual(set(timings), {"total", "db", "serialize"})
+        self.assertIn(f'desc="{len(queries)} queries"', timings["db"])
+
+        record = json.loads(logs.records[0].getMessage())
+        self.assertEqual(record["route"], "lms:courses-list")
+        self.assertEqual(record["status"], status.HTTP_200_OK)
+        self.assertEqual(record["db_queries"], len(queries))
+        self.assertGreater(record["serialize_ms"], 0)
+        self.assertLessEqual(
+            record["db_ms"] + record["serialize_ms"], record["total_ms"]
+        )
+
+    @patch("lms.instrumentation.REQUEST_METRICS_SAMPLE_RATE", 0)
+    def test_unsampled_request_has_no_metrics(self):
+        response = self.client.get(reverse("lms:courses-list"))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotIn("Server-Timing", response.headers)
+        self.assertNotIn("X-DB-Queries", response.headers)
+
+    def test_serializer_patch_is_restored_after_error(self):
+        original = BaseSerializer.data
+        with self.assertRaises(RuntimeError):
+            with instrumented_serializers():
+                with instrumented_serializers():
+                    self.assertIsNot(BaseSerializer.data, original)
+                # Внешний запрос еще замеряется
+                self.assertIsNot(BaseSerializer.data, original)
+                raise RuntimeError
+        self.assertIs(BaseSerializer.data, original)
+
+
+class ProfilingTestCase(APITestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        patcher = patch("lms.profiling.PROFILING_DIR", self.directory.name)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.staff = User.objects.create(email="staff@sky.pro", is_staff=True)
+        self.user = User.objects.create(email="student@sky.pro")
+        self.course = Course.objects.create(
+            name="Курс", description="test", owner=self.staff
+        )
+        self.url = reverse("lms:courses-detail", kwargs={"pk": self.course.pk})
+
+    def get_as(self, user, **headers):
+        token = AccessToken.for_user(user)
+        return self.client.get(
+            self.url, headers={"Authorization": f"Bearer {token}", **headers}
+        )
+
+    def call_profiles(self, *args, **options):
+        stdout = StringIO()
+        call_command("profiles", *args, stdout=stdout, **options)
+        return stdout.getvalue()
+
+    def test_staff_header_captures_profile(self):
+        response = self.get_as(self.staff, X_Profile="1")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        profiles = ProfileStore().load()
+        self.assertEqual(len(profiles), 1)
+        self.assertEqual(profiles[0]["id"], response.headers["X-Profile-Id"])
+        self.assertEqual(profiles[0]["view"], "CourseViewSet.retrieve")
+        self.assertTrue(profiles[0]["requested"])
+
+        self.assertIn("CourseViewSet.retrieve", self.call_profiles("list"))
+        stats = self.call_profiles("stats", view="CourseViewSet.retrieve")
+        self.assertIn("function calls", stats)
+
+    def test_header_ignored_for_non_staff(self):
+        response = self.get_as(self.user, X_Profile="1")
+        self.assertNotIn("X-Profile-Id", response.headers)
+        self.assertEqual(ProfileStore().load(), [])
+
+    @patch("lms.profiling.PROFILING_SAMPLE_RATE", 1)
+    @patch("lms.profiling.PROFILING_MAX_FILES", 3)
+    def test_sampled_profiles_are_bounded(self):
+        ids = [self.get_as(self.staff).headers["X-Profile-Id"] for _ in range(5)]
+        self.assertEqual([profile["id"] for profile in ProfileStore().load()], ids[2:])
+        self.assertEqual(len(os.listdir(self.directory.name)), 6)
+
+        self.call_profiles("clear")
+        self.assertEqual(os.listdir(self.directory.name), [])
+        with self.assertRaises(CommandError):
+            self.call_profiles("stats")
+
+
+@skipUnless(
+    "replica_test" in settings.DATABASES,
+    "нужна БД replica_test из config.settings_test",
+)
+@patch("lms.db_router.DATABASE_REPLICAS", ["replica_test"])
+class ReplicaRoutingTestCase(APITestCase):
+    """Реплика - отдельная тестовая БД, поэтому видно, откуда прочитаны данные."""
+
+    databases = {"default", "replica_test"} & settings.DATABASES.keys()
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create(email="reader@sky.pro")
+        User.objects.using("replica_test").create(
+            pk=self.user.pk, email=self.user.email
+        )
+        self.primary_course = Course.objects.create(
+            name="Курс в основной БД", description="test", owner=self.user
+        )
+        self.replica_course = Course.objects.using("replica_test").create(
+            name="Курс на реплике", description="test", owner_id=self.user.pk
+        )
+        self.client.force_authenticate(user=self.user)
+
+    def course_names(self):
+        response = self.client.get(reverse("lms:courses-list"))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [course["name"] for course in response.data["results"]]
+
+    def test_safe_requests_read_from_replica(self):
+        self.assertEqual(self.course_names(), ["Курс на реплике"])
+        response = self.client.get(
+            reverse("lms:courses-detail", kwargs={"pk": self.replica_course.pk})
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["name"], "Курс на реплике")
+
+    def test_write_pins_user_to_primary(self):
+        response = self.client.post(
+            reverse("lms:courses-list"), {"name": "Новый курс", "description": "test"}
+        )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertTrue(Course.objects.filter(name="Новый курс").exists())
+        self.assertFalse(
+            Course.objects.using("replica_test").filter(name="Новый курс").exists()
+        )
+        self.assertEqual(self.course_names(), ["Курс в основной БД", "Новый курс"])
+
+        # По истечении закрепления чтение возвращается на реплику
+        cache.delete(get_primary_pin_cache_key(self.user.pk))
+        response = self.client.get(
+            reverse("lms:courses-detail", kwargs={"pk": self.replica_course.pk})
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    @patch("lms.response_cache.SHARED_CACHE", True)
+    def test_replica_reads_do_not_fill_response_cache(self):
+        # Другой пользователь читает отстающую реплику после изменения
+        other = User.objects.create(email="other@sky.pro")
+        self.client.force_authenticate(user=other)
+        response = self.client.get(reverse("lms:courses-list"))
+        self.assertEqual(
+            [course["name"] for course in response.data["results"]],
+            ["Курс на реплике"],
+        )
+        self.assertNotIn("ETag", response.headers)
+
+        # Автор изменения закреплен за основной БД и видит свои данные
+        self.client.force_authenticate(user=self.user)
+        pin_to_primary(self.user)
+        response = self.client.get(reverse("lms:courses-list"))
+        self.assertEqual(
+            [course["name"] for course in response.data["results"]],
+            ["Курс в основной БД"],
+        )
+        self.assertIn("ETag", response.headers)
+
+    def test_primary_only_disables_replicas(self):
+        with primary_only():
+            self.assertEqual(self.course_names(), ["Курс в основной БД"])
+
+    def test_other_views_read_from_primary(self):
+        response = self.client.get(reverse("lms:search"), {"q": "курс"})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [result["name"] for result in response.data["results"]],
+            ["Курс в основной БД"],
+        )
+
+
+@override_settings(PASSWORD_HASHERS=["django.contrib.auth.hashers.MD5PasswordHasher"])
+class SeedLoadTestCase(APITestCase):
+    sizes = {
+        "users": 40,
+        "courses": 5,
+        "lessons": 30,
+        "subscriptions": 60,
+        "payments": 50,
+    }
+
+    def generate(self, seed=0, **options):
+        generator = DatasetGenerator(seed=seed, batch_size=16, **options)
+        return generator, generator.generate(**self.sizes)
+
+    def test_generate_counts(self):
+        for method in (COPY, BULK_CREATE):
+            with self.subTest(method=method):
+                generator, created = self.generate(seed=len(method), method=method)
+                self.assertEqual(
+                    created,
+                    {
+                        "user": 40,
+                        "course": 5,
+                        "lesson": 30,
+                        "subscription": 60,
+                        "payment": 50,
+                    },
+                )
+                self.assertEqual(
+                    Payment.objects.filter(user_id__in=generator.user_ids).count(),
+                    50,
+                )
+                # Дата платежа берется из генератора, а не из auto_now_add
+                self.assertGreater(
+                    Payment.objects.filter(user_id__in=generator.user_ids)
+                    .values("payment_date__date")
+                    .distinct()
+                    .count(),
+                    1,
+                )
+
+    def test_other_payments_keep_auto_date_during_seeding(self):
+        saved = []
+
+        def log(message):
+            # Платеж сохраняется, пока генератор вставляет свои платежи
+            if message.startswith("payment:"):
+                user = User.objects.create(email="buyer@sky.pro")
+                saved.append(
+                    Payment.objects.create(user=user, amount=10, payment_type="cash")
+                )
+
+        for method in (COPY, BULK_CREATE):
+            with self.subTest(method=method):
+                saved.clear()
+                User.objects.filter(email="buyer@sky.pro").delete()
+                self.generate(seed=len(method), method=method, log=log)
+                saved[0].refresh_from_db()
+                self.assertIsNotNone(saved[0].payment_date)
+
+    def test_popular_courses_get_more_subscriptions(self):
+        generator, _ = self.generate()
+        counts = [
+            Subscription.objects.filter(course_id=course_id).count()
+            for course_id in generator.course_ids
+        ]
+        self.assertEqual(counts, sorted(counts, reverse=True))
+        self.assertGreater(counts[0], counts[-1])
+
+    def test_same_seed_gives_same_data(self):
+        def snapshot(generator):
+            courses = {
+                course_id: index for index, course_id in enumerate(generator.course_ids)
+            }
+            return sorted(
+                (courses[course_id], amount, payment_type)
+                for course_id, amount, payment_type in Payment.objects.filter(
+                    course_id__in=courses
+                ).values_list("course_id", "amount", "payment_type")
+            )
+
+        first, _ = self.generate(seed=1)
+        first_snapshot = snapshot(first)
+        # Пользователи удаляются вместе с платежами, курсы остаются без владельца
+        User.objects.filter(id__in=first.user_ids).delete()
+        second, _ = self.generate(seed=1, method=BULK_CREATE)
+        self.assertEqual(snapshot(second), first_snapshot)
+
+    def test_command_rejects_used_seed(self):
+        options = {name: size for name, size in self.sizes.items()}
+        call_command("seed_load", seed=3, stdout=StringIO(), **options)
+        self.assertEqual(
+            User.objects.filter(email__endswith="-3@load.test").count(), 40
+        )
+        with self.assertRaises(CommandError):
+            call_command("seed_load", seed=3, stdout=StringIO(), **options)
+
+
+class BenchmarkTestCase(APITestCase):
+    # Без общего кэша пользователь загружается из БД при каждом запросе
+    @patch("users.authentication.SHARED_CACHE", True)
+    @override_settings(
+        PASSWORD_HASHERS=["django.contrib.auth.hashers.MD5PasswordHasher"]
+    )
+    def test_benchmark_covers_all_routes(self):
+        context = seed_dataset(
+            {
+                "users": 10,
+                "courses": 3,
+                "lessons": 10,
+                "subscriptions": 10,
+                "payments": 10,
+            }
+        )
+        requests = get_benchmark_requests(context)
+        self.assertEqual(get_uncovered_routes(requests), set())
+
+        results = run_benchmarks(requests, context["user"], repeat=2)
+        for name, result in results.items():
+            self.assertLess(result["status"], 400, name)
+            self.assertLessEqual(result["p50_ms"], result["p95_ms"])
+            self.assertGreater(result["peak_memory_kb"], 0)
+        # Запись, измененная эндпоинтом, откатывается после замера
+        self.assertTrue(Course.objects.filter(pk=context["course_id"]).exists())
+        self.assertEqual(results["api_root"]["queries"], 0)
+
+    def test_isolated_caches(self):
+        cache.set("benchmark:key", 1)
+        with isolated_caches():
+            self.assertIsNone(cache.get("benchmark:key"))
+            cache.set("benchmark:key", 2)
+            cache.clear()
+        self.assertEqual(cache.get("benchmark:key"), 1)
+
+    def test_compare_with_baseline(self):
+        baseline = {"course_list": {"p95_ms": 10.0, "queries": 2}}
+        results = {
+            "course_list": {"p95_ms": 11.0, "queries": 3},
+            "lesson_list": {"p95_ms": 5.0, "queries": 2},
+        }
+        regressions = compare_with_baseline(results, baseline, max_regression=0.2)
+        self.assertEqual(regressions, ["course_list: запросов к БД 2 -> 3"])
@@ -2,10 +2,11 @@ from django.urls import path
 from rest_framework.routers import DefaultRouter
 
 from lms.apps import LmsConfig
-from lms.views import (CourseViewSet, LessonCreateAPIView,
-                       LessonDestroyAPIView, LessonListAPIView,
-                       LessonRetrieveAPIView, LessonUpdateAPIView,
-                       SubscriptionAPIView)
+from lms.views import (CourseViewSet, LessonBulkCreateAPIView,
+                       LessonCreateAPIView, LessonDestroyAPIView,
+                       LessonListAPIView, LessonRetrieveAPIView,
+                       LessonUpdateAPIView, SearchAPIView, SubscriptionAPIView,
+                       SubscriptionBulkAPIView)
 
 app_name = LmsConfig.name
 
@@ -14,6 +15,11 @@ router.register(r"courses", CourseViewSet, basename="courses")
 
 urlpatterns = [
     path("lessons/create/", LessonCreateAPIView.as_view(), name="lesson-create"),
+    path(
+        "lessons/bulk_create/",
+        LessonBulkCreateAPIView.as_view(),
+        name="lesson-bulk-create",
+    ),
     path("lessons/", LessonListAPIView.as_view(), name="lesson-list"),
     path("lessons/<int:pk>/", LessonRetrieveAPIView.as_view(), name="lesson-get"),
     path(
@@ -22,5 +28,11 @@ urlpatterns = [
     path(
         "lessons/<int:pk>/delete/", LessonDestroyAPIView.as_view(), name="lesson-delete"
     ),
+    path("search/", SearchAPIView.as_view(), name="search"),
     path("subscriptions/", SubscriptionAPIView.as_view(), name="subscriptions"),
+    path(
+        "subscriptions/bulk/",
+        SubscriptionBulkAPIView.as_view(),
+        name="subscriptions-bulk",
+    ),
 ] + router.urls
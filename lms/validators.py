@@ -2,8 +2,11 @@ import re
 
 from rest_framework.serializers import ValidationError
 
+YOUTUBE_REGEX = re.compile(
+    r"(https?://)?(www\.)?(youtube|youtu|youtube-nocookie)\.(com|be)/"
+)
+
 
 def validate_url(url):
-    youtube_regex = r"(https?://)?(www\.)?(youtube|youtu|youtube-nocookie)\.(com|be)/"
-    if not re.match(youtube_regex, url):
+    if not YOUTUBE_REGEX.match(url):
         raise ValidationError("Invalid URL! Only YouTube links are allowed.")
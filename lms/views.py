@@ -1,20 +1,34 @@
-from celery import group
+from celery.result import AsyncResult
+from django.db.models import (Count, Exists, Max, OuterRef, Prefetch,
+                              prefetch_related_objects)
 from drf_spectacular.utils import extend_schema, extend_schema_view
 from rest_framework import status
 from rest_framework.decorators import action
+from rest_framework.exceptions import NotFound
 from rest_framework.generics import (CreateAPIView, DestroyAPIView,
                                      ListAPIView, RetrieveAPIView,
-                                     UpdateAPIView, get_object_or_404)
+                                     UpdateAPIView)
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
 from rest_framework.views import APIView
 from rest_framework.viewsets import ModelViewSet
 
+from lms.db_router import ReplicaReadMixin
 from lms.models import Course, Lesson, Subscription
-from lms.paginations import CustomPagination
+from lms.paginations import SwitchablePagination
+from lms.response_cache import (conditional_response, get_or_render,
+                                get_subscribed_course_ids, get_versions,
+                                get_versions_etag, make_etag)
+from lms.search import SEARCH_KINDS, encode_cursor, search_catalog
 from lms.serializers import (CourseDetailSerializer, CourseSerializer,
-                             LessonSerializer)
-from lms.tasks import send_information_about_course_update
+                             LessonSerializer, SearchQuerySerializer,
+                             SearchResultSerializer,
+                             SubscriptionBulkSerializer,
+                             SubscriptionToggleSerializer)
+from lms.services import subscribe, toggle_subscription, unsubscribe
+from lms.tasks import (get_notify_job_id, get_notify_job_prefix,
+                       notify_course_subscribers)
 from users.permissions import IsModer, IsNotModer, IsOwner
 
 
@@ -37,9 +51,80 @@ from users.permissions import IsModer, IsNotModer, IsOwner
         summary="Удаление курса",
     ),
 )
-class CourseViewSet(ModelViewSet):
+class CourseViewSet(ReplicaReadMixin, ModelViewSet):
     queryset = Course.objects.all().order_by("id")
-    pagination_class = CustomPagination
+    pagination_class = SwitchablePagination
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        user = self.request.user
+        if user.is_authenticated:
+            # Признак подписки вычисляется одним подзапросом для всей страницы
+            queryset = queryset.annotate(
+                is_subscribed=Exists(
+                    Subscription.objects.filter(user=user, course=OuterRef("pk"))
+                )
+            )
+        if self.action == "retrieve":
+            # Данные для ETag: без них пришлось бы строить ответ целиком
+            queryset = queryset.annotate(
+                lessons_updated_at=Max("lessons__updated_at"),
+                lessons_total=Count("lessons"),
+            )
+        return queryset
+
+    def list(self, request, *args, **kwargs):
+        versions = get_versions("course", f"subscription:{request.user.pk}")
+        etag = get_versions_etag(request, versions)
+        return conditional_response(
+            request, etag, lambda: self.get_list_data(request, *args, **kwargs)
+        )
+
+    def get_list_data(self, request, *args, **kwargs):
+        render = super().list
+        data = get_or_render(
+            request, ("course",), lambda: render(request, *args, **kwargs).data
+        )
+        # Общий для всех ответ дополняется подписками текущего пользователя
+        subscribed_ids = get_subscribed_course_ids(request.user)
+        if isinstance(data, dict):
+            data = {
+                **data,
+                "results": self.overlay_subscriptions(data["results"], subscribed_ids),
+            }
+        else:
+            data = self.overlay_subscriptions(data, subscribed_ids)
+        return data
+
+    @staticmethod
+    def overlay_subscriptions(courses, subscribed_ids):
+        return [
+            {**course, "is_subscribed": course["id"] in subscribed_ids}
+            for course in courses
+        ]
+
+    def retrieve(self, request, *args, **kwargs):
+        instance = self.get_object()
+        etag = make_etag(
+            instance.pk,
+            instance.updated_at,
+            instance.lessons_updated_at,
+            instance.lessons_total,
+            instance.is_subscribed,
+        )
+
+        def render():
+            # Уроки и их количество берутся из одного дополнительного запроса
+            prefetch_related_objects(
+                [instance], Prefetch("lessons", queryset=Lesson.objects.order_by("id"))
+            )
+            return self.get_serializer(instance).data
+
+        def render_with_subscription():
+            data = get_or_render(request, ("course", "lesson"), render)
+            return {**data, "is_subscribed": instance.is_subscribed}
+
+        return conditional_response(request, etag, render_with_subscription)
 
     def get_serializer_class(self):
         if self.action == "retrieve":
@@ -67,19 +152,39 @@ class CourseViewSet(ModelViewSet):
     def update_notify(self, request, pk=None):
         course = self.get_object()
 
-        subscriptions = Subscription.objects.filter(course_id=course.id)
-        email_list = [subscription.user.email for subscription in subscriptions]
+        # Рассылка выполняется в фоне, клиент получает идентификатор задачи.
+        # Он начинается с id курса, поэтому по нему можно узнать статус
+        # только рассылки этого курса
+        job = notify_course_subscribers.apply_async(
+            (course.id, course.name), task_id=get_notify_job_id(course.id)
+        )
 
-        # Отправка email с Celery
-        job = group(
-            send_information_about_course_update.s(email, course.name)
-            for email in email_list
+        return Response(
+            {
+                "message": "Sending of notification emails about course updates has started",
+                "job_id": job.id,
+            },
+            status=status.HTTP_202_ACCEPTED,
         )
-        result = job.apply_async()
 
+    @action(
+        detail=True,
+        methods=["get"],
+        url_path=r"update_notify/(?P<job_id>[^/.]+)",
+        permission_classes=[IsModer | IsOwner],
+    )
+    def update_notify_status(self, request, pk=None, job_id=None):
+        course = self.get_object()
+        if not job_id.startswith(get_notify_job_prefix(course.id)):
+            raise NotFound()
+        job = AsyncResult(job_id)
+        progress = job.info if isinstance(job.info, dict) else {}
         return Response(
             {
-                "message": f"A notification email about course updates was sent to {len(email_list)} user(s)"
+                "job_id": job_id,
+                "status": job.state,
+                "sent": progress.get("sent", 0),
+                "total": progress.get("total"),
             },
             status=status.HTTP_200_OK,
         )
@@ -97,34 +202,78 @@ class LessonCreateAPIView(CreateAPIView):
     permission_classes = (IsAuthenticated, IsNotModer)
 
     def perform_create(self, serializer):
-        lesson = serializer.save()
-        lesson.owner = self.request.user
-        lesson.save()
+        serializer.save(owner=self.request.user)
+
+
+@extend_schema(
+    tags=["Lessons"],
+    summary="Создание нескольких уроков",
+)
+class LessonBulkCreateAPIView(CreateAPIView):
+    """Создает несколько уроков одним запросом.
+
+    Уроки сохраняются все вместе или не сохраняются вовсе, а ошибки
+    валидации возвращаются списком по одной записи на каждый урок.
+    """
+
+    queryset = Lesson.objects.all()
+    serializer_class = LessonSerializer
+    permission_classes = (IsAuthenticated, IsNotModer)
+    max_lessons = 500
+
+    def get_serializer(self, *args, **kwargs):
+        kwargs.update(many=True, max_length=self.max_lessons)
+        return super().get_serializer(*args, **kwargs)
+
+    def perform_create(self, serializer):
+        serializer.save(owner=self.request.user)
 
 
 @extend_schema(
     tags=["Lessons"],
     summary="Получение списка всех уроков",
 )
-class LessonListAPIView(ListAPIView):
+class LessonListAPIView(ReplicaReadMixin, ListAPIView):
     """Выводит список всех уроков."""
 
     queryset = Lesson.objects.all().order_by("id")
     serializer_class = LessonSerializer
-    pagination_class = CustomPagination
+    pagination_class = SwitchablePagination
+
+    def list(self, request, *args, **kwargs):
+        render = super().list
+        etag = get_versions_etag(request, get_versions("lesson"))
+        return conditional_response(
+            request,
+            etag,
+            lambda: get_or_render(
+                request, ("lesson",), lambda: render(request, *args, **kwargs).data
+            ),
+        )
 
 
 @extend_schema(
     tags=["Lessons"],
     summary="Детальная информация об уроке",
 )
-class LessonRetrieveAPIView(RetrieveAPIView):
+class LessonRetrieveAPIView(ReplicaReadMixin, RetrieveAPIView):
     """Выводит детальную информацию об уроке."""
 
     queryset = Lesson.objects.all()
     serializer_class = LessonSerializer
     permission_classes = (IsAuthenticated, IsModer | IsOwner)
 
+    def retrieve(self, request, *args, **kwargs):
+        instance = self.get_object()
+        etag = make_etag(instance.pk, instance.updated_at)
+        return conditional_response(
+            request,
+            etag,
+            lambda: get_or_render(
+                request, ("lesson",), lambda: self.get_serializer(instance).data
+            ),
+        )
+
 
 @extend_schema(
     tags=["Lessons"],
@@ -153,6 +302,7 @@ class LessonDestroyAPIView(DestroyAPIView):
 @extend_schema(
     tags=["Subscriptions"],
     summary="Добавление или удаление статуса подписки",
+    request=SubscriptionToggleSerializer,
 )
 class SubscriptionAPIView(APIView):
     """Добавляет или удаляет статус подписки"""
@@ -160,18 +310,78 @@ class SubscriptionAPIView(APIView):
     permission_classes = (IsAuthenticated,)
 
     def post(self, request, *args, **kwargs):
-        user = self.request.user
-        course_id = self.request.data.get("course_id")
-        course_item = get_object_or_404(Course, id=course_id)
-
-        subscription, created = Subscription.objects.get_or_create(
-            user=user, course=course_item
+        serializer = SubscriptionToggleSerializer(data=self.request.data)
+        serializer.is_valid(raise_exception=True)
+        created = toggle_subscription(
+            self.request.user, serializer.validated_data["course_id"]
         )
+        if created is None:
+            raise NotFound("Курс не найден")
 
-        if not created:
-            subscription.delete()
-            message = "Подписка удалена"
-        else:
+        if created:
             message = "Подписка добавлена"
+        else:
+            message = "Подписка удалена"
 
         return Response({"message": message}, status=status.HTTP_200_OK)
+
+
+@extend_schema(
+    tags=["Subscriptions"],
+    summary="Подписка на несколько курсов или отмена подписок",
+    request=SubscriptionBulkSerializer,
+)
+class SubscriptionBulkAPIView(APIView):
+    """Подписывает пользователя на несколько курсов или отменяет подписки."""
+
+    permission_classes = (IsAuthenticated,)
+
+    def post(self, request, *args, **kwargs):
+        serializer = SubscriptionBulkSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        course_ids = serializer.validated_data["course_ids"]
+
+        if serializer.validated_data["action"] == SubscriptionBulkSerializer.SUBSCRIBE:
+            subscribe(request.user, course_ids)
+        else:
+            unsubscribe(request.user, course_ids)
+
+        return Response(serializer.data, status=status.HTTP_200_OK)
+
+
+@extend_schema(
+    tags=["Search"],
+    summary="Поиск по курсам и урокам",
+    parameters=[SearchQuerySerializer],
+    responses=SearchResultSerializer(many=True),
+)
+class SearchAPIView(APIView):
+    """Ищет курсы и уроки по названию и описанию.
+
+    Результаты упорядочены по релевантности, а следующая страница
+    запрашивается по ссылке ``next`` с курсором.
+    """
+
+    permission_classes = (IsAuthenticated,)
+
+    def get(self, request, *args, **kwargs):
+        params = SearchQuerySerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        page_size = params.validated_data["page_size"]
+        kind = params.validated_data.get("type")
+
+        rows = search_catalog(
+            params.validated_data["q"],
+            kinds=(kind,) if kind else SEARCH_KINDS,
+            after=params.validated_data.get("cursor"),
+            limit=page_size + 1,
+        )
+        next_url = None
+        if len(rows) > page_size:
+            rows = rows[:page_size]
+            next_url = replace_query_param(
+                request.build_absolute_uri(), "cursor", encode_cursor(rows[-1])
+            )
+        return Response(
+            {"next": next_url, "results": SearchResultSerializer(rows, many=True).data}
+        )
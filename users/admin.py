@@ -1,6 +1,6 @@
 from django.contrib import admin
 
-from users.models import Payment, User
+from users.models import CurrencyRate, DailyRevenue, Payment, User
 
 
 @admin.register(User)
@@ -19,3 +19,21 @@ class PaymentAdmin(admin.ModelAdmin):
         "amount",
         "payment_type",
     )
+
+
+@admin.register(CurrencyRate)
+class CurrencyRateAdmin(admin.ModelAdmin):
+    list_display = ("currency", "value", "updated_at")
+
+
+@admin.register(DailyRevenue)
+class DailyRevenueAdmin(admin.ModelAdmin):
+    list_display = (
+        "day",
+        "course",
+        "lesson",
+        "payment_type",
+        "payments_count",
+        "amount_total",
+    )
+    list_filter = ("payment_type",)
@@ -0,0 +1,49 @@
+import copy
+
+from django.core.cache import cache
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+
+from config.settings import SHARED_CACHE
+
+USER_CACHE_TIMEOUT = 60
+
+
+def get_user_cache_key(user_id):
+    return f"users:auth_user:{user_id}"
+
+
+def invalidate_cached_users(user_ids):
+    """Удаляет пользователей из кэша аутентификации."""
+    cache.delete_many([get_user_cache_key(user_id) for user_id in user_ids])
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """JWT-аутентификация, которая берет пользователя из кэша с коротким TTL.
+
+    Кэш сбрасывается при сохранении и удалении пользователя, поэтому
+    деактивация вступает в силу сразу, а не по истечении TTL. Сброс виден
+    всем процессам только в общем кэше, поэтому без него пользователь
+    загружается из БД при каждом запросе.
+    """
+
+    def get_user(self, validated_token):
+        if not SHARED_CACHE:
+            return super().get_user(validated_token)
+
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken("Token contained no recognizable user identification")
+
+        cache_key = get_user_cache_key(user_id)
+        user = cache.get(cache_key)
+        if user is None:
+            user = super().get_user(validated_token)
+            # Хэш пароля в кэш не попадает: у закэшированного пользователя
+            # поле отложено и при обращении загружается из БД
+            cached_user = copy.copy(user)
+            del cached_user.password
+            cache.set(cache_key, cached_user, USER_CACHE_TIMEOUT)
+        return user
@@ -0,0 +1,69 @@
+import csv
+import json
+from datetime import datetime
+
+from django.core.serializers.json import DjangoJSONEncoder
+
+EXPORT_FIELDS = (
+    "id",
+    "user_id",
+    "payment_date",
+    "course_id",
+    "lesson_id",
+    "amount",
+    "payment_type",
+    "status",
+    "session_id",
+)
+EXPORT_CHUNK_SIZE = 2000
+EXPORT_FORMATS = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+}
+
+
+class Echo:
+    """Буфер для csv.writer, который возвращает строку вместо записи."""
+
+    def write(self, value):
+        return value
+
+
+def iter_ndjson(rows):
+    for row in rows:
+        yield json.dumps(row, cls=DjangoJSONEncoder, ensure_ascii=False) + "\n"
+
+
+def iter_csv(rows):
+    writer = csv.writer(Echo())
+    yield writer.writerow(EXPORT_FIELDS)
+    for row in rows:
+        yield writer.writerow(
+            [
+                value.isoformat() if isinstance(value, datetime) else value
+                for value in (row[field] for field in EXPORT_FIELDS)
+            ]
+        )
+
+
+def export_payments(queryset, export_format, chunk_size=EXPORT_CHUNK_SIZE):
+    """Построчно выгружает платежи в формате NDJSON или CSV.
+
+    Строки читаются из БД через серверный курсор порциями по chunk_size
+    и отдаются такими же порциями, поэтому память не растет с размером
+    таблицы, а первые данные отправляются сразу после первой порции.
+    """
+    rows = queryset.values(*EXPORT_FIELDS).iterator(chunk_size=chunk_size)
+    if export_format == "csv":
+        lines = iter_csv(rows)
+    else:
+        lines = iter_ndjson(rows)
+
+    chunk = []
+    for line in lines:
+        chunk.append(line)
+        if len(chunk) >= chunk_size:
+            yield "".join(chunk)
+            chunk = []
+    if chunk:
+        yield "".join(chunk)
@@ -0,0 +1,28 @@
+from django_filters import rest_framework as filters
+
+from users.models import DailyRevenue, Payment
+
+
+class PaymentFilter(filters.FilterSet):
+    """Фильтры списка и выгрузки платежей."""
+
+    date_from = filters.IsoDateTimeFilter(field_name="payment_date", lookup_expr="gte")
+    date_to = filters.IsoDateTimeFilter(field_name="payment_date", lookup_expr="lt")
+
+    class Meta:
+        model = Payment
+        fields = ("course", "lesson", "payment_type", "date_from", "date_to")
+
+
+class DailyRevenueFilter(filters.FilterSet):
+    """Фильтры отчета о выручке."""
+
+    # Числовые фильтры не загружают курс и урок для проверки их существования
+    course = filters.NumberFilter()
+    lesson = filters.NumberFilter()
+    day_from = filters.DateFilter(field_name="day", lookup_expr="gte")
+    day_to = filters.DateFilter(field_name="day", lookup_expr="lte")
+
+    class Meta:
+        model = DailyRevenue
+        fields = ("course", "lesson", "payment_type", "day_from", "day_to")
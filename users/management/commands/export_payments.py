@@ -0,0 +1,48 @@
+import sys
+
+from django.core.management import BaseCommand, CommandError
+
+from users.exports import EXPORT_FORMATS, export_payments
+from users.filters import PaymentFilter
+from users.models import Payment
+
+
+class Command(BaseCommand):
+    help = "Выгружает платежи в формате NDJSON или CSV с теми же фильтрами, что и API."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--format", choices=sorted(EXPORT_FORMATS), default="ndjson"
+        )
+        parser.add_argument(
+            "--output", default="-", help="файл для выгрузки, по умолчанию stdout"
+        )
+        parser.add_argument("--course", type=int)
+        parser.add_argument("--lesson", type=int)
+        parser.add_argument("--payment-type")
+        parser.add_argument("--date-from", help="дата в формате ISO 8601")
+        parser.add_argument("--date-to", help="дата в формате ISO 8601")
+
+    def handle(self, *args, **options):
+        filter_names = ("course", "lesson", "payment_type", "date_from", "date_to")
+        filterset = PaymentFilter(
+            data={
+                name: options[name]
+                for name in filter_names
+                if options[name] is not None
+            },
+            queryset=Payment.objects.all(),
+        )
+        if not filterset.is_valid():
+            raise CommandError(filterset.errors.as_text())
+
+        chunks = export_payments(filterset.qs, options["format"])
+        if options["output"] == "-":
+            self.write_chunks(chunks, sys.stdout)
+        else:
+            with open(options["output"], "w", encoding="utf-8", newline="") as file:
+                self.write_chunks(chunks, file)
+
+    def write_chunks(self, chunks, file):
+        for chunk in chunks:
+            file.write(chunk)
@@ -0,0 +1,45 @@
+# Generated by Django 5.0.7 on 2026-10-18 10:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("users", "0005_payment_link_payment_session_id_and_more"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="CurrencyRate",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "currency",
+                    models.CharField(max_length=3, unique=True, verbose_name="валюта"),
+                ),
+                (
+                    "value",
+                    models.DecimalField(
+                        decimal_places=6, max_digits=12, verbose_name="курс к доллару"
+                    ),
+                ),
+                (
+                    "updated_at",
+                    models.DateTimeField(auto_now=True, verbose_name="дата обновления"),
+                ),
+            ],
+            options={
+                "verbose_name": "курс валюты",
+                "verbose_name_plural": "курсы валют",
+            },
+        ),
+    ]
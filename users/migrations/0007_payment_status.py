@@ -0,0 +1,35 @@
+# Generated by Django 5.0.7 on 2026-10-18 10:41
+
+from django.db import migrations, models
+
+
+def set_legacy_statuses(apps, schema_editor):
+    Payment = apps.get_model("users", "Payment")
+    Payment.objects.filter(session_id__isnull=False).update(status="open")
+    # Платежи без сессии stripe внесены вручную, деньги по ним уже получены
+    Payment.objects.filter(session_id__isnull=True).update(status="paid")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("users", "0006_currencyrate"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="payment",
+            name="status",
+            field=models.CharField(
+                choices=[
+                    ("pending", "Pending"),
+                    ("open", "Open"),
+                    ("failed", "Failed"),
+                ],
+                default="pending",
+                max_length=10,
+                verbose_name="статус платежа",
+            ),
+        ),
+        migrations.RunPython(set_legacy_statuses, migrations.RunPython.noop),
+    ]
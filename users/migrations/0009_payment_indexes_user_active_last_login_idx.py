@@ -0,0 +1,76 @@
+# Generated by Django 5.0.7 on 2026-10-18 10:43
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("auth", "0012_alter_user_first_name_max_length"),
+        ("lms", "0005_subscription_course_user_idx"),
+        ("users", "0008_alter_payment_status"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="payment",
+            name="course",
+            field=models.ForeignKey(
+                db_index=False,
+                null=True,
+                on_delete=django.db.models.deletion.SET_NULL,
+                to="lms.course",
+                verbose_name="оплаченный курс",
+            ),
+        ),
+        migrations.AlterField(
+            model_name="payment",
+            name="lesson",
+            field=models.ForeignKey(
+                db_index=False,
+                null=True,
+                on_delete=django.db.models.deletion.SET_NULL,
+                to="lms.lesson",
+                verbose_name="оплаченный урок",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="payment",
+            index=models.Index(fields=["payment_date"], name="payment_date_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="payment",
+            index=models.Index(
+                fields=["course", "payment_date"], name="payment_course_date_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="payment",
+            index=models.Index(
+                fields=["lesson", "payment_date"], name="payment_lesson_date_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="payment",
+            index=models.Index(
+                fields=["payment_type", "payment_date"], name="payment_type_date_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="payment",
+            index=models.Index(
+                condition=models.Q(("session_id__isnull", False)),
+                fields=["session_id"],
+                name="payment_session_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="user",
+            index=models.Index(
+                condition=models.Q(("is_active", True)),
+                fields=["last_login"],
+                name="user_active_last_login_idx",
+            ),
+        ),
+    ]
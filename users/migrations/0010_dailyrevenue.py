@@ -0,0 +1,111 @@
+# Generated by Django 5.0.7 on 2026-10-18 10:57
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncDate
+
+
+def fill_daily_revenue(apps, schema_editor):
+    """Заполняет выручку по оплаченным платежам."""
+    Payment = apps.get_model("users", "Payment")
+    DailyRevenue = apps.get_model("users", "DailyRevenue")
+    rows = (
+        Payment.objects.filter(status="paid")
+        .order_by()
+        .annotate(day=TruncDate("payment_date"))
+        .values("day", "course_id", "lesson_id", "payment_type")
+        .annotate(payments_count=Count("id"), amount_total=Sum("amount"))
+    )
+    DailyRevenue.objects.bulk_create(
+        (DailyRevenue(**row) for row in rows), batch_size=1000
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("lms", "0006_course_updated_at_lesson_updated_at"),
+        ("users", "0009_payment_indexes_user_active_last_login_idx"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="DailyRevenue",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("day", models.DateField(verbose_name="день")),
+                (
+                    "payment_type",
+                    models.CharField(
+                        choices=[
+                            ("cash", "Cash"),
+                            ("transfer", "Bank Transfer"),
+                            ("stripe", "Stripe"),
+                        ],
+                        max_length=10,
+                        verbose_name="способ оплаты",
+                    ),
+                ),
+                (
+                    "payments_count",
+                    models.PositiveIntegerField(
+                        default=0, verbose_name="количество платежей"
+                    ),
+                ),
+                (
+                    "amount_total",
+                    models.DecimalField(
+                        decimal_places=2,
+                        default=0,
+                        max_digits=14,
+                        verbose_name="сумма платежей",
+                    ),
+                ),
+                (
+                    "course",
+                    models.ForeignKey(
+                        blank=True,
+                        db_constraint=False,
+                        null=True,
+                        on_delete=django.db.models.deletion.DO_NOTHING,
+                        to="lms.course",
+                        verbose_name="курс",
+                    ),
+                ),
+                (
+                    "lesson",
+                    models.ForeignKey(
+                        blank=True,
+                        db_constraint=False,
+                        null=True,
+                        on_delete=django.db.models.deletion.DO_NOTHING,
+                        to="lms.lesson",
+                        verbose_name="урок",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "выручка за день",
+                "verbose_name_plural": "выручка по дням",
+                "ordering": ["day"],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name="dailyrevenue",
+            constraint=models.UniqueConstraint(
+                fields=("day", "course", "lesson", "payment_type"),
+                name="daily_revenue_key",
+                nulls_distinct=False,
+            ),
+        ),
+        migrations.RunPython(fill_daily_revenue, migrations.RunPython.noop),
+    ]
@@ -19,6 +19,14 @@ class User(AbstractUser):
         verbose_name = "пользователь"
         verbose_name_plural = "пользователи"
         ordering = ["email"]
+        indexes = [
+            # Поиск давно не заходивших пользователей в deactivate_inactive_users
+            models.Index(
+                fields=["last_login"],
+                name="user_active_last_login_idx",
+                condition=models.Q(is_active=True),
+            ),
+        ]
 
     def __str__(self):
         return self.email
@@ -36,12 +44,14 @@ class Payment(models.Model):
         "lms.Course",
         null=True,
         on_delete=models.SET_NULL,
+        db_index=False,
         verbose_name="оплаченный курс",
     )
     lesson = models.ForeignKey(
         "lms.Lesson",
         null=True,
         on_delete=models.SET_NULL,
+        db_index=False,
         verbose_name="оплаченный урок",
     )
     amount = models.DecimalField(
@@ -59,10 +69,120 @@ class Payment(models.Model):
     session_id = models.CharField(max_length=255, verbose_name="id сессии", **NULLABLE)
     link = models.URLField(max_length=400, verbose_name="ссылка на оплату", **NULLABLE)
 
+    STATUS_PENDING = "pending"
+    STATUS_OPEN = "open"
+    STATUS_PAID = "paid"
+    STATUS_EXPIRED = "expired"
+    STATUS_FAILED = "failed"
+    STATUS_CHOICES = [
+        (STATUS_PENDING, "Pending"),
+        (STATUS_OPEN, "Open"),
+        (STATUS_PAID, "Paid"),
+        (STATUS_EXPIRED, "Expired"),
+        (STATUS_FAILED, "Failed"),
+    ]
+    # Статусы, которые stripe больше не меняет
+    FINAL_STATUSES = (STATUS_PAID, STATUS_EXPIRED, STATUS_FAILED)
+    status = models.CharField(
+        max_length=10,
+        choices=STATUS_CHOICES,
+        default=STATUS_PENDING,
+        verbose_name="статус платежа",
+    )
+
     class Meta:
         verbose_name = "платеж"
         verbose_name_plural = "платежи"
         ordering = ["payment_date"]
+        # Индексы под фильтры и сортировку PaymentListAPIView; составные
+        # индексы заменяют одиночные индексы внешних ключей course и lesson
+        indexes = [
+            models.Index(fields=["payment_date"], name="payment_date_idx"),
+            models.Index(
+                fields=["course", "payment_date"], name="payment_course_date_idx"
+            ),
+            models.Index(
+                fields=["lesson", "payment_date"], name="payment_lesson_date_idx"
+            ),
+            models.Index(
+                fields=["payment_type", "payment_date"], name="payment_type_date_idx"
+            ),
+            models.Index(
+                fields=["session_id"],
+                name="payment_session_idx",
+                condition=models.Q(session_id__isnull=False),
+            ),
+        ]
 
     def __str__(self):
         return f"{self.user} - {self.amount} ({self.payment_date})"
+
+
+class CurrencyRate(models.Model):
+    currency = models.CharField(max_length=3, unique=True, verbose_name="валюта")
+    value = models.DecimalField(
+        max_digits=12, decimal_places=6, verbose_name="курс к доллару"
+    )
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="дата обновления")
+
+    class Meta:
+        verbose_name = "курс валюты"
+        verbose_name_plural = "курсы валют"
+
+    def __str__(self):
+        return f"{self.currency} - {self.value}"
+
+
+class DailyRevenue(models.Model):
+    """Выручка за день в разрезе курса, урока и способа оплаты.
+
+    Учитываются только оплаченные платежи. Строки обновляются при оплате
+    и удалении платежа и сверяются с таблицей платежей периодической
+    задачей, поэтому отчеты не сканируют все платежи.
+    """
+
+    day = models.DateField(verbose_name="день")
+    # При удалении курса или урока его выручка переносится в строки без
+    # курса или урока (users.revenue.fold_deleted), а не удаляется
+    course = models.ForeignKey(
+        "lms.Course",
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
+        verbose_name="курс",
+        **NULLABLE,
+    )
+    lesson = models.ForeignKey(
+        "lms.Lesson",
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
+        verbose_name="урок",
+        **NULLABLE,
+    )
+    payment_type = models.CharField(
+        max_length=10,
+        choices=Payment.PAYMENT_TYPE_CHOICES,
+        verbose_name="способ оплаты",
+    )
+    payments_count = models.PositiveIntegerField(
+        default=0, verbose_name="количество платежей"
+    )
+    amount_total = models.DecimalField(
+        max_digits=14, decimal_places=2, default=0, verbose_name="сумма платежей"
+    )
+
+    class Meta:
+        verbose_name = "выручка за день"
+        verbose_name_plural = "выручка по дням"
+        ordering = ["day"]
+        constraints = [
+            # Платеж без курса или урока попадает в строку с NULL, и такая
+            # строка за день тоже должна быть единственной
+            models.UniqueConstraint(
+                fields=["day", "course", "lesson", "payment_type"],
+                name="daily_revenue_key",
+                nulls_distinct=False,
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.day} - {self.payment_type}: {self.amount_total}"
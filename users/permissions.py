@@ -1,18 +1,58 @@
+from django.core.cache import cache
 from rest_framework import permissions
 
+from config.settings import SHARED_CACHE
+
+MODERATORS_GROUP = "moders"
+MODERATOR_CACHE_TIMEOUT = 5 * 60
+
+
+def get_moderator_cache_key(user_id):
+    return f"users:is_moder:{user_id}"
+
+
+def user_is_moder(user):
+    """Проверяет членство пользователя в группе модераторов через общий кэш.
+
+    Без общего кэша сброс роли не дошел бы до других процессов, поэтому
+    членство проверяется запросом к БД.
+    """
+    if not user.is_authenticated:
+        return False
+    if not SHARED_CACHE:
+        return user.groups.filter(name=MODERATORS_GROUP).exists()
+    cache_key = get_moderator_cache_key(user.pk)
+    is_moder = cache.get(cache_key)
+    if is_moder is None:
+        is_moder = user.groups.filter(name=MODERATORS_GROUP).exists()
+        cache.set(cache_key, is_moder, MODERATOR_CACHE_TIMEOUT)
+    return is_moder
+
+
+def request_user_is_moder(request):
+    """Определяет роль пользователя не более одного раза за запрос."""
+    if not hasattr(request, "_user_is_moder"):
+        request._user_is_moder = user_is_moder(request.user)
+    return request._user_is_moder
+
+
+def invalidate_moderator_cache(user_ids):
+    """Сбрасывает закэшированную роль у перечисленных пользователей."""
+    cache.delete_many([get_moderator_cache_key(user_id) for user_id in user_ids])
+
 
 class IsModer(permissions.BasePermission):
     """Проверяет, является ли пользователь модератором."""
 
     def has_permission(self, request, view):
-        return request.user.groups.filter(name="moders").exists()
+        return request_user_is_moder(request)
 
 
 class IsNotModer(permissions.BasePermission):
     """Проверяет, является ли пользователь не модератором."""
 
     def has_permission(self, request, view):
-        return not request.user.groups.filter(name="moders").exists()
+        return not request_user_is_moder(request)
 
 
 class IsOwner(permissions.BasePermission):
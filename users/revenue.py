@@ -0,0 +1,140 @@
+from datetime import datetime, time
+
+from django.db import connection, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from users.models import DailyRevenue, Payment
+
+# Счетчик увеличивается одним запросом: параллельные платежи за один день
+# не теряют обновления и не получают ошибку уникальности
+RECORD_PAYMENT_SQL = """
+    INSERT INTO {table}
+        (day, course_id, lesson_id, payment_type, payments_count, amount_total)
+    VALUES (%s, %s, %s, %s, 1, %s)
+    ON CONFLICT ON CONSTRAINT daily_revenue_key DO UPDATE SET
+        payments_count = {table}.payments_count + 1,
+        amount_total = {table}.amount_total + EXCLUDED.amount_total
+"""
+
+# Выручка удаленного курса или урока переносится в строки без курса или
+# урока, как и платежи, у которых внешний ключ становится NULL
+FOLD_DELETED_SQL = """
+    WITH moved AS (
+        DELETE FROM {table} WHERE {column} = %s
+        RETURNING day, course_id, lesson_id, payment_type,
+            payments_count, amount_total
+    )
+    INSERT INTO {table}
+        (day, course_id, lesson_id, payment_type, payments_count, amount_total)
+    SELECT day, {course}, {lesson}, payment_type,
+        SUM(payments_count), SUM(amount_total)
+    FROM moved
+    GROUP BY 1, 2, 3, 4
+    ON CONFLICT ON CONSTRAINT daily_revenue_key DO UPDATE SET
+        payments_count = {table}.payments_count + EXCLUDED.payments_count,
+        amount_total = {table}.amount_total + EXCLUDED.amount_total
+"""
+
+# Итоги считаются и записываются в БД одним запросом, без передачи
+# строк в Python. День платежа берется в часовом поясе проекта, как
+# в timezone.localdate() у record_payment(). Строки, добавленные
+# параллельными платежами после удаления, перезаписываются пересчитанными
+REBUILD_SQL = """
+    INSERT INTO {table}
+        (day, course_id, lesson_id, payment_type, payments_count, amount_total)
+    SELECT
+        (payment_date AT TIME ZONE %s)::date,
+        course_id,
+        lesson_id,
+        payment_type,
+        COUNT(*),
+        SUM(amount)
+    FROM {payments}
+    WHERE status = %s {since_filter}
+    GROUP BY 1, 2, 3, 4
+    ON CONFLICT ON CONSTRAINT daily_revenue_key DO UPDATE SET
+        payments_count = EXCLUDED.payments_count,
+        amount_total = EXCLUDED.amount_total
+"""
+
+
+def get_revenue_key(payment):
+    return {
+        "day": timezone.localdate(payment.payment_date),
+        "course_id": payment.course_id,
+        "lesson_id": payment.lesson_id,
+        "payment_type": payment.payment_type,
+    }
+
+
+def record_payment(payment):
+    """Добавляет оплаченный платеж в дневную выручку."""
+    if payment.status != Payment.STATUS_PAID:
+        return
+    sql = RECORD_PAYMENT_SQL.format(table=DailyRevenue._meta.db_table)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            sql,
+            [
+                timezone.localdate(payment.payment_date),
+                payment.course_id,
+                payment.lesson_id,
+                payment.payment_type,
+                payment.amount,
+            ],
+        )
+
+
+def discard_payment(payment):
+    """Вычитает оплаченный платеж из дневной выручки."""
+    if payment.status != Payment.STATUS_PAID:
+        return
+    rows = DailyRevenue.objects.filter(**get_revenue_key(payment))
+    # Строки может не быть, если платеж создан в обход сигналов
+    rows.filter(payments_count__gt=0).update(
+        payments_count=F("payments_count") - 1,
+        amount_total=F("amount_total") - payment.amount,
+    )
+    rows.filter(payments_count=0).delete()
+
+
+def fold_deleted(field_name, object_id):
+    """Переносит выручку удаленного курса или урока в строки без него."""
+    columns = {"course": "course_id", "lesson": "lesson_id"}
+    sql = FOLD_DELETED_SQL.format(
+        table=DailyRevenue._meta.db_table,
+        column=columns[field_name],
+        **{
+            name: "NULL::bigint" if name == field_name else column
+            for name, column in columns.items()
+        },
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [object_id])
+
+
+def rebuild_daily_revenue(since=None):
+    """Пересчитывает дневную выручку по оплаченным платежам.
+
+    С since пересчитываются только дни начиная с этой даты, без него - все.
+    Возвращает количество записанных строк.
+    """
+    rollup = DailyRevenue.objects.all()
+    params = [timezone.get_current_timezone_name(), Payment.STATUS_PAID]
+    since_filter = ""
+    if since is not None:
+        rollup = rollup.filter(day__gte=since)
+        since_filter = "AND payment_date >= %s"
+        params.append(timezone.make_aware(datetime.combine(since, time.min)))
+
+    sql = REBUILD_SQL.format(
+        table=DailyRevenue._meta.db_table,
+        payments=Payment._meta.db_table,
+        since_filter=since_filter,
+    )
+    with transaction.atomic():
+        rollup.delete()
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            return cursor.rowcount
@@ -1,12 +1,32 @@
 from rest_framework.serializers import ModelSerializer
 
-from users.models import Payment, User
+from users.models import DailyRevenue, Payment, User
 
 
 class PaymentSerializer(ModelSerializer):
     class Meta:
         model = Payment
         fields = "__all__"
+        read_only_fields = ("session_id", "link", "status")
+
+
+class PaymentStatusSerializer(ModelSerializer):
+    class Meta:
+        model = Payment
+        fields = ("id", "status", "session_id", "link")
+
+
+class DailyRevenueSerializer(ModelSerializer):
+    class Meta:
+        model = DailyRevenue
+        fields = (
+            "day",
+            "course",
+            "lesson",
+            "payment_type",
+            "payments_count",
+            "amount_total",
+        )
 
 
 class UserSerializer(ModelSerializer):
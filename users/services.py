@@ -1,51 +1,188 @@
+import time
+from collections import defaultdict
+from decimal import Decimal
+
 import requests
 import stripe
-from rest_framework import status
+from django.core.cache import cache
+from django.db import transaction
+from requests.adapters import HTTPAdapter
 
-from config.settings import CURRENCY_API_KEY, CURRENCY_API_URL, STRIPE_API_KEY
+from config.settings import (CURRENCY_API_KEY, CURRENCY_API_URL,
+                             STRIPE_API_KEY, STRIPE_WEBHOOK_SECRET)
+from lms.instrumentation import external_call
+from users.models import CurrencyRate, Payment
+from users.revenue import record_payment
 
 stripe.api_key = STRIPE_API_KEY
+stripe.max_network_retries = 2
 
+STRIPE_API_TIMEOUT = 10
+STRIPE_SESSION_CACHE_TIMEOUT = 30
 
-def convert_rub_to_dollars(rub_price):
-    """Конвертирует рубли в доллары."""
-    usd_price = 0
-    response = requests.get(
-        f"{CURRENCY_API_URL}v3/latest?apikey={CURRENCY_API_KEY}&currencies=RUB"
-    )
-    if response.status_code == status.HTTP_200_OK:
-        usd_rate = response.json()["data"]["RUB"]["value"]
-        usd_price = float(rub_price) / usd_rate
-        return int(usd_price * 100)
+# Один клиент на процесс: соединения с API stripe переиспользуются между платежами
+stripe.default_http_client = stripe.RequestsClient(timeout=STRIPE_API_TIMEOUT)
 
+CURRENCY_API_TIMEOUT = 5
+CURRENCY_RATE_CACHE_TIMEOUT = 60
 
-def create_stripe_product():
-    """Создает продукт в stripe."""
-    product = stripe.Product.create(name="Stripe product")
-    return product
+currency_session = requests.Session()
+currency_session.mount("https://", HTTPAdapter(max_retries=2))
+currency_session.mount("http://", HTTPAdapter(max_retries=2))
 
+# Курсы валют в памяти процесса: {валюта: (курс, момент устаревания)}
+_currency_rates = {}
 
-def create_stripe_price(amount, product):
-    """Создает цену в stripe."""
 
-    return stripe.Price.create(
-        currency="usd",
-        unit_amount=amount,
-        product=product.id,
+def fetch_currency_rate(currency):
+    """Запрашивает курс валюты к доллару у внешнего API."""
+    with external_call("currency"):
+        response = currency_session.get(
+            f"{CURRENCY_API_URL}v3/latest",
+            params={"apikey": CURRENCY_API_KEY, "currencies": currency},
+            timeout=CURRENCY_API_TIMEOUT,
+        )
+    response.raise_for_status()
+    return Decimal(str(response.json()["data"][currency]["value"]))
+
+
+def refresh_currency_rate(currency):
+    """Обновляет сохраненный курс валюты данными внешнего API."""
+    rate, _ = CurrencyRate.objects.update_or_create(
+        currency=currency, defaults={"value": fetch_currency_rate(currency)}
+    )
+    _currency_rates[currency] = (
+        rate.value,
+        time.monotonic() + CURRENCY_RATE_CACHE_TIMEOUT,
     )
+    return rate
 
 
-def create_stripe_session(price):
-    """Создает сессию на оплату в stripe."""
-    session = stripe.checkout.Session.create(
-        success_url="https://127.0.0.1:8000/",
-        line_items=[{"price": price.get("id"), "quantity": 1}],
-        mode="payment",
+def get_currency_rate(currency):
+    """Возвращает курс валюты из памяти процесса или из таблицы курсов.
+
+    Внешний API вызывается, только если курс еще ни разу не сохранялся.
+    """
+    cached = _currency_rates.get(currency)
+    if cached and cached[1] > time.monotonic():
+        return cached[0]
+    rate = CurrencyRate.objects.filter(currency=currency).first()
+    if rate is None:
+        rate = refresh_currency_rate(currency)
+    _currency_rates[currency] = (
+        rate.value,
+        time.monotonic() + CURRENCY_RATE_CACHE_TIMEOUT,
     )
+    return rate.value
+
+
+def convert_rub_to_dollars(rub_price):
+    """Конвертирует рубли в доллары."""
+    usd_rate = get_currency_rate("RUB")
+    return int(Decimal(rub_price) / usd_rate * 100)
+
+
+def create_stripe_session(amount, product_name):
+    """Создает сессию на оплату в stripe.
+
+    Цена и продукт передаются прямо в сессии, поэтому платеж обходится
+    одним запросом к stripe.
+    """
+    with external_call("stripe"):
+        session = stripe.checkout.Session.create(
+            success_url="https://127.0.0.1:8000/",
+            line_items=[
+                {
+                    "price_data": {
+                        "currency": "usd",
+                        "unit_amount": amount,
+                        "product_data": {"name": product_name},
+                    },
+                    "quantity": 1,
+                }
+            ],
+            mode="payment",
+        )
     return session.get("id"), session.get("url")
 
 
+def get_stripe_session_cache_key(session_id):
+    return f"users:stripe_session:{session_id}"
+
+
 def retrieve_stripe_session(session_id):
-    """Получает данные о сессии в stripe по её идентификатору."""
-    session = stripe.checkout.Session.retrieve(session_id)
+    """Получает данные о сессии в stripe по её идентификатору.
+
+    Ответ stripe кэшируется на короткое время, чтобы частые опросы клиента
+    не превращались в такие же частые запросы к stripe.
+    """
+    cache_key = get_stripe_session_cache_key(session_id)
+    session = cache.get(cache_key)
+    if session is None:
+        with external_call("stripe"):
+            session = stripe.checkout.Session.retrieve(session_id).to_dict()
+        cache.set(cache_key, session, STRIPE_SESSION_CACHE_TIMEOUT)
     return session
+
+
+def construct_stripe_event(payload, signature):
+    """Проверяет подпись события stripe и возвращает само событие."""
+    return stripe.Webhook.construct_event(payload, signature, STRIPE_WEBHOOK_SECRET)
+
+
+def get_payment_status_from_event(event):
+    """Определяет новый статус платежа по событию stripe о сессии оплаты."""
+    session = event["data"]["object"]
+    if event["type"] == "checkout.session.completed":
+        # При отложенных способах оплаты деньги поступают позже
+        if session.get("payment_status") == "paid":
+            return Payment.STATUS_PAID
+    elif event["type"] == "checkout.session.async_payment_succeeded":
+        return Payment.STATUS_PAID
+    elif event["type"] == "checkout.session.async_payment_failed":
+        return Payment.STATUS_FAILED
+    elif event["type"] == "checkout.session.expired":
+        return Payment.STATUS_EXPIRED
+    return None
+
+
+def get_payment_status_from_session(session):
+    """Определяет статус платежа по данным сессии stripe."""
+    if session.get("payment_status") == "paid":
+        return Payment.STATUS_PAID
+    if session.get("status") == "expired":
+        return Payment.STATUS_EXPIRED
+    if session.get("status") == "open":
+        return Payment.STATUS_OPEN
+    return Payment.STATUS_PENDING
+
+
+def update_payment_statuses(statuses):
+    """Сохраняет статусы платежей, переданные как {id сессии: статус}.
+
+    Платежи с одинаковым статусом обновляются одним запросом, а оплаченные
+    платежи больше не меняют статус.
+    """
+    session_ids_by_status = defaultdict(list)
+    for session_id, payment_status in statuses.items():
+        session_ids_by_status[payment_status].append(session_id)
+    with transaction.atomic():
+        for payment_status, session_ids in session_ids_by_status.items():
+            payments = Payment.objects.filter(session_id__in=session_ids).exclude(
+                status=Payment.STATUS_PAID
+            )
+            if payment_status != Payment.STATUS_PAID:
+                payments.update(status=payment_status)
+                continue
+            # update() не отправляет сигналы, поэтому оплаченные платежи
+            # добавляются в дневную выручку здесь
+            paid = list(payments.select_for_update())
+            Payment.objects.filter(pk__in=[payment.pk for payment in paid]).update(
+                status=payment_status
+            )
+            for payment in paid:
+                payment.status = payment_status
+                record_payment(payment)
+    cache.delete_many(
+        [get_stripe_session_cache_key(session_id) for session_id in statuses]
+    )
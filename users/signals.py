@@ -0,0 +1,92 @@
+from django.contrib.auth.models import Group
+from django.db.models.signals import (m2m_changed, post_delete, post_save,
+                                      pre_delete, pre_save)
+from django.dispatch import receiver
+
+from lms.models import Course, Lesson
+from users.authentication import invalidate_cached_users
+from users.models import Payment, User
+from users.permissions import invalidate_moderator_cache
+from users.revenue import discard_payment, fold_deleted, record_payment
+
+# Поля платежа, от которых зависит его строка в дневной выручке
+REVENUE_FIELDS = {
+    "status",
+    "amount",
+    "payment_date",
+    "course",
+    "lesson",
+    "payment_type",
+}
+
+
+@receiver(m2m_changed, sender=User.groups.through)
+def reset_moderator_cache_on_membership_change(
+    sender, instance, action, reverse, pk_set, **kwargs
+):
+    """Сбрасывает кэш ролей при изменении состава групп пользователя."""
+    if reverse and action == "pre_clear":
+        # После очистки группы ее участников уже не получить
+        instance._cleared_user_ids = list(
+            instance.user_set.values_list("pk", flat=True)
+        )
+    elif action in ("post_add", "post_remove", "post_clear"):
+        if not reverse:
+            invalidate_moderator_cache([instance.pk])
+        elif action == "post_clear":
+            invalidate_moderator_cache(instance.__dict__.pop("_cleared_user_ids", []))
+        else:
+            invalidate_moderator_cache(pk_set)
+
+
+@receiver(post_save, sender=Group)
+@receiver(pre_delete, sender=Group)
+def reset_moderator_cache_on_group_change(sender, instance, **kwargs):
+    """Сбрасывает кэш ролей участников переименованной или удаленной группы."""
+    invalidate_moderator_cache(instance.user_set.values_list("pk", flat=True))
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def reset_auth_user_cache(sender, instance, **kwargs):
+    """Сбрасывает кэш аутентификации при изменении или удалении пользователя."""
+    invalidate_cached_users([instance.pk])
+
+
+@receiver(pre_save, sender=Payment)
+def remember_counted_payment(sender, instance, raw, update_fields, **kwargs):
+    """Запоминает, как платеж учтен в дневной выручке до изменения.
+
+    Для нового платежа и сохранения без полей выручки запрос не нужен.
+    """
+    instance._revenue_changed = not raw and (
+        update_fields is None or bool(REVENUE_FIELDS & set(update_fields))
+    )
+    instance._counted_payment = None
+    if instance._revenue_changed and not instance._state.adding:
+        instance._counted_payment = Payment.objects.filter(
+            pk=instance.pk, status=Payment.STATUS_PAID
+        ).first()
+
+
+@receiver(post_save, sender=Payment)
+def update_daily_revenue(sender, instance, **kwargs):
+    """Переносит изменения оплаченных платежей в дневную выручку."""
+    if not instance.__dict__.pop("_revenue_changed", False):
+        return
+    counted = instance.__dict__.pop("_counted_payment", None)
+    if counted is not None:
+        discard_payment(counted)
+    record_payment(instance)
+
+
+@receiver(post_delete, sender=Payment)
+def remove_payment_from_daily_revenue(sender, instance, **kwargs):
+    discard_payment(instance)
+
+
+@receiver(post_delete, sender=Course)
+@receiver(post_delete, sender=Lesson)
+def fold_deleted_product_revenue(sender, instance, **kwargs):
+    """Переносит выручку удаленного курса или урока в строки без него."""
+    fold_deleted(sender._meta.model_name, instance.pk)
@@ -0,0 +1,50 @@
+from datetime import timedelta
+
+import requests
+import stripe
+from celery import shared_task
+from django.utils import timezone
+
+from users.models import Payment
+from users.revenue import rebuild_daily_revenue
+from users.services import (convert_rub_to_dollars, create_stripe_session,
+                            refresh_currency_rate)
+
+# Сверяются сегодняшний и вчерашний дни, куда еще попадают новые платежи
+REVENUE_RECONCILE_DAYS = 2
+
+
+@shared_task
+def refresh_currency_rates():
+    """Обновляет курс рубля к доллару, используемый при создании платежей"""
+    refresh_currency_rate("RUB")
+
+
+@shared_task
+def reconcile_daily_revenue(days=REVENUE_RECONCILE_DAYS):
+    """Сверяет дневную выручку за последние дни с таблицей платежей"""
+    since = timezone.localdate() - timedelta(days=days - 1)
+    return rebuild_daily_revenue(since)
+
+
+@shared_task(bind=True, max_retries=3, default_retry_delay=10)
+def create_payment_link(self, payment_id):
+    """Создает сессию stripe для платежа и сохраняет ссылку на оплату"""
+    payment = Payment.objects.select_related("course", "lesson").get(pk=payment_id)
+    product = payment.course or payment.lesson
+    product_name = product.name if product else "Stripe product"
+    try:
+        amount_in_dollars = convert_rub_to_dollars(payment.amount)
+        session_id, payment_link = create_stripe_session(
+            amount_in_dollars, product_name
+        )
+    except (stripe.StripeError, requests.RequestException) as exc:
+        if self.request.retries < self.max_retries:
+            raise self.retry(exc=exc)
+        payment.status = Payment.STATUS_FAILED
+        payment.save(update_fields=["status"])
+        return
+    payment.session_id = session_id
+    payment.link = payment_link
+    payment.status = Payment.STATUS_OPEN
+    payment.save(update_fields=["session_id", "link", "status"])
@@ -1,3 +1,878 @@
-from django.test import TestCase
+import csv
+import hashlib
+import hmac
+import json
+import time
+from datetime import timedelta
+from decimal import Decimal
+from io import StringIO
+from unittest.mock import Mock, patch
 
-# Create your tests here.
+import requests
+import stripe
+from django.contrib.auth.models import Group
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.reverse import reverse
+from rest_framework.test import APITestCase
+from rest_framework_simplejwt.tokens import AccessToken
+
+from lms.models import Course, Lesson
+from lms.tasks import deactivate_inactive_users
+from users import services
+from users.authentication import get_user_cache_key
+from users.exports import EXPORT_FIELDS, export_payments
+from users.models import CurrencyRate, DailyRevenue, Payment, User
+from users.permissions import MODERATORS_GROUP, user_is_moder
+from users.revenue import rebuild_daily_revenue, record_payment
+from users.tasks import (create_payment_link, reconcile_daily_revenue,
+                         refresh_currency_rates)
+from users.views import PaymentListAPIView
+
+
+class UserListTestCase(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create(email="aaa@sky.pro", phone="123")
+        User.objects.bulk_create(
+            User(email=f"user{i:02}@sky.pro", city="Moscow") for i in range(20)
+        )
+        Payment.objects.create(
+            user=self.user, amount=Decimal("100.00"), payment_type="cash"
+        )
+        self.client.force_authenticate(user=self.user)
+
+    def test_user_list_is_paginated(self):
+        url = reverse("users:user-list")
+        response = self.client.get(url)
+        data = response.json()
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(data["count"], 21)
+        self.assertEqual(len(data["results"]), 5)
+        self.assertIsNotNone(data["next"])
+
+    def test_user_list_own_profile(self):
+        url = reverse("users:user-list")
+        response = self.client.get(url)
+        own, other = response.json()["results"][:2]
+        self.assertEqual(own["email"], self.user.email)
+        self.assertEqual(len(own["payments"]), 1)
+        self.assertEqual(set(other), {"id", "email", "phone", "city", "avatar"})
+
+    def test_user_list_query_count_is_constant(self):
+        url = reverse("users:user-list")
+        query_counts = []
+        for page_size in (1, 10):
+            with CaptureQueriesContext(connection) as context:
+                response = self.client.get(url, {"page_size": page_size, "page": 2})
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            query_counts.append(len(context.captured_queries))
+        self.assertEqual(query_counts[0], query_counts[1])
+
+    def test_user_list_stream(self):
+        url = reverse("users:user-list")
+        response = self.client.get(url, {"stream": "true"})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response["Content-Type"], "application/x-ndjson")
+        rows = [
+            json.loads(line)
+            for line in b"".join(response.streaming_content).decode().splitlines()
+        ]
+        self.assertEqual(len(rows), 21)
+        self.assertEqual(rows[0]["email"], self.user.email)
+        self.assertIn("payments", rows[0])
+        self.assertNotIn("payments", rows[1])
+
+
+class PaymentListTestCase(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create(email="payer@sky.pro")
+        for amount in range(1, 9):
+            Payment.objects.create(
+                user=self.user, amount=Decimal(amount), payment_type="transfer"
+            )
+        self.client.force_authenticate(user=self.user)
+
+    def test_payment_list_is_paginated(self):
+        url = reverse("users:payments-list")
+        data = self.client.get(url).json()
+        self.assertEqual(data["count"], 8)
+        self.assertEqual(len(data["results"]), 5)
+
+    def test_payment_list_cursor_pagination(self):
+        url = reverse("users:payments-list")
+        response = self.client.get(
+            url, {"pagination": "cursor", "ordering": "-payment_date"}
+        )
+        amounts = []
+        while True:
+            data = response.json()
+            amounts.extend(Decimal(payment["amount"]) for payment in data["results"])
+            if not data["next"]:
+                break
+            response = self.client.get(data["next"])
+        self.assertEqual(amounts, [Decimal(amount) for amount in range(8, 0, -1)])
+
+
+class PaymentExportTestCase(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create(email="finance@sky.pro", is_staff=True)
+        self.course = Course.objects.create(name="Course", description="test")
+        self.now = timezone.now()
+        for amount in range(1, 7):
+            payment = Payment.objects.create(
+                user=self.user,
+                amount=Decimal(amount),
+                payment_type="cash" if amount % 2 else "transfer",
+                course=self.course if amount <= 3 else None,
+            )
+            Payment.objects.filter(pk=payment.pk).update(
+                payment_date=self.now - timedelta(days=amount)
+            )
+        self.client.force_authenticate(user=self.user)
+        self.url = reverse("users:payments-export")
+
+    def export(self, params):
+        response = self.client.get(self.url, params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return b"".join(response.streaming_content).decode()
+
+    def test_export_ndjson(self):
+        rows = [json.loads(line) for line in self.export({}).splitlines()]
+        self.assertEqual(len(rows), 6)
+        self.assertEqual(rows[0]["amount"], "6.00")
+        self.assertEqual(set(rows[0]), set(EXPORT_FIELDS))
+
+    def test_export_csv_with_filters(self):
+        content = self.export(
+            {
+                "export_format": "csv",
+                "course": self.course.pk,
+                "payment_type": "cash",
+                "date_from": (self.now - timedelta(days=2, hours=1)).isoformat(),
+            }
+        )
+        rows = list(csv.DictReader(StringIO(content)))
+        self.assertEqual([row["amount"] for row in rows], ["1.00"])
+
+    def test_export_unknown_format(self):
+        response = self.client.get(self.url, {"export_format": "xml"})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_export_is_staff_only(self):
+        self.client.force_authenticate(user=User.objects.create(email="u@sky.pro"))
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_export_reads_rows_in_chunks(self):
+        queryset = Payment.objects.all()
+        chunks = list(export_payments(queryset, "ndjson", chunk_size=4))
+        self.assertEqual([chunk.count("\n") for chunk in chunks], [4, 2])
+
+    def test_export_payments_command(self):
+        stdout = StringIO()
+        with patch("sys.stdout", stdout):
+            call_command("export_payments", format="csv", payment_type="transfer")
+        rows = list(csv.DictReader(StringIO(stdout.getvalue())))
+        self.assertEqual(len(rows), 3)
+        self.assertTrue(all(row["payment_type"] == "transfer" for row in rows))
+
+    def test_export_payments_command_invalid_filter(self):
+        with self.assertRaises(CommandError):
+            call_command("export_payments", date_from="yesterday")
+
+
+class DailyRevenueTestCase(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create(email="finance@sky.pro", is_staff=True)
+        self.course = Course.objects.create(name="Course", description="test")
+        self.client.force_authenticate(user=self.user)
+
+    def create_payment(
+        self, amount, payment_type="cash", course=None, status=Payment.STATUS_PAID
+    ):
+        return Payment.objects.create(
+            user=self.user,
+            amount=Decimal(amount),
+            payment_type=payment_type,
+            course=course,
+            status=status,
+        )
+
+    def rollup(self):
+        return {
+            (row.course_id, row.payment_type): (row.payments_count, row.amount_total)
+            for row in DailyRevenue.objects.all()
+        }
+
+    def test_payment_creation_updates_rollup(self):
+        self.create_payment("100.50", course=self.course)
+        self.create_payment("50", course=self.course)
+        self.create_payment("10")
+        self.create_payment("5")
+        self.create_payment("7", payment_type="transfer")
+
+        self.assertEqual(
+            self.rollup(),
+            {
+                (self.course.pk, "cash"): (2, Decimal("150.50")),
+                (None, "cash"): (2, Decimal("15")),
+                (None, "transfer"): (1, Decimal("7")),
+            },
+        )
+
+    def test_only_paid_payments_are_counted(self):
+        self.create_payment("10", status=Payment.STATUS_OPEN)
+        payment = self.create_payment(
+            "20", payment_type="stripe", status=Payment.STATUS_OPEN
+        )
+        Payment.objects.filter(pk=payment.pk).update(session_id="cs_paid")
+        self.create_payment("30", status=Payment.STATUS_EXPIRED)
+        self.assertEqual(self.rollup(), {})
+
+        services.update_payment_statuses({"cs_paid": Payment.STATUS_PAID})
+        self.assertEqual(self.rollup(), {(None, "stripe"): (1, Decimal("20"))})
+        # Повторное событие об оплате не учитывает платеж второй раз
+        services.update_payment_statuses({"cs_paid": Payment.STATUS_PAID})
+        self.assertEqual(self.rollup(), {(None, "stripe"): (1, Decimal("20"))})
+
+    def test_changed_and_deleted_payments_are_discounted(self):
+        payment = self.create_payment("100", course=self.course)
+        self.create_payment("10", course=self.course)
+        payment.amount = Decimal("70")
+        payment.save()
+        self.assertEqual(self.rollup(), {(self.course.pk, "cash"): (2, Decimal("80"))})
+
+        payment.status = Payment.STATUS_FAILED
+        payment.save(update_fields=["status"])
+        self.assertEqual(self.rollup(), {(self.course.pk, "cash"): (1, Decimal("10"))})
+
+        # Платежи удаляются вместе с пользователем
+        self.user.delete()
+        self.assertEqual(self.rollup(), {})
+
+    def test_deleted_course_revenue_moves_to_unassigned(self):
+        self.create_payment("100", course=self.course)
+        self.create_payment("10")
+        self.course.delete()
+        self.assertEqual(self.rollup(), {(None, "cash"): (2, Decimal("110"))})
+
+        rebuild_daily_revenue()
+        self.assertEqual(self.rollup(), {(None, "cash"): (2, Decimal("110"))})
+
+    def test_reconcile_fixes_missed_payments(self):
+        self.create_payment("10")
+        old_payment = self.create_payment("20")
+        Payment.objects.filter(pk=old_payment.pk).update(
+            payment_date=timezone.now() - timedelta(days=10)
+        )
+        # Платежи, созданные в обход сигналов, и испорченная строка выручки
+        Payment.objects.bulk_create(
+            [
+                Payment(
+                    user=self.user,
+                    amount=Decimal(30),
+                    payment_type="cash",
+                    status=Payment.STATUS_PAID,
+                )
+            ]
+        )
+        DailyRevenue.objects.update(payments_count=99)
+
+        reconcile_daily_revenue()
+
+        today = DailyRevenue.objects.get(day=timezone.localdate())
+        self.assertEqual(today.payments_count, 2)
+        self.assertEqual(today.amount_total, Decimal("40"))
+        # Дни за пределами окна сверки не пересчитываются
+        self.assertFalse(
+            DailyRevenue.objects.exclude(day=timezone.localdate()).exists()
+        )
+
+        rebuild_daily_revenue()
+        self.assertEqual(
+            sorted(DailyRevenue.objects.values_list("payments_count", flat=True)),
+            [1, 2],
+        )
+
+    def test_rebuild_matches_incremental_rollup(self):
+        with timezone.override("Asia/Vladivostok"):
+            payment = self.create_payment("10", course=self.course)
+            # Время, когда в UTC и во Владивостоке разные даты
+            Payment.objects.filter(pk=payment.pk).update(
+                payment_date=timezone.now().replace(hour=20, minute=0)
+            )
+            DailyRevenue.objects.all().delete()
+            record_payment(Payment.objects.get(pk=payment.pk))
+            recorded = list(DailyRevenue.objects.values())
+
+            rebuild_daily_revenue()
+            rebuilt = list(DailyRevenue.objects.values())
+        self.assertEqual(len(rebuilt), 1)
+        recorded[0].pop("id")
+        rebuilt[0].pop("id")
+        self.assertEqual(rebuilt, recorded)
+
+    def test_revenue_report(self):
+        self.create_payment("100", course=self.course)
+        self.create_payment("10", payment_type="transfer")
+        url = reverse("users:payments-revenue")
+        with self.assertNumQueries(1):
+            response = self.client.get(url, {"course": self.course.pk})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data), 1)
+        self.assertEqual(response.data[0]["amount_total"], "100.00")
+        self.assertEqual(response.data[0]["payments_count"], 1)
+
+        response = self.client.get(
+            url, {"day_from": timezone.localdate() + timedelta(days=1)}
+        )
+        self.assertEqual(response.data, [])
+
+    def test_revenue_report_is_staff_only(self):
+        self.client.force_authenticate(user=User.objects.create(email="u@sky.pro"))
+        response = self.client.get(reverse("users:payments-revenue"))
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+
+@patch("users.permissions.SHARED_CACHE", True)
+class ModeratorRoleTestCase(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.moders = Group.objects.create(name=MODERATORS_GROUP)
+        self.owner = User.objects.create(email="owner@sky.pro")
+        self.user = User.objects.create(email="moder@sky.pro")
+        self.course = Course.objects.create(
+            name="Course", description="test course", owner=self.owner
+        )
+        self.client.force_authenticate(user=self.user)
+
+    def retrieve_course(self):
+        url = reverse("lms:courses-detail", kwargs={"pk": self.course.id})
+        return self.client.get(url)
+
+    def test_role_is_cached(self):
+        self.assertFalse(user_is_moder(self.user))
+        with self.assertNumQueries(0):
+            self.assertFalse(user_is_moder(self.user))
+
+    def test_role_is_not_cached_without_shared_cache(self):
+        with patch("users.permissions.SHARED_CACHE", False):
+            self.assertFalse(user_is_moder(self.user))
+            with self.assertNumQueries(1):
+                self.assertFalse(user_is_moder(self.user))
+
+    def test_role_is_resolved_once_per_request(self):
+        self.user.groups.add(self.moders)
+        with CaptureQueriesContext(connection) as context:
+            response = self.retrieve_course()
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        group_queries = [
+            query for query in context.captured_queries if "auth_group" in query["sql"]
+        ]
+        self.assertEqual(len(group_queries), 1)
+
+    def test_cache_is_reset_on_membership_change(self):
+        self.assertEqual(self.retrieve_course().status_code, status.HTTP_403_FORBIDDEN)
+        self.user.groups.add(self.moders)
+        self.assertEqual(self.retrieve_course().status_code, status.HTTP_200_OK)
+        self.moders.user_set.remove(self.user)
+        self.assertEqual(self.retrieve_course().status_code, status.HTTP_403_FORBIDDEN)
+        self.moders.user_set.add(self.user)
+        self.assertTrue(user_is_moder(self.user))
+        self.moders.user_set.clear()
+        self.assertFalse(user_is_moder(self.user))
+
+    def test_cache_is_reset_on_group_delete(self):
+        self.user.groups.add(self.moders)
+        self.assertTrue(user_is_moder(self.user))
+        self.moders.delete()
+        self.assertFalse(user_is_moder(self.user))
+
+
+@patch("users.authentication.SHARED_CACHE", True)
+class CachedJWTAuthenticationTestCase(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create(email="jwt@sky.pro", is_active=True)
+        token = AccessToken.for_user(self.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {token}")
+        self.url = reverse("lms:lesson-list")
+
+    def count_user_queries(self):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(self.url)
+        user_queries = [
+            query
+            for query in context.captured_queries
+            if 'FROM "users_user"' in query["sql"]
+        ]
+        return response.status_code, len(user_queries)
+
+    def test_user_is_loaded_once(self):
+        self.assertEqual(self.count_user_queries(), (status.HTTP_200_OK, 1))
+        self.assertEqual(self.count_user_queries(), (status.HTTP_200_OK, 0))
+
+    def test_cache_is_reset_on_deactivation(self):
+        self.count_user_queries()
+        self.user.is_active = False
+        self.user.save()
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_cache_is_reset_by_deactivate_inactive_users(self):
+        self.count_user_queries()
+        User.objects.filter(pk=self.user.pk).update(
+            last_login=timezone.now() - timedelta(days=31)
+        )
+        deactivate_inactive_users()
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_password_hash_is_not_cached(self):
+        self.user.set_password("secret")
+        self.user.save()
+        self.count_user_queries()
+        cached_user = cache.get(get_user_cache_key(self.user.pk))
+        self.assertNotIn("password", cached_user.__dict__)
+        self.assertTrue(cached_user.check_password("secret"))
+
+    def test_user_is_not_cached_without_shared_cache(self):
+        with patch("users.authentication.SHARED_CACHE", False):
+            self.assertEqual(self.count_user_queries(), (status.HTTP_200_OK, 1))
+            self.assertEqual(self.count_user_queries(), (status.HTTP_200_OK, 1))
+
+
+class CurrencyRateTestCase(APITestCase):
+    def setUp(self):
+        services._currency_rates.clear()
+
+    def mock_response(self, value):
+        return Mock(
+            status_code=status.HTTP_200_OK,
+            json=Mock(return_value={"data": {"RUB": {"value": value}}}),
+            raise_for_status=Mock(),
+        )
+
+    @patch.object(services.currency_session, "get")
+    def test_conversion_uses_stored_rate(self, get):
+        CurrencyRate.objects.create(currency="RUB", value=Decimal("100"))
+        self.assertEqual(services.convert_rub_to_dollars(Decimal("1500")), 1500)
+        with self.assertNumQueries(0):
+            self.assertEqual(services.convert_rub_to_dollars(Decimal("50")), 50)
+        get.assert_not_called()
+
+    @patch.object(services.currency_session, "get")
+    def test_rate_is_fetched_when_missing(self, get):
+        get.return_value = self.mock_response(80)
+        self.assertEqual(services.convert_rub_to_dollars(Decimal("800")), 1000)
+        self.assertEqual(CurrencyRate.objects.get(currency="RUB").value, 80)
+        self.assertEqual(get.call_args.kwargs["timeout"], services.CURRENCY_API_TIMEOUT)
+
+    @patch.object(services.currency_session, "get")
+    def test_refresh_task_updates_rate(self, get):
+        CurrencyRate.objects.create(currency="RUB", value=Decimal("100"))
+        get.return_value = self.mock_response(90)
+        refresh_currency_rates()
+        self.assertEqual(CurrencyRate.objects.get(currency="RUB").value, 90)
+        self.assertEqual(services.convert_rub_to_dollars(Decimal("900")), 1000)
+
+    @patch.object(services.currency_session, "get")
+    def test_failed_refresh_keeps_last_known_rate(self, get):
+        CurrencyRate.objects.create(currency="RUB", value=Decimal("100"))
+        get.side_effect = requests.ConnectionError
+        with self.assertRaises(requests.ConnectionError):
+            refresh_currency_rates()
+        self.assertEqual(services.convert_rub_to_dollars(Decimal("100")), 100)
+
+
+class FakeStripeClient(stripe.HTTPClient):
+    """Локальная замена API stripe, запоминающая все запросы."""
+
+    name = "fake"
+
+    def __init__(self):
+        super().__init__()
+        self.requests = []
+        self.session = {
+            "id": "cs_test_1",
+            "object": "checkout.session",
+            "url": "https://checkout.stripe.com/c/pay/cs_test_1",
+            "status": "open",
+            "payment_status": "unpaid",
+        }
+        self.status_code = status.HTTP_200_OK
+
+    def request(self, method, url, headers, post_data=None, **kwargs):
+        self.requests.append((method, url, post_data))
+        if self.status_code != status.HTTP_200_OK:
+            error = {"error": {"type": "invalid_request_error", "message": "No such"}}
+            return json.dumps(error), self.status_code, {}
+        return json.dumps(self.session), status.HTTP_200_OK, {}
+
+    def close(self):
+        pass
+
+
+class PaymentCreateTestCase(APITestCase):
+    def setUp(self):
+        services._currency_rates.clear()
+        CurrencyRate.objects.create(currency="RUB", value=Decimal("100"))
+        self.user = User.objects.create(email="buyer@sky.pro")
+        self.course = Course.objects.create(name="Course", description="test")
+        self.stripe_client = FakeStripeClient()
+        patcher = patch.multiple(
+            stripe, default_http_client=self.stripe_client, api_key="sk_test_fake"
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.client.force_authenticate(user=self.user)
+
+    def create_payment(self):
+        return Payment.objects.create(
+            user=self.user, course=self.course, amount=Decimal("1500.00")
+        )
+
+    @patch("users.views.create_payment_link.delay")
+    def test_payment_create_is_accepted(self, delay):
+        url = reverse("users:payments-create")
+        data = {
+            "user": self.user.id,
+            "course": self.course.id,
+            "amount": "1500.00",
+            "payment_type": "stripe",
+        }
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(url, data, format="json")
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(response.data["status"], Payment.STATUS_PENDING)
+        self.assertIsNone(response.data["link"])
+        delay.assert_called_once_with(response.data["id"])
+        self.assertEqual(self.stripe_client.requests, [])
+
+    def test_payment_link_task_makes_one_stripe_call(self):
+        payment = self.create_payment()
+        create_payment_link.apply(args=(payment.id,))
+        self.assertEqual(len(self.stripe_client.requests), 1)
+        method, url, post_data = self.stripe_client.requests[0]
+        self.assertEqual(method, "post")
+        self.assertTrue(url.endswith("/v1/checkout/sessions"))
+        self.assertIn("[unit_amount]=1500", post_data)
+        self.assertIn("[product_data][name]=Course", post_data)
+        payment.refresh_from_db()
+        self.assertEqual(payment.status, Payment.STATUS_OPEN)
+        self.assertEqual(payment.session_id, "cs_test_1")
+        self.assertEqual(payment.link, "https://checkout.stripe.com/c/pay/cs_test_1")
+
+    def test_payment_link_task_marks_failure(self):
+        payment = self.create_payment()
+        with patch.object(
+            self.stripe_client,
+            "request",
+            side_effect=stripe.APIConnectionError("Stripe is unavailable"),
+        ):
+            create_payment_link.apply(args=(payment.id,))
+        payment.refresh_from_db()
+        self.assertEqual(payment.status, Payment.STATUS_FAILED)
+
+    def test_payment_status(self):
+        payment = self.create_payment()
+        url = reverse("users:payments-status", kwargs={"pk": payment.id})
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            response.data,
+            {
+                "id": payment.id,
+                "status": Payment.STATUS_PENDING,
+                "session_id": None,
+                "link": None,
+            },
+        )
+
+    def test_payment_status_of_other_user(self):
+        payment = self.create_payment()
+        self.client.force_authenticate(user=User.objects.create(email="other@sky.pro"))
+        url = reverse("users:payments-status", kwargs={"pk": payment.id})
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class StripeWebhookTestCase(APITestCase):
+    webhook_secret = "whsec_test"
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create(email="buyer@sky.pro")
+        self.payment = Payment.objects.create(
+            user=self.user,
+            amount=Decimal("1500.00"),
+            session_id="cs_test_1",
+            link="https://checkout.stripe.com/c/pay/cs_test_1",
+            status=Payment.STATUS_OPEN,
+        )
+        patcher = patch.object(services, "STRIPE_WEBHOOK_SECRET", self.webhook_secret)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.stripe_client = FakeStripeClient()
+        patcher = patch.multiple(
+            stripe, default_http_client=self.stripe_client, api_key="sk_test_fake"
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def send_event(self, event_type, session, secret=None):
+        """Отправляет событие так же, как это делает stripe."""
+        payload = json.dumps(
+            {
+                "id": "evt_test",
+                "object": "event",
+                "type": event_type,
+                "data": {"object": session},
+            }
+        )
+        timestamp = int(time.time())
+        signature = hmac.new(
+            (secret or self.webhook_secret).encode(),
+            f"{timestamp}.{payload}".encode(),
+            hashlib.sha256,
+        ).hexdigest()
+        return self.client.post(
+            reverse("users:stripe_webhook"),
+            payload,
+            content_type="application/json",
+            HTTP_STRIPE_SIGNATURE=f"t={timestamp},v1={signature}",
+        )
+
+    def test_completed_session_marks_payment_paid(self):
+        response = self.send_event(
+            "checkout.session.completed",
+            {"id": "cs_test_1", "object": "checkout.session", "payment_status": "paid"},
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.payment.refresh_from_db()
+        self.assertEqual(self.payment.status, Payment.STATUS_PAID)
+
+    def test_paid_payment_does_not_expire(self):
+        self.payment.status = Payment.STATUS_PAID
+        self.payment.save()
+        self.send_event(
+            "checkout.session.expired",
+            {"id": "cs_test_1", "object": "checkout.session"},
+        )
+        self.payment.refresh_from_db()
+        self.assertEqual(self.payment.status, Payment.STATUS_PAID)
+
+    def test_invalid_signature_is_rejected(self):
+        response = self.send_event(
+            "checkout.session.expired",
+            {"id": "cs_test_1", "object": "checkout.session"},
+            secret="whsec_wrong",
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.payment.refresh_from_db()
+        self.assertEqual(self.payment.status, Payment.STATUS_OPEN)
+
+    def test_session_view_answers_from_local_payment(self):
+        self.send_event(
+            "checkout.session.expired",
+            {"id": "cs_test_1", "object": "checkout.session"},
+        )
+        self.client.force_authenticate(user=self.user)
+        url = reverse(
+            "users:retrieve_stripe_session", kwargs={"session_id": "cs_test_1"}
+        )
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            response.data,
+            {
+                "id": "cs_test_1",
+                "status": Payment.STATUS_EXPIRED,
+                "url": "https://checkout.stripe.com/c/pay/cs_test_1",
+            },
+        )
+        self.assertEqual(self.stripe_client.requests, [])
+
+    def get_session(self, session_id="cs_test_1"):
+        self.client.force_authenticate(user=self.user)
+        url = reverse(
+            "users:retrieve_stripe_session", kwargs={"session_id": session_id}
+        )
+        return self.client.get(url)
+
+    def test_session_view_caches_stripe_for_open_payments(self):
+        for _ in range(3):
+            response = self.get_session()
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(self.stripe_client.requests), 1)
+        self.assertEqual(
+            response.data,
+            {
+                "id": "cs_test_1",
+                "status": Payment.STATUS_OPEN,
+                "url": "https://checkout.stripe.com/c/pay/cs_test_1",
+            },
+        )
+
+    def test_session_view_saves_status_from_stripe(self):
+        # Сессия создана до вебхука, событие о ней уже не придет
+        self.stripe_client.session.update(status="complete", payment_status="paid")
+        response = self.get_session()
+        self.assertEqual(response.data["status"], Payment.STATUS_PAID)
+        self.payment.refresh_from_db()
+        self.assertEqual(self.payment.status, Payment.STATUS_PAID)
+        self.get_session()
+        self.assertEqual(len(self.stripe_client.requests), 1)
+
+    def test_session_view_answers_locally_on_stripe_error(self):
+        self.stripe_client.status_code = status.HTTP_404_NOT_FOUND
+        response = self.get_session()
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["status"], Payment.STATUS_OPEN)
+
+    def test_session_view_rejects_unknown_sessions(self):
+        response = self.get_session("cs_other")
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEqual(self.stripe_client.requests, [])
+
+    def test_session_view_hides_other_users_payments(self):
+        other_user = User.objects.create(email="other@sky.pro")
+        self.client.force_authenticate(user=other_user)
+        url = reverse(
+            "users:retrieve_stripe_session", kwargs={"session_id": "cs_test_1"}
+        )
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEqual(self.stripe_client.requests, [])
+
+    @patch("lms.instrumentation.REQUEST_METRICS_SAMPLE_RATE", 1)
+    def test_session_view_reports_stripe_time(self):
+        with self.assertLogs("lms.instrumentation") as logs:
+            response = self.get_session()
+        self.assertIn("stripe;dur=", response.headers["Server-Timing"])
+        record = json.loads(logs.records[0].getMessage())
+        self.assertEqual(record["external"]["stripe"]["calls"], 1)
+
+    def test_update_payment_statuses_groups_updates(self):
+        Payment.objects.create(
+            user=self.user, amount=Decimal("10"), session_id="cs_test_2"
+        )
+        Payment.objects.create(
+            user=self.user, amount=Decimal("10"), session_id="cs_test_3"
+        )
+        with CaptureQueriesContext(connection) as context:
+            services.update_payment_statuses(
+                {
+                    "cs_test_1": Payment.STATUS_PAID,
+                    "cs_test_2": Payment.STATUS_PAID,
+                    "cs_test_3": Payment.STATUS_EXPIRED,
+                }
+            )
+        updates = [
+            query
+            for query in context.captured_queries
+            if query["sql"].startswith("UPDATE")
+        ]
+        self.assertEqual(len(updates), 2)
+        self.assertEqual(
+            dict(Payment.objects.values_list("session_id", "status")),
+            {
+                "cs_test_1": Payment.STATUS_PAID,
+                "cs_test_2": Payment.STATUS_PAID,
+                "cs_test_3": Payment.STATUS_EXPIRED,
+            },
+        )
+
+
+class QueryPlanTestCase(APITestCase):
+    """Проверяет, что горячие запросы к платежам и пользователям идут по индексам."""
+
+    @classmethod
+    def setUpTestData(cls):
+        now = timezone.now()
+        users = User.objects.bulk_create(
+            User(
+                email=f"user{i}@sky.pro",
+                # Давно не заходил только каждый сотый пользователь
+                last_login=now - timedelta(days=40 if i % 100 == 0 else i % 29),
+            )
+            for i in range(5000)
+        )
+        courses = Course.objects.bulk_create(
+            Course(name=f"Course {i}", description="test") for i in range(100)
+        )
+        lessons = Lesson.objects.bulk_create(
+            Lesson(name=f"Lesson {i}", course=courses[i % 100], description="test")
+            for i in range(200)
+        )
+        with connection.cursor() as cursor:
+            # 30 000 платежей по курсам и урокам с разными датами и способами оплаты
+            cursor.execute(
+                """
+                INSERT INTO users_payment (
+                    user_id, course_id, lesson_id, amount, payment_type,
+                    payment_date, session_id, status
+                )
+                SELECT
+                    (%(users)s::bigint[])[1 + i %% 5000],
+                    CASE WHEN i %% 2 = 1 THEN (%(courses)s::bigint[])[1 + i %% 100] END,
+                    CASE WHEN i %% 2 = 0 THEN (%(lessons)s::bigint[])[1 + i %% 200] END,
+                    100,
+                    (ARRAY['cash', 'transfer', 'stripe'])[1 + i %% 3],
+                    now() - i * interval '1 minute',
+                    CASE WHEN i %% 5 = 0 THEN 'cs_' || i END,
+                    'pending'
+                FROM generate_series(0, 29999) AS i
+                """,
+                {
+                    "users": [user.pk for user in users],
+                    "courses": [course.pk for course in courses],
+                    "lessons": [lesson.pk for lesson in lessons],
+                },
+            )
+            cursor.execute("ANALYZE users_user")
+            cursor.execute("ANALYZE users_payment")
+        cls.course = courses[1]
+        cls.lesson = lessons[2]
+        cls.month_ago = now - timedelta(days=30)
+
+    def assertIndexScan(self, queryset, table):
+        plan = queryset.explain()
+        self.assertNotIn(f"Seq Scan on {table}", plan)
+        self.assertIn("Index", plan)
+
+    def get_payment_page(self, **filters):
+        # Так же, как PaymentListAPIView: фильтр, сортировка и одна страница
+        queryset = PaymentListAPIView.queryset.filter(**filters)
+        return queryset.order_by("payment_date")[:5]
+
+    def test_payments_by_course(self):
+        self.assertIndexScan(self.get_payment_page(course=self.course), "users_payment")
+
+    def test_payments_by_lesson(self):
+        self.assertIndexScan(self.get_payment_page(lesson=self.lesson), "users_payment")
+
+    def test_payments_by_payment_type(self):
+        self.assertIndexScan(
+            self.get_payment_page(payment_type="cash"), "users_payment"
+        )
+
+    def test_payments_by_date(self):
+        self.assertIndexScan(self.get_payment_page(), "users_payment")
+
+    def test_payment_by_session_id(self):
+        queryset = Payment.objects.filter(session_id="cs_100")
+        self.assertIndexScan(queryset, "users_payment")
+
+    def test_inactive_users(self):
+        # Запрос из lms.tasks.deactivate_inactive_users
+        queryset = (
+            User.objects.filter(last_login__lte=self.month_ago, is_active=True)
+            .order_by()
+            .values_list("pk", flat=True)
+        )
+        self.assertIndexScan(queryset, "users_user")
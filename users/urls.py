@@ -4,10 +4,12 @@ from rest_framework_simplejwt.views import (TokenObtainPairView,
                                             TokenRefreshView)
 
 from users.apps import UsersConfig
-from users.views import (PaymentCreateAPIView, PaymentListAPIView,
-                         UserCreateAPIView, UserDestroyAPIView,
-                         UserListAPIView, UserRetrieveAPIView,
-                         UserUpdateAPIView, retrieve_stripe_session_view)
+from users.views import (DailyRevenueListAPIView, PaymentCreateAPIView,
+                         PaymentExportAPIView, PaymentListAPIView,
+                         PaymentStatusAPIView, UserCreateAPIView,
+                         UserDestroyAPIView, UserListAPIView,
+                         UserRetrieveAPIView, UserUpdateAPIView,
+                         retrieve_stripe_session_view, stripe_webhook_view)
 
 app_name = UsersConfig.name
 
@@ -20,12 +22,22 @@ urlpatterns = [
     path("<int:pk>/delete/", UserDestroyAPIView.as_view(), name="user-delete"),
     # payments
     path("payments/", PaymentListAPIView.as_view(), name="payments-list"),
+    path("payments/export/", PaymentExportAPIView.as_view(), name="payments-export"),
+    path(
+        "payments/revenue/", DailyRevenueListAPIView.as_view(), name="payments-revenue"
+    ),
     path("payments/create", PaymentCreateAPIView.as_view(), name="payments-create"),
+    path(
+        "payments/<int:pk>/status/",
+        PaymentStatusAPIView.as_view(),
+        name="payments-status",
+    ),
     path(
         "stripe_session/<str:session_id>/",
         retrieve_stripe_session_view,
         name="retrieve_stripe_session",
     ),
+    path("stripe_webhook/", stripe_webhook_view, name="stripe_webhook"),
     # token
     path(
         "login/",
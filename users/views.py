@@ -1,21 +1,36 @@
+import json
+
+import stripe
+from django.db import transaction
+from django.http import StreamingHttpResponse
 from django_filters.rest_framework import DjangoFilterBackend
-from drf_spectacular.utils import extend_schema
+from drf_spectacular.types import OpenApiTypes
+from drf_spectacular.utils import OpenApiParameter, extend_schema
 from rest_framework import status
-from rest_framework.decorators import api_view
+from rest_framework.decorators import (api_view, authentication_classes,
+                                       permission_classes)
+from rest_framework.exceptions import ValidationError
 from rest_framework.filters import OrderingFilter
 from rest_framework.generics import (CreateAPIView, DestroyAPIView,
-                                     ListAPIView, RetrieveAPIView,
-                                     UpdateAPIView)
-from rest_framework.permissions import AllowAny, IsAuthenticated
+                                     GenericAPIView, ListAPIView,
+                                     RetrieveAPIView, UpdateAPIView)
+from rest_framework.permissions import AllowAny, IsAdminUser, IsAuthenticated
 from rest_framework.response import Response
+from rest_framework.utils.encoders import JSONEncoder
 
-from users.serializers import (PaymentSerializer, UserPublicInfoSerializer,
-                               UserSerializer)
+from lms.db_router import ReplicaReadMixin
+from lms.paginations import CustomPagination, SwitchablePagination
+from users.serializers import (DailyRevenueSerializer, PaymentSerializer,
+                               PaymentStatusSerializer,
+                               UserPublicInfoSerializer, UserSerializer)
 
-from .models import Payment, User
-from .services import (convert_rub_to_dollars, create_stripe_price,
-                       create_stripe_product, create_stripe_session,
-                       retrieve_stripe_session)
+from .exports import EXPORT_FORMATS, export_payments
+from .filters import DailyRevenueFilter, PaymentFilter
+from .models import DailyRevenue, Payment, User
+from .services import (construct_stripe_event, get_payment_status_from_event,
+                       get_payment_status_from_session,
+                       retrieve_stripe_session, update_payment_statuses)
+from .tasks import create_payment_link
 
 
 @extend_schema(
@@ -39,23 +54,48 @@ class UserCreateAPIView(CreateAPIView):
     tags=["Users"],
     summary="Получение списка всех пользователей",
 )
-class UserListAPIView(ListAPIView):
-    """Выводит список всех пользователей."""
+class UserListAPIView(ReplicaReadMixin, ListAPIView):
+    """Выводит список всех пользователей.
 
-    queryset = User.objects.all()
+    Список отдается постранично, а с параметром ``stream=true`` передается
+    потоком в формате NDJSON без загрузки всей таблицы в память.
+    """
+
+    queryset = User.objects.only(*UserPublicInfoSerializer.Meta.fields)
     serializer_class = UserSerializer
     permission_classes = (IsAuthenticated,)
+    pagination_class = CustomPagination
+    stream_chunk_size = 2000
 
     def list(self, request, *args, **kwargs):
-        queryset = self.get_queryset()
-        data = []
-        for user in queryset:
-            if request.user == user:
-                serializer = self.get_serializer(user)
-            else:
-                serializer = UserPublicInfoSerializer(user)
-            data.append(serializer.data)
-        return Response(data)
+        queryset = self.filter_queryset(self.get_queryset())
+        if request.query_params.get("stream") == "true":
+            return self.stream(queryset)
+        page = self.paginate_queryset(queryset)
+        data = [self.serialize_user(user) for user in page]
+        return self.get_paginated_response(data)
+
+    def stream(self, queryset):
+        """Передает пользователей потоком, читая их из БД порциями."""
+        # Поток читается уже после выхода из view, поэтому БД выбирается сейчас
+        queryset = queryset.using(queryset.db)
+        rows = (
+            json.dumps(self.serialize_user(user), cls=JSONEncoder, ensure_ascii=False)
+            + "\n"
+            for user in queryset.iterator(chunk_size=self.stream_chunk_size)
+        )
+        return StreamingHttpResponse(rows, content_type="application/x-ndjson")
+
+    def serialize_user(self, user):
+        """Полные данные отдаются только о самом пользователе, о прочих - публичные."""
+        if user.pk == self.request.user.pk:
+            return self.get_serializer(self.get_own_profile()).data
+        return UserPublicInfoSerializer(user).data
+
+    def get_own_profile(self):
+        return User.objects.prefetch_related(
+            "payments", "groups", "user_permissions"
+        ).get(pk=self.request.user.pk)
 
 
 @extend_schema(
@@ -128,14 +168,75 @@ class UserDestroyAPIView(DestroyAPIView):
     tags=["Payments"],
     summary="Получение списка всех платежей",
 )
-class PaymentListAPIView(ListAPIView):
+class PaymentListAPIView(ReplicaReadMixin, ListAPIView):
     """Выводит список всех платежей пользователя"""
 
     queryset = Payment.objects.all()
     serializer_class = PaymentSerializer
     filter_backends = [DjangoFilterBackend, OrderingFilter]
-    filterset_fields = ("course", "lesson", "payment_type")
+    filterset_class = PaymentFilter
     ordering_fields = ("payment_date",)
+    pagination_class = SwitchablePagination
+    cursor_ordering = "payment_date"
+
+
+@extend_schema(
+    tags=["Payments"],
+    summary="Выгрузка платежей в NDJSON или CSV",
+    parameters=[
+        OpenApiParameter("export_format", enum=sorted(EXPORT_FORMATS)),
+    ],
+    responses={
+        (200, content_type): OpenApiTypes.STR
+        for content_type in EXPORT_FORMATS.values()
+    },
+)
+class PaymentExportAPIView(GenericAPIView):
+    """Выгружает платежи потоком с теми же фильтрами, что и список.
+
+    Формат задается параметром ``export_format``: ndjson (по умолчанию) или csv.
+    Выгрузка содержит платежи всех пользователей и доступна только персоналу.
+    """
+
+    queryset = Payment.objects.all()
+    permission_classes = (IsAdminUser,)
+    filter_backends = [DjangoFilterBackend]
+    filterset_class = PaymentFilter
+    pagination_class = None
+
+    def get(self, request, *args, **kwargs):
+        export_format = request.query_params.get("export_format", "ndjson")
+        if export_format not in EXPORT_FORMATS:
+            raise ValidationError(
+                {"export_format": f"Допустимые форматы: {', '.join(EXPORT_FORMATS)}"}
+            )
+        queryset = self.filter_queryset(self.get_queryset())
+        response = StreamingHttpResponse(
+            export_payments(queryset, export_format),
+            content_type=EXPORT_FORMATS[export_format],
+        )
+        response["Content-Disposition"] = (
+            f'attachment; filename="payments.{export_format}"'
+        )
+        return response
+
+
+@extend_schema(
+    tags=["Payments"],
+    summary="Выручка по дням",
+)
+class DailyRevenueListAPIView(ListAPIView):
+    """Выводит дневную выручку в разрезе курса, урока и способа оплаты.
+
+    Данные берутся из заранее посчитанной таблицы, а не из всех платежей.
+    Выручка всей компании доступна только персоналу.
+    """
+
+    queryset = DailyRevenue.objects.all()
+    permission_classes = (IsAdminUser,)
+    serializer_class = DailyRevenueSerializer
+    filterset_class = DailyRevenueFilter
+    pagination_class = None
 
 
 @extend_schema(
@@ -143,28 +244,95 @@ class PaymentListAPIView(ListAPIView):
     summary="Создание нового платежа",
 )
 class PaymentCreateAPIView(CreateAPIView):
-    """Создает новый платеж."""
+    """Создает новый платеж.
+
+    Ссылка на оплату создается в фоновой задаче, поэтому ответ возвращается
+    сразу со статусом 202, а готовность ссылки проверяется по статусу платежа.
+    """
 
     serializer_class = PaymentSerializer
     queryset = Payment.objects.all()
     permission_classes = (IsAuthenticated,)
 
+    def create(self, request, *args, **kwargs):
+        response = super().create(request, *args, **kwargs)
+        response.status_code = status.HTTP_202_ACCEPTED
+        return response
+
     def perform_create(self, serializer):
         payment = serializer.save(user=self.request.user)
-        amount_in_dollars = convert_rub_to_dollars(payment.amount)
-        product = create_stripe_product()
-        price = create_stripe_price(amount_in_dollars, product)
-        session_id, payment_link = create_stripe_session(price)
-        payment.session_id = session_id
-        payment.link = payment_link
-        payment.save()
+        transaction.on_commit(lambda: create_payment_link.delay(payment.id))
+
+
+@extend_schema(
+    tags=["Payments"],
+    summary="Статус платежа",
+)
+class PaymentStatusAPIView(RetrieveAPIView):
+    """Выводит статус платежа и ссылку на оплату, когда она готова."""
+
+    serializer_class = PaymentStatusSerializer
+    permission_classes = (IsAuthenticated,)
+
+    def get_queryset(self):
+        return Payment.objects.filter(user=self.request.user).only(
+            *PaymentStatusSerializer.Meta.fields
+        )
 
 
 @api_view(["GET"])
 def retrieve_stripe_session_view(request, session_id):
-    """Получает данные о сессии в stripe по её идентификатору и отправляет их в ответе."""
+    """Отправляет данные о сессии в stripe по её идентификатору.
+
+    Выдаются только сессии платежей пользователя. Статус берется из локальной
+    записи, которую обновляет вебхук stripe. Пока платеж не завершен, статус
+    дополнительно сверяется с кэшированным ответом stripe: для сессий,
+    созданных до появления вебхука, событий уже не будет.
+    """
     if request.user.is_authenticated:
-        session = retrieve_stripe_session(session_id)
-        return Response(session)
+        payment = (
+            Payment.objects.filter(session_id=session_id, user=request.user)
+            .only("session_id", "status", "link")
+            .first()
+        )
+        if payment is None:
+            return Response(status=status.HTTP_404_NOT_FOUND)
+        if payment.status not in Payment.FINAL_STATUSES:
+            try:
+                session = retrieve_stripe_session(session_id)
+            except stripe.StripeError:
+                # Stripe недоступен или не знает сессию: отвечаем по локальной записи
+                session = None
+            if session is not None:
+                session_status = get_payment_status_from_session(session)
+                if session_status in Payment.FINAL_STATUSES:
+                    update_payment_statuses({session_id: session_status})
+                    payment.status = session_status
+        return Response(
+            {
+                "id": payment.session_id,
+                "status": payment.status,
+                "url": payment.link,
+            }
+        )
     else:
         return Response(status=status.HTTP_401_UNAUTHORIZED)
+
+
+@api_view(["POST"])
+@authentication_classes([])
+@permission_classes([AllowAny])
+def stripe_webhook_view(request):
+    """Принимает события stripe и сохраняет новые статусы платежей."""
+    try:
+        event = construct_stripe_event(
+            request.body, request.headers.get("Stripe-Signature", "")
+        )
+    except (ValueError, stripe.SignatureVerificationError):
+        return Response(status=status.HTTP_400_BAD_REQUEST)
+    payment_status = get_payment_status_from_event(event)
+    if payment_status:
+        # stripe присылает по одному событию на запрос, и статус сохраняется
+        # сразу, без накопления пакета
+        update_payment_statuses({event["data"]["object"]["id"]: payment_status})
+    return Response(status=status.HTTP_200_OK)